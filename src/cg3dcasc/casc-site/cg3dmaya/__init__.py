@@ -1,4 +1,11 @@
 from .common import *
 from .maya_export import *
 from .maya_import import *
-from . import client
\ No newline at end of file
+from . import client
+from . import channel
+from . import transfer
+from . import progress
+from . import trace
+from . import listener
+from . import maya_port
+from . import set_index
@@ -0,0 +1,426 @@
+"""Non-blocking requests to Maya using asyncio
+
+server.send_and_listen() blocks Cascadeur's UI until Maya answers, and only
+one request can be waiting at a time. Everything here runs on an event loop
+that the host drives from its own idle/timer callback through pump(), so
+nothing blocks and any number of requests can be in flight at once.
+
+    import cg3dmaya.aio as aio
+    import cg3dmaya.common as common
+
+    async def report():
+        #one round trip for both
+        results = await aio.query_maya(common.SET_IDS, common.UP_AXIS)
+        print(results)
+
+    aio.submit(report())
+
+submit() starts a Qt timer that calls pump() on Cascadeur's main thread, the
+same way listener.py runs Maya's commands. Without Qt, call aio.pump() from
+a timer of your own until it's done.
+
+Requests travel over an async connection to Maya's bridge channel (see
+channel.py). When Maya hasn't opened a channel the old one-shot reply socket
+is used, served by an asyncio server instead of a blocking accept().
+
+Maya can also send requests the other way. They run inside pump(), so on
+the host's thread, and answer through client.data_to_maya() like any other
+command. Maya only sends them here when no channel has said it's listening
+for commands (see listener.py), so opening an AsyncChannel doesn't take
+them away from the listener.
+"""
+
+import asyncio
+import itertools
+import struct
+import __main__
+
+from . import channel
+from . import client
+from . import codec
+from . import common
+from . import server
+
+qt_exists = False
+try:
+    from PySide2.QtCore import QCoreApplication, QTimer
+    qt_exists = True
+except ImportError:
+    try:
+        from PySide6.QtCore import QCoreApplication, QTimer
+        qt_exists = True
+    except ImportError:
+        pass
+
+
+TIMEOUT_SECONDS = server.TIMEOUT_SECONDS
+
+POLL_MS = 20
+"""How often the timer pumps the event loop"""
+
+_loop = None
+_channel = None
+_locks = {}
+_timer = None
+
+
+def get_loop():
+    """Return the bridge's event loop, making it if needed"""
+    global _loop, _channel
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+
+        #locks and connections belong to the loop that made them
+        _locks.clear()
+        _channel = None
+
+    return _loop
+
+
+def _lock(name):
+    """A lock on the current loop, shared by everything that asks for name"""
+    get_loop()
+    if name not in _locks:
+        _locks[name] = asyncio.Lock()
+
+    return _locks[name]
+
+
+def pump():
+    """Run every callback that's ready without waiting for anything
+
+    Call this from the host's idle/timer callback.
+    """
+    loop = get_loop()
+    if loop.is_running():
+        return
+
+    loop.call_soon(loop.stop)
+    loop.run_forever()
+
+
+def is_pumping():
+    return _timer is not None
+
+
+def start():
+    """Pump the loop from a Qt timer on the main thread, once
+
+    Returns:
+        bool : False if there's no Qt application, pump() must be called
+        some other way.
+    """
+    global _timer
+
+    if _timer is None:
+        if not qt_exists or QCoreApplication.instance() is None:
+            return False
+
+        _timer = QTimer()
+        _timer.timeout.connect(pump)
+        _timer.start(POLL_MS)
+
+    return True
+
+
+def submit(coro, callback=None):
+    """Schedule a coroutine on the bridge loop
+
+    Args:
+        coro : the coroutine to run.
+        callback : optional callable that gets the result once it's done.
+
+    Returns:
+        asyncio.Task : the scheduled task.
+    """
+    start()
+    task = get_loop().create_task(coro)
+    if callback is not None:
+        def _done(task):
+            if task.cancelled():
+                return
+
+            error = task.exception()
+            if error is not None:
+                print(f"Maya bridge request failed: {error}")
+                return
+
+            callback(task.result())
+
+        task.add_done_callback(_done)
+
+    return task
+
+
+def run(coro):
+    """Run a coroutine to completion, blocking. Handy for scripts and tests."""
+    return get_loop().run_until_complete(coro)
+
+
+def run_command(cmd):
+    """Execute a command sent by Maya and return its data"""
+    with client.capture() as replies:
+        exec(f"import cg3dmaya; {cmd}", __main__.__dict__, __main__.__dict__)
+
+    return (True, replies[-1] if replies else None)
+
+
+
+class AsyncChannel(object):
+    """The asyncio version of channel.Channel
+
+    Messages are framed and encoded exactly the same way, so Maya can't
+    tell the difference between the two.
+    """
+
+    def __init__(self, reader, writer, handler=run_command):
+        self.reader = reader
+        self.writer = writer
+        self.handler = handler
+        self.codec = codec.Codec()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._closed = False
+
+        self.send_message(codec.hello())
+        self._read_task = get_loop().create_task(self._read_loop())
+
+
+    @classmethod
+    async def open(cls, port, host=channel.HOST, handler=run_command):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), TIMEOUT_SECONDS
+        )
+        return cls(reader, writer, handler)
+
+
+    @property
+    def connected(self):
+        return not self._closed
+
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        self.writer.close()
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result(None)
+
+
+    def send_message(self, message):
+        self.writer.write(codec.frame(self.codec.encode(message)))
+
+
+    async def request(self, cmd, timeout=TIMEOUT_SECONDS):
+        """Send a command to Maya and wait for its response
+
+        Returns:
+            tuple : (success, data) matching server.send_and_listen()
+        """
+        if self._closed:
+            return (False, None)
+
+        request_id = next(self._ids)
+        future = get_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self.send_message({'type': channel.REQUEST, 'id': request_id, 'cmd': cmd})
+            await self.writer.drain()
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            response = None
+        except OSError as e:
+            print(f"Bridge channel failed to send: {e}")
+            self.close()
+            response = None
+        finally:
+            self._pending.pop(request_id, None)
+
+        if response is None:
+            return (False, None)
+
+        return (response.get('success', False), response.get('data'))
+
+
+    def notify(self, cmd):
+        """Send a command without waiting for its response"""
+        if self._closed:
+            return False
+
+        self.send_message({'type': channel.REQUEST, 'id': next(self._ids), 'cmd': cmd})
+        return True
+
+
+    async def _read_loop(self):
+        try:
+            while not self._closed:
+                header = await self.reader.readexactly(4)
+                payload = await self.reader.readexactly(int.from_bytes(header, 'big'))
+                self._dispatch(codec.decode(payload))
+        except (asyncio.IncompleteReadError, OSError, ValueError) as e:
+            if not self._closed:
+                print(f"Bridge channel closed: {e}")
+        finally:
+            self.close()
+
+
+    def _dispatch(self, message):
+        kind = message.get('type')
+        if kind == channel.HELLO:
+            self.codec = codec.negotiate(message)
+
+        elif kind == channel.RESPONSE:
+            future = self._pending.get(message.get('id'))
+            if future is not None and not future.done():
+                future.set_result(message)
+
+        elif kind == channel.REQUEST:
+            success, data = False, None
+            if self.handler is not None:
+                try:
+                    success, data = self.handler(message.get('cmd', ''))
+                except Exception as e:
+                    print(f"Bridge channel command failed: {e}")
+                    data = channel._error_text(e)
+
+            response = {'type': channel.RESPONSE, 'id': message.get('id'),
+                        'success': success, 'data': data}
+            try:
+                self.send_message(response)
+            except (TypeError, ValueError, OverflowError, struct.error) as e:
+                print(f"Bridge channel can't encode the response: {e}")
+                response.update(success=False, data=f"Can't encode the response: {e}")
+                self.send_message(response)
+
+
+
+async def get_channel():
+    """Return a connected AsyncChannel to Maya, reconnecting if needed"""
+    global _channel
+
+    #Requests made at the same time should share one connection attempt.
+    async with _lock('connect'):
+        if _channel is not None and _channel.connected:
+            return _channel
+
+        port = channel._channel_port
+        if port is None:
+            return None
+
+        try:
+            _channel = await AsyncChannel.open(port)
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"Couldn't connect the async bridge channel to {port}: {e}")
+            _channel = None
+
+    return _channel
+
+
+async def _listen_once(maya_command_port, cmd):
+    """The old one-shot reply socket, served without blocking"""
+    #Maya only knows one reply port at a time, so these go one after another.
+    async with _lock('reply'):
+        reply = get_loop().create_future()
+
+        async def _on_connect(reader, writer):
+            try:
+                header = await reader.readexactly(4)
+                payload = await reader.readexactly(int.from_bytes(header, 'big'))
+                if not reply.done():
+                    reply.set_result(codec.decode(payload))
+            except (asyncio.IncompleteReadError, OSError, ValueError) as e:
+                print(f"Error handling client: {e}")
+            finally:
+                writer.close()
+
+        listener = await asyncio.start_server(_on_connect, server.HOST, server.PORT)
+        try:
+            server_port = listener.sockets[0].getsockname()[1]
+            cmd = f"cg3dcasc.core.client.set_port({server_port}); {cmd}"
+            if not server.send_to_maya(maya_command_port, cmd):
+                return (False, None)
+
+            data = await asyncio.wait_for(reply, TIMEOUT_SECONDS)
+            return (True, data)
+        except asyncio.TimeoutError:
+            print(f"No connection received within {TIMEOUT_SECONDS} seconds.")
+            return (False, None)
+        finally:
+            listener.close()
+
+
+async def send_and_listen(maya_command_port, cmd, timeout=TIMEOUT_SECONDS):
+    """Awaitable version of server.send_and_listen()"""
+    if maya_command_port == -1:
+        return (False, None)
+
+    active_channel = await get_channel()
+    if active_channel is not None:
+        result = await active_channel.request(cmd, timeout)
+        if result[0] or active_channel.connected:
+            return result
+
+        #The connection dropped under us, so try a fresh one once.
+        active_channel = await get_channel()
+        if active_channel is not None:
+            return await active_channel.request(cmd, timeout)
+
+    return await _listen_once(maya_command_port, cmd)
+
+
+async def query_maya(*names):
+    """Awaitable version of common.query_maya()"""
+    if common._maya_runs_queries:
+        cmd = f"cg3dcasc.core.run_queries({list(names)!r})"
+        success, data = await send_and_listen(common.get_active_port(), cmd)
+        if success:
+            return common._query_results(data)
+
+        if not common._lacks_run_queries(data):
+            return None
+
+    legacy = [name for name in names if name in common.LEGACY_QUERIES]
+    replies = await asyncio.gather(*(send_and_listen(common.get_active_port(), common.LEGACY_QUERIES[name])
+                                     for name in legacy))
+    results = {name: data for name, (success, data) in zip(legacy, replies) if success}
+    return results or None
+
+
+async def _query_value(name):
+    results = await query_maya(name)
+    if results is None or name not in results:
+        return None
+
+    return results[name]
+
+
+async def get_all_maya_set_ids():
+    """Awaitable version of common.get_all_maya_set_ids()"""
+    data = await _query_value(common.SET_IDS)
+    return None if data is None else set(data)
+
+
+async def get_selected_maya_set_ids():
+    """Awaitable version of common.get_selected_maya_set_ids()"""
+    data = await _query_value(common.SELECTED_SET_IDS)
+    return None if data is None else set(data)
+
+
+async def get_maya_coord_system():
+    """Awaitable version of common.get_maya_coord_system()"""
+    data = await _query_value(common.UP_AXIS)
+    return None if data is None else common._to_coord_system(data)
+
+
+async def notify_maya(cmd):
+    """Send a command to Maya without caring about the answer, e.g. an
+    export notification like "cg3dcasc.core.import_fbx()"
+    """
+    active_channel = await get_channel()
+    if active_channel is not None and active_channel.notify(cmd):
+        return True
+
+    return server.send_to_maya(common.get_active_port(), cmd)
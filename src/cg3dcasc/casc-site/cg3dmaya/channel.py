@@ -0,0 +1,430 @@
+"""A long lived connection between Cascadeur and Maya
+
+Maya listens for the channel and tells us its port on every command it
+sends (see common.set_active_port()). We connect once and keep the
+connection open, reconnecting if Maya went away, instead of binding a
+listening socket per round trip. Every message is framed the same way the
+old one-shot sockets were: a 4-byte '>I' length followed by the payload.
+Both ends say hello when the channel opens and switch from plain JSON to the
+best codec they share (see codec.py).
+
+Each message is a dict with a 'type' and an 'id'. Requests carry a 'cmd',
+responses carry 'success' and 'data', and the id is how a response finds
+the request that's waiting on it, so any number of requests can share the
+connection.
+
+'progress' messages carry progress events (see progress.py) and 'cancel'
+messages cancel whatever is running on the other side. Neither gets a
+response, and older peers ignore both. A 'listening' message says the
+sender runs the requests it's sent as commands, see cg3dmaya.listener.
+"""
+
+import concurrent.futures
+import socket
+import struct
+import threading
+import itertools
+
+from . import codec
+from . import progress
+
+
+HOST = '127.0.0.1'
+PORT = 0 #this makes the port dynamic
+TIMEOUT_SECONDS = 0.5
+
+REQUEST = 'request'
+RESPONSE = 'response'
+HELLO = 'hello'
+PROGRESS = 'progress'
+CANCEL = 'cancel'
+LISTENING = 'listening'
+
+_ids = itertools.count(1)
+
+_channel = None
+_channel_port = None
+_command_handler = None
+
+
+def receive_all(sock, n):
+    """Helper function to ensure all 'n' bytes are received."""
+    return codec.receive_into(sock, n)
+
+
+def read_message(sock):
+    """Read one framed message from the socket.
+
+    Returns:
+        dict : the message, or None if the peer hung up.
+    """
+    payload = codec.read_payload(sock)
+    if payload is None:
+        return None
+
+    return codec.decode(payload)
+
+
+def write_message(sock, message, message_codec=None):
+    """Frame and send one message over the socket"""
+    if message_codec is None:
+        message_codec = codec.Codec()
+
+    sock.sendall(codec.frame(message_codec.encode(message)))
+
+
+def _error_text(e):
+    """What a failed command answers with, so the caller can tell why"""
+    return f"{type(e).__name__}: {e}"
+
+
+class Channel(object):
+    """One framed, multiplexed connection to the other application
+
+    A background thread reads every incoming message. Responses wake up
+    whichever request() is waiting on their id. Requests are passed to the
+    handler, which gets the command string and returns (success, data).
+
+    Channels that are given the same pending dict can answer each other's
+    requests, which is how a reply finds its way back when the other side
+    has more than one channel open.
+    """
+
+    def __init__(self, sock, handler=None, pending=None):
+        self.sock = sock
+        self.handler = handler
+        self._pending = {} if pending is None else pending
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self.codec = codec.Codec()
+        self.accepts_commands = False
+
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+        try:
+            self.send_message(codec.hello())
+        except OSError as e:
+            print(f"Bridge channel failed to say hello: {e}")
+            self.close()
+
+
+    @property
+    def connected(self):
+        return not self._closed
+
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        #close() alone doesn't reach the peer while our reader is blocked
+        #in recv(), shutdown() does.
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+        #wake up anybody that's still waiting, they'll see no response.
+        for event, _, owner in list(self._pending.values()):
+            if owner is self:
+                event.set()
+
+
+    def send_message(self, message):
+        with self._send_lock:
+            write_message(self.sock, message, self.codec)
+
+
+    def respond(self, request_id, success, data):
+        """Send the response for a request id
+
+        Data the agreed codec can't encode is answered with success=False
+        and the error text, rather than closing the channel.
+        """
+        message = {'type': RESPONSE, 'id': request_id, 'success': success, 'data': data}
+        try:
+            try:
+                self.send_message(message)
+            except (TypeError, ValueError, OverflowError, struct.error) as e:
+                print(f"Bridge channel can't encode the response: {e}")
+                message.update(success=False, data=f"Can't encode the response: {e}")
+                self.send_message(message)
+        except OSError as e:
+            print(f"Bridge channel failed to respond: {e}")
+            self.close()
+            return False
+
+        return True
+
+
+    def _respond_future(self, request_id, future):
+        try:
+            success, data = future.result()
+        except Exception as e:
+            print(f"Bridge channel command failed: {e}")
+            success, data = False, _error_text(e)
+
+        self.respond(request_id, success, data)
+
+
+    def post(self, cmd):
+        """Send a command without waiting for its response
+
+        Returns:
+            bool : False if it couldn't be sent.
+        """
+        if self._closed:
+            return False
+
+        try:
+            self.send_message({'type': REQUEST, 'id': next(_ids), 'cmd': cmd})
+        except OSError as e:
+            print(f"Bridge channel failed to send: {e}")
+            self.close()
+            return False
+
+        return True
+
+
+    def request(self, cmd, timeout=TIMEOUT_SECONDS):
+        """Send a command over the channel and wait for its response
+
+        Returns:
+            tuple : (success, data) matching server.send_and_listen()
+        """
+        return self.await_reply(
+            lambda request_id: self.send_message({'type': REQUEST, 'id': request_id, 'cmd': cmd}),
+            timeout
+        )
+
+
+    def await_reply(self, send, timeout=TIMEOUT_SECONDS):
+        """Reserve a request id, call send(request_id) and wait for the response
+
+        This is for requests that don't travel over the channel themselves,
+        e.g. a command handed to Maya through its command port that answers
+        back over the channel.
+        """
+        if self._closed:
+            return (False, None)
+
+        request_id = next(_ids)
+        slot = [threading.Event(), None, self]
+        self._pending[request_id] = slot
+        try:
+            if send(request_id) is False:
+                return (False, None)
+
+            slot[0].wait(timeout)
+        except OSError as e:
+            print(f"Bridge channel failed to send: {e}")
+            self.close()
+        finally:
+            self._pending.pop(request_id, None)
+
+        response = slot[1]
+        if response is None:
+            return (False, None)
+
+        return (response.get('success', False), response.get('data'))
+
+
+    def _read_loop(self):
+        try:
+            while not self._closed:
+                message = read_message(self.sock)
+                if message is None:
+                    break
+
+                self._dispatch(message)
+        except (OSError, ValueError, TypeError) as e:
+            if not self._closed:
+                print(f"Bridge channel closed: {e}")
+        finally:
+            self.close()
+
+
+    def _dispatch(self, message):
+        kind = message.get('type')
+        if kind == HELLO:
+            self.codec = codec.negotiate(message)
+            print(f"Bridge channel is using {self.codec}")
+
+        elif kind == RESPONSE:
+            slot = self._pending.get(message.get('id'))
+            if slot is not None:
+                slot[1] = message
+                slot[0].set()
+
+        elif kind == REQUEST:
+            request_id = message.get('id')
+            result = (False, None)
+            if self.handler is not None:
+                try:
+                    result = self.handler(message.get('cmd', ''))
+                except Exception as e:
+                    print(f"Bridge channel command failed: {e}")
+                    result = (False, _error_text(e))
+
+            #a handler that can't answer on the reader thread returns a
+            #Future, and the response goes out once it's done.
+            if isinstance(result, concurrent.futures.Future):
+                result.add_done_callback(lambda future: self._respond_future(request_id, future))
+            else:
+                self.respond(request_id, *result)
+
+        elif kind == PROGRESS:
+            progress.receive(message.get('event') or {})
+
+        elif kind == LISTENING:
+            self.accepts_commands = bool(message.get('value', True))
+
+        elif kind == CANCEL:
+            if progress.cancel():
+                print("Cancelled by the other application")
+
+
+
+def loopback(handler_a=None, handler_b=None):
+    """Return two channels connected to each other in this process
+
+    This stands in for the Maya/Cascadeur pair, so the channel can be used
+    without either application running.
+    """
+    sock_a, sock_b = socket.socketpair()
+    return (Channel(sock_a, handler_a), Channel(sock_b, handler_b))
+
+
+def connect(port, host=HOST):
+    """Connect to Maya's channel port, reusing the connection if it's up
+
+    Returns:
+        Channel : the connected channel or None
+    """
+    global _channel, _channel_port
+
+    if port is None:
+        return None
+
+    port = int(port)
+    if _channel is not None and _channel.connected and _channel_port == port:
+        return _channel
+
+    if _channel is not None:
+        _channel.close()
+        _channel = None
+
+    _channel_port = port
+    try:
+        sock = socket.create_connection((host, port), timeout=TIMEOUT_SECONDS)
+        sock.settimeout(None)
+    except OSError as e:
+        print(f"Couldn't connect the bridge channel to {host}:{port}: {e}")
+        return None
+
+    _channel = Channel(sock, _command_handler)
+    if _command_handler is not None:
+        _announce(_channel)
+
+    return _channel
+
+
+def _announce(active_channel):
+    try:
+        active_channel.send_message({'type': LISTENING, 'value': active_channel.handler is not None})
+    except OSError as e:
+        print(f"Bridge channel failed to announce the listener: {e}")
+        active_channel.close()
+
+
+def set_command_handler(handler):
+    """Run Maya's requests with handler(cmd) on this and every later channel
+
+    Maya is told once per connection that it can send its commands here,
+and told again if handler is None and it can't anymore.
+    """
+    global _command_handler
+
+    _command_handler = handler
+    active_channel = _connected()
+    if active_channel is not None and active_channel.handler is not handler:
+        active_channel.handler = handler
+        _announce(active_channel)
+
+
+def get():
+    """Return the connected channel, reconnecting to the last port if needed"""
+    if _channel is not None and _channel.connected:
+        return _channel
+
+    return connect(_channel_port)
+
+
+def request(cmd, timeout=TIMEOUT_SECONDS):
+    """Send a command to Maya over the channel, reconnecting once if it dropped
+
+    Returns:
+        tuple : (success, data) or None when there's no channel to Maya.
+    """
+    active_channel = get()
+    if active_channel is None:
+        return None
+
+    result = active_channel.request(cmd, timeout)
+    if not result[0] and not active_channel.connected:
+        active_channel = get()
+        if active_channel is not None:
+            result = active_channel.request(cmd, timeout)
+
+    return result
+
+
+def _connected():
+    """The connected channel, without trying to reconnect"""
+    if _channel is not None and _channel.connected:
+        return _channel
+
+    return None
+
+
+def forward_progress(event):
+    """Progress sink that sends local events to the other application"""
+    if event.get('remote'):
+        return
+
+    active_channel = _connected()
+    if active_channel is None:
+        return
+
+    try:
+        active_channel.send_message({'type': PROGRESS, 'event': event})
+    except OSError:
+        pass
+
+
+def cancel_remote():
+    """Cancel whatever the other application is running
+
+    Returns:
+        bool : False if there's no channel to send it on.
+    """
+    active_channel = _connected()
+    if active_channel is None:
+        return False
+
+    try:
+        active_channel.send_message({'type': CANCEL})
+    except OSError:
+        return False
+
+    return True
+
+
+progress.add_sink(forward_progress)
@@ -2,12 +2,17 @@
 
 #import maya.cmds as cmds
 import socket
-import json
-import struct
+import contextlib
+import __main__
+
+from . import channel
+from . import codec
 
 
 HOST = '127.0.0.1'
 _maya_port = 7258 #dynamically changed
+_reply_id = None #set when Maya is waiting for an answer on the bridge channel
+_captures = []
 
 
 def set_port(number):
@@ -16,21 +21,71 @@ def set_port(number):
     _maya_port = number
 
 
+def set_reply(request_id):
+    """The next data_to_maya() call answers this bridge channel request
+
+    Older Maya bridges send this ahead of the command, newer ones use
+    reply_to(), which forgets the request even if the command fails.
+    """
+    global _reply_id
+    _reply_id = request_id
+
+
+def reply_to(request_id, cmd):
+    """Run cmd, its data_to_maya() call answers this bridge channel request"""
+    global _reply_id
+    _reply_id = request_id
+    try:
+        exec(f"import cg3dmaya; {cmd}", __main__.__dict__, __main__.__dict__)
+    finally:
+        _reply_id = None
+
+
+@contextlib.contextmanager
+def capture():
+    """Collect data_to_maya() calls instead of sending them
+
+    Used when Maya sends a request over the bridge channel, as the data goes
+    back in the channel response.
+    """
+    replies = []
+    _captures.append(replies)
+    try:
+        yield replies
+    finally:
+        _captures.remove(replies)
+
+
 def data_to_maya(scene: 'pycsc.dataTypes.DomainScene', data):
     """Encodes and sends JSON data to the external server."""
+    global _reply_id
+
+    if _captures:
+        _captures[-1].append(data)
+        return
+
+    if _reply_id is not None:
+        request_id = _reply_id
+        _reply_id = None
+
+        active_channel = channel.get()
+        if active_channel is not None and active_channel.respond(request_id, True, data):
+            return
+
+        scene.warning("Lost the Maya bridge channel, the reply wasn't sent.")
+        return
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
         try:
             print(f"cascadeur port:{_maya_port}")
             client.connect((HOST, _maya_port))
             
-            json_string = json.dumps(data)
-            json_bytes = json_string.encode('utf-8')
+            #One-shot sockets are what older versions of the bridge listen
+            #on, so they always get plain JSON.
+            json_bytes = codec.encode(data, codec.JSON)
 
-            # 3. Prepend a 4-byte length-prefix.
-            length_prefix = struct.pack('>I', len(json_bytes))
-            
-            # 4. Send the length-prefix followed by the JSON data.
-            client.sendall(length_prefix + json_bytes)
+            # 3. Prepend a 4-byte length-prefix and send it with the data.
+            client.sendall(codec.frame(json_bytes))
             
             print(f"Sent {len(json_bytes)} bytes of JSON data to the server. Data is:{data}")
         
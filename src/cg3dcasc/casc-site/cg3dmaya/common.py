@@ -16,6 +16,10 @@ import csc
 
 from . import client
 from . import server
+from . import channel
+from . import progress
+from . import listener
+from . import set_index
 import pycsc
 #import pycsc as cg3dguru
 #import pycsc.general.fbx as fbx
@@ -27,6 +31,25 @@ BAKE_ANIMATION = 'Bake Animation'
 
 
 _active_port_number = 6000
+_last_status = None
+
+#names of Maya's queries, see query_maya()
+SET_IDS = 'set_ids'
+SELECTED_SET_IDS = 'selected_set_ids'
+UP_AXIS = 'up_axis'
+FRAME_RANGE = 'frame_range'
+SCENE_PATH = 'scene_path'
+FINGERPRINTS = 'fingerprints'
+
+LEGACY_QUERIES = {
+    SET_IDS: "cg3dcasc.core.get_all_set_ids()",
+    SELECTED_SET_IDS: "cg3dcasc.core.get_selected_set_ids()",
+    UP_AXIS: "cg3dcasc.core.get_coord_system()",
+}
+"""How a Maya bridge without run_queries() answers each query, one round
+trip apiece, see set_active_port()"""
+
+_maya_runs_queries = True
 
 
 def get_active_port():
@@ -66,11 +89,16 @@ def _create_data(scene, set_name, maya_id, new_roots):
     
 
     behaviour = obj.get_behaviour_by_name(MAYA_BEHAVIOUR_NAME)
+    set_index.invalidate()
     
     return obj
 
 
 def get_set_members(export_set):
+    index = set_index.current()
+    if index is not None:
+        return index.roots(export_set)
+
     beh = export_set.get_behaviour_by_name(MAYA_ROOTS)
     if beh:
         return {b.object for b in beh.behaviours.get()}
@@ -79,6 +107,10 @@ def get_set_members(export_set):
 
 
 def get_ids(export_sets):
+    index = set_index.current()
+    if index is not None:
+        return index.ids(export_sets)
+
     ids = {}
     for export_set in export_sets:
         export_beh = export_set.get_behaviours_by_name(MAYA_BEHAVIOUR_NAME)[0]
@@ -88,15 +120,9 @@ def get_ids(export_sets):
 
 
 def remove_export_sets(scene, objs: set):
-    all_sets, selected_sets = get_export_sets(scene)
-    maya_roots = set()
-
-    for export_set in all_sets:
-        maya_roots.update(get_set_members(export_set))
-        #beh = export_set.get_behaviour_by_name(MAYA_ROOTS)
-        #if beh:
-            #assigned_roots = {b.object for b in beh.behaviours.get()}
-            #maya_roots.update(assigned_roots)
+    index = set_index.get(scene)
+    all_sets = index.sets
+    maya_roots = index.assigned_roots()
 
     new_roots = {obj for obj in objs if obj not in maya_roots and obj not in all_sets}
     return new_roots
@@ -125,7 +151,11 @@ def create_export_set(scene, root_objects=None):
 
 
 def get_export_sets(scene, selected=False):
-    all_sets = {b.object for b in scene.get_behaviours(MAYA_BEHAVIOUR_NAME)}
+    index = set_index.current(scene)
+    if index is not None:
+        all_sets = set(index.sets)
+    else:
+        all_sets = {b.object for b in scene.get_behaviours(MAYA_BEHAVIOUR_NAME)}
     selected_sets = {o for o in scene.get_scene_objects(selected=True) if o in all_sets}
     
     return (all_sets, selected_sets)
@@ -180,10 +210,13 @@ def _add_to_set(scene, objects, target_set):
             
             root_beh.behaviours.add(basic_beh)
 
+        set_index.invalidate()
+
     if scene.edit("Add selected to set", mod):
         scene.success("Added to set.")
     
 
+@set_index.indexed
 def add_selection_to(new_set: bool):
     scene = pycsc.get_current_scene().ds
     selected_roots = _get_filtered_selection(scene, not new_set)
@@ -219,6 +252,7 @@ def add_selection_to(new_set: bool):
                                                           dialog_buttons)
 
 
+@set_index.indexed
 def remove_selection_from():
     scene = pycsc.get_current_scene().ds
     selected_roots = _get_filtered_selection(scene)
@@ -234,7 +268,7 @@ def remove_selection_from():
         if not beh:
             continue
         
-        assigned_roots = {b.object for b in beh.behaviours.get()}
+        assigned_roots = get_set_members(export_set)
         common_elements = assigned_roots & selected_roots
         if common_elements:
             common_elements = {obj.get_behaviour_by_name("Basic") for obj in common_elements if obj.get_behaviour_by_name("Basic")}
@@ -247,6 +281,8 @@ def remove_selection_from():
             for obj in objs:
                 beh.behaviours.remove(obj)
 
+        set_index.invalidate()
+
     scene.edit("Remove selected from export set", mod)
     scene.success(f"Removed {removed_count} objects from export")
     
@@ -266,6 +302,7 @@ def _select_set_members(scene, export_set):
     return selected
     
 
+@set_index.indexed
 def select_set_members():
     scene = pycsc.get_current_scene().ds
     all_sets, selected_sets = get_export_sets(scene)
@@ -295,36 +332,91 @@ def select_set_members():
                                                           dialog_buttons)
 
 
-def get_all_maya_set_ids():
-    """Return a list of all ids in the current Maya scene"""
+def query_maya(*names):
+    """Ask Maya several named queries in one round trip
+
+    e.g. query_maya(SET_IDS, UP_AXIS, FRAME_RANGE)
+
+    Returns:
+        dict : {name: data} for every query Maya answered, or None if Maya
+        didn't answer at all.
+    """
+    if _maya_runs_queries:
+        cmd = f"cg3dcasc.core.run_queries({list(names)!r})"
+        success, data = server.send_and_listen(get_active_port(), cmd)
+        if success:
+            return _query_results(data)
 
-    cmd = "cg3dcasc.core.get_all_set_ids()"
-    success, data = server.send_and_listen(get_active_port(), cmd)
-    if not success:
+        #Maya not answering isn't a reason to ask it N more times.
+        if not _lacks_run_queries(data):
+            return None
+
+    results = {}
+    for name in names:
+        if name in LEGACY_QUERIES:
+            success, data = server.send_and_listen(get_active_port(), LEGACY_QUERIES[name])
+            if not success:
+                break
+
+            results[name] = data
+
+    return results or None
+
+
+def _lacks_run_queries(data):
+    """Only ask one query at a time once Maya says it has no run_queries()
+
+    A failed channel command answers with its error text, see
+    channel._error_text().
+    """
+    global _maya_runs_queries
+
+    if not isinstance(data, str) or 'run_queries' not in data:
+        return False
+
+    print("Maya can't batch queries, asking one at a time")
+    _maya_runs_queries = False
+    return True
+
+
+def _query_results(data):
+    if not isinstance(data, dict):
         return None
 
-    return set(data)
+    for name, error in data.get('errors', {}).items():
+        print(f"Maya couldn't answer {name}: {error}")
 
+    return data.get('results', {})
 
-def get_selected_maya_set_ids():
-    """Return a list of all selected ids in the current Maya scene"""
 
-    cmd = "cg3dcasc.core.get_selected_set_ids()"
-    success, data = server.send_and_listen(get_active_port(), cmd)
-    if not success:
+def _query_value(name):
+    results = query_maya(name)
+    if results is None or name not in results:
         return None
 
-    return set(data)    
+    return results[name]
+
+
+def get_all_maya_set_ids():
+    """Return a list of all ids in the current Maya scene"""
+    data = _query_value(SET_IDS)
+    return None if data is None else set(data)
+
+
+def get_selected_maya_set_ids():
+    """Return a list of all selected ids in the current Maya scene"""
+    data = _query_value(SELECTED_SET_IDS)
+    return None if data is None else set(data)
     
 
 def get_maya_coord_system():
     """returns the active coordinate system in Maya"""
-    
-    cmd = "cg3dcasc.core.get_coord_system()"
-    success, data = server.send_and_listen(get_active_port(), cmd)
-    if not success:
-        return None
+    data = _query_value(UP_AXIS)
+    return None if data is None else _to_coord_system(data)
 
+
+def _to_coord_system(data):
+    """Convert Maya's up axis name into a csc.fbx.FbxSettingsAxis"""
     match data.lower():
         case 'x':
             return csc.fbx.FbxSettingsAxis.X
@@ -336,9 +428,17 @@ def get_maya_coord_system():
             return None
 
 
-def set_active_port(port_number):
-    global _active_port_number
+def set_active_port(port_number, channel_port=None):
+    """Called by Maya with every command it sends
+
+    A Maya bridge that announces no channel port predates run_queries(), so
+    it's asked one query at a time.
+    """
+    global _active_port_number, _maya_runs_queries
     _active_port_number = int(port_number)
+    _maya_runs_queries = channel_port is not None
+    channel.connect(channel_port)
+    listener.start()
 
 
 def report_port_number():
@@ -354,6 +454,7 @@ def _sync_id(scene, maya_id, export_set):
     def mod(scene):
         nonlocal maya_id
         scene.de.set_data_value(id_data, maya_id)
+        set_index.invalidate()
 
     if scene.edit("Replace Maya ID", mod):
         scene.success("Sync Complete")
@@ -367,13 +468,16 @@ def get_selected_ids():
     client.data_to_maya(scene, ids)
     
 
+@set_index.indexed
 def sync_selected_set_ids():
     scene = pycsc.get_current_scene().ds
     
-    maya_ids = get_selected_maya_set_ids()
-    if maya_ids is None:
+    results = query_maya(SELECTED_SET_IDS, SET_IDS)
+    if results is None or SELECTED_SET_IDS not in results:
         scene.error("Is Maya Connected? Sync failed.")
         return
+
+    maya_ids = set(results[SELECTED_SET_IDS])
     
     all_sets, selected_sets = get_export_sets(scene)
     if len(maya_ids) != 1 or len(selected_sets) != 1:
@@ -392,6 +496,9 @@ def sync_selected_set_ids():
                       csc.view.DialogButton(csc.view.StandardButton.Cancel)]
     
     message = "Warning: Syncing IDs should only be done if you understand the risks.\nSee documentation for more details.\nContinue?"
+    current_id = get_ids([export_set])
+    if set(current_id) & set(results.get(SET_IDS, ())):
+        message = f"{export_set.name} is still linked to another set in Maya.\n" + message
     csc.view.DialogManager.instance().show_buttons_dialog("Maya Bridge - Sync Ids", message,
                                                           dialog_buttons)
     
@@ -400,3 +507,36 @@ def sync_selected_set_ids():
     
 
 
+def _status_sink(event):
+    """Show progress events as Cascadeur status messages
+
+    Only starts, ends and phase changes of the outermost operation are shown,
+    Maya's events are just printed.
+    """
+    global _last_status
+
+    if event.get('remote'):
+        print(f"Maya: {progress.describe(event)}")
+        return
+
+    if event['depth']:
+        return
+
+    status = (event['type'], event['operation'], event['phase'])
+    if status == _last_status:
+        return
+
+    _last_status = status
+    scene = pycsc.get_current_scene().ds
+    scene.info(progress.describe(event))
+
+
+def cancel_maya():
+    """Cancel the export Maya is running"""
+    if not channel.cancel_remote():
+        scene = pycsc.get_current_scene().ds
+        scene.warning("Maya isn't connected")
+
+
+progress.SOURCE = 'cascadeur'
+progress.add_sink(_status_sink)
@@ -3,6 +3,8 @@ from enum import auto
 import csc
 import pycsc
 
+from . import trace
+
 
 class FbxFilterType(IntEnum):
     SKIP = 0
@@ -29,6 +31,7 @@ def current_fbx_loader() -> csc.fbx.FbxLoader:
     return fbx_scene_loader
 
     
+@trace.traced('fbx.import_fbx')
 def import_fbx(file_path: str, import_filter: FbxFilterType, new_scene: bool = False, settings: csc.fbx.FbxSettings = None):
     """Import the fbx file into Cascadeur.
     
@@ -60,6 +63,7 @@ def import_fbx(file_path: str, import_filter: FbxFilterType, new_scene: bool = F
     return method(file_path)
     
 
+@trace.traced('fbx.export_fbx')
 def export_fbx(file_path: str, export_filter: FbxFilterType, settings: csc.fbx.FbxSettings = None):
     """Export an fbx file to the target file location
     
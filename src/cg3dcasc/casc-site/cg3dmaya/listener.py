@@ -0,0 +1,90 @@
+"""Run Maya's commands inside Cascadeur without starting cascadeur.exe
+
+Every command Maya sends normally starts cascadeur.exe with
+--run-python-code, which hands the code to the running Cascadeur. Once
+start() has run, Maya's commands come over the bridge channel instead. The
+channel's reader thread only queues them, a Qt timer on Cascadeur's main
+thread runs them, since the scene can only be edited from there.
+
+start() is called by common.set_active_port(), so the first command Maya
+sends the old way starts the listener and every later one skips the
+process spawn. Without Qt the listener stays down and Maya keeps spawning.
+"""
+
+import queue
+import __main__
+
+from . import channel
+
+qt_exists = False
+try:
+    from PySide2.QtCore import QCoreApplication, QTimer
+    qt_exists = True
+except ImportError:
+    try:
+        from PySide6.QtCore import QCoreApplication, QTimer
+        qt_exists = True
+    except ImportError:
+        pass
+
+
+POLL_MS = 50
+"""How often the main thread runs queued commands"""
+
+_commands = queue.Queue()
+_timer = None
+
+
+def _queue_command(cmd):
+    """Channel handler, called on the channel's reader thread"""
+    _commands.put(cmd)
+    return (True, None)
+
+
+def run_queued():
+    """Run every queued command, on the main thread"""
+    while True:
+        try:
+            cmd = _commands.get_nowait()
+        except queue.Empty:
+            return
+
+        try:
+            exec(cmd, __main__.__dict__)
+        except Exception as e:
+            print(f"Maya command failed: {e}")
+
+
+def is_running():
+    return _timer is not None
+
+
+def start():
+    """Start polling for Maya's commands, once
+
+    Returns:
+        bool : False if there's no Qt application to poll from.
+    """
+    global _timer
+
+    if _timer is None:
+        if not qt_exists or QCoreApplication.instance() is None:
+            return False
+
+        _timer = QTimer()
+        _timer.timeout.connect(run_queued)
+        _timer.start(POLL_MS)
+
+    channel.set_command_handler(_queue_command)
+    return True
+
+
+def stop():
+    """Go back to Maya spawning cascadeur.exe for every command"""
+    global _timer
+
+    if _timer is not None:
+        _timer.stop()
+        _timer = None
+
+    channel.set_command_handler(None)
@@ -2,9 +2,7 @@
 
 import json
 import typing
-import tempfile
 import os
-import pathlib
 import uuid
 
 import csc
@@ -14,25 +12,16 @@ import common.hierarchy as hierarchy
 from . import common
 from . import server
 from . import fbx
-
-
-temp_dir = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc'))
+from . import transfer
+from . import trace
+from . import set_index
 
 
 def _select_for_export(scene, new_selection):
     scene.select(new_selection)
     
     
-def _clean_export_location():
-    print('Cascaduer Export Location {}'.format(temp_dir))
-    if not temp_dir.exists():
-        temp_dir.mkdir()
-
-    #delete previous entries
-    for child in temp_dir.iterdir():
-        child.unlink(missing_ok=True)    
-
-
+@trace.traced('export_to_maya')
 def _export(scene, export_sets):
     
     if not export_sets:
@@ -43,7 +32,10 @@ def _export(scene, export_sets):
     #if up_axis is None:
         #print("Couldn't get Maya's Up Axis. Is Maya Running? Export Failed")
         #return
-        
+
+    #Every export gets its own folder and manifest, see transfer.begin()
+    manifest = transfer.begin('cascadeur')
+
     for export_set in export_sets:
         root_beh = export_set.get_behaviour_by_name(common.MAYA_ROOTS)
         roots = [beh.object for beh in root_beh.behaviours.get()]
@@ -60,7 +52,7 @@ def _export(scene, export_sets):
             maya_id = maya_id[0]
             fbx_name = '{}.{}.fbx'.format(root_beh.object.name, maya_id.get())
             fbx_name = fbx_name.replace(":", "_")
-            export_path = str(temp_dir.joinpath(fbx_name))
+            export_path = str(manifest.folder.joinpath(fbx_name))
 
             print("Exporting to {}".format(fbx_name))
             
@@ -75,8 +67,11 @@ def _export(scene, export_sets):
             #settings.up_axis = up_axis
 
             fbx.export_fbx(export_path, fbx.FbxFilterType.SELECTED, settings)
-        
-    cmd = "cg3dcasc.core.import_fbx()"
+            if os.path.exists(export_path):
+                manifest.add(export_path, transfer.FBX, maya_id.get(), root_beh.object.name.replace(":", "_"))
+
+    manifest.save()
+    cmd = f"cg3dcasc.core.transfer.set_manifest({str(manifest.path)!r}); cg3dcasc.core.import_fbx()"
     server.send_to_maya(common._active_port_number, cmd)
 
  
@@ -90,6 +85,7 @@ def create_new_set_and_export(scene):
     _export(scene, export_sets)
 
 
+@set_index.indexed
 def determine_export_action(scene):
     maya_sets = common.get_all_maya_set_ids()
     if maya_sets is None:
@@ -99,13 +95,8 @@ def determine_export_action(scene):
     all_sets, selected_sets = common.get_export_sets(scene)
     export_sets = selected_sets if selected_sets else all_sets
     
-    matches = set()
-    for export_set in export_sets:
-        maya_beh = export_set.get_behaviour_by_name(common.MAYA_BEHAVIOUR_NAME)
-        maya_id = maya_beh.datasWithSameNamesReadonly.get_by_name('maya_id')[0].get()
-
-        if maya_id in maya_sets:
-            matches.add(export_set)
+    matches = {export_set for maya_id, export_set in common.get_ids(export_sets).items()
+               if maya_id in maya_sets}
 
     title = ''
     message = ''
@@ -143,7 +134,6 @@ def determine_export_action(scene):
 
 def export_maya_animation():   
     scene = pycsc.get_current_scene().ds
-    _clean_export_location()
     determine_export_action(scene)
 
 
@@ -3,9 +3,6 @@
 
 import json
 #import typing
-import tempfile
-import os
-import pathlib
 #import uuid
 
 import common.hierarchy as hierarchy
@@ -19,7 +16,20 @@ import rig_mode.on as rm_on
 #from . import server
 
 from . import common
+from . import server
 from . import fbx
+from . import transfer
+from . import progress
+from . import trace
+from . import set_index
+
+
+SKIP_UNCHANGED = True
+"""Don't re-import export sets Maya flagged as unchanged since the last send"""
+
+BATCH_IMPORT = True
+"""Create every new set's Maya Data and load the textures in one scene edit,
+and only look for new roots around files that create a set"""
 
 
 
@@ -34,6 +44,15 @@ def _import_maya_qrig_file(file_path):
     
     
 def _get_object_by_id(object_list, maya_id):
+    index = set_index.current()
+    if index is not None:
+        obj = index.find(maya_id)
+        if obj is not None and obj in object_list:
+            print('found previous import')
+            return obj
+
+        return None
+
     for obj in object_list:
         beh = obj.get_behaviour_by_name(common.MAYA_BEHAVIOUR_NAME)
         if beh:
@@ -107,55 +126,108 @@ def _get_modified_filter(existing_data, qrig_path, import_filter: fbx.FbxFilterT
 
 
 
-def _load_textures(scene):
+def _clear_textures(container):
+    textures = container.texture_paths.get()
+    for texture in textures:
+        container.texture_paths.remove(texture)
+        
+        if hasattr(texture, 'id'):
+            container.de.delete_data(texture.id)
+        else:
+            try:
+                container.de.delete_data(texture)
+            except:
+                print("Couldn't delete {texture} when updating textures")
+
+
+def _read_texture_file(texture_path):
+    if not texture_path or not texture_path.exists():
+        return None
+
+    with open(texture_path) as texture_data:
+        return json.load(texture_data)
+
+
+def _texture_mod(manifest=None):
+    """The scene edit that loads Maya's textures, or None if there are none"""
+    folder = transfer.latest_folder() if manifest is None else transfer.EXPORT_ROOT
+
+    #A delta only lists what changed since Maya's last send, everything
+    #else is left as it is.
+    removed = []
+    delta = _read_texture_file(transfer.texture_file(manifest, folder, kind=transfer.TEXTURE_DELTA))
+    if delta is not None:
+        texture_mapping = delta.get('changed', {})
+        removed = delta.get('removed', [])
+    else:
+        texture_mapping = _read_texture_file(transfer.texture_file(manifest, folder)) or {}
+
+    if not texture_mapping and not removed:
+        return None
+
     def mod(scene):
-        temp_dir = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc'))
         #load any textures
-        texture_path: pathlib.Path = temp_dir.joinpath('texture_info.json')
-        if texture_path.exists():
-            texture_data = open(texture_path)
-            texture_mapping = json.load(texture_data)
-            texture_data.close()
-
-            names = list(texture_mapping.keys())
-            if not names:
-                return
-
-            objs = scene.get_scene_objects(names=names)
-            for obj in objs:
-                if not obj.has_behaviour('MeshObject'):
-                    print("Can't find MeshObject for {}".format(obj.name))
-                    continue
+        names = list(texture_mapping.keys())
+        objs = scene.get_scene_objects(names=names) if names else []
+        for obj in objs:
+            if not obj.has_behaviour('MeshObject'):
+                print("Can't find MeshObject for {}".format(obj.name))
+                continue
+
+            if not obj.has_behaviour('TextureContainer'):
+                obj.add_behaviour('TextureContainer')
+                obj.TextureContainer.start_frame.create_data('Start frame', csc.model.DataMode.Static, 0, group_name='maya_textures')
 
-                if not obj.has_behaviour('TextureContainer'):
-                    obj.add_behaviour('TextureContainer')
-                    obj.TextureContainer.start_frame.create_data('Start frame', csc.model.DataMode.Static, 0, group_name='maya_textures')
+            filenames = texture_mapping[obj.name]
+            container = obj.TextureContainer
+            _clear_textures(container)
 
-                filenames = texture_mapping[obj.name]
-                container = obj.TextureContainer
-                textures = container.texture_paths.get()
-                for texture in textures:
-                    container.texture_paths.remove(texture)
-                    
-                    if hasattr(texture, 'id'):
-                        container.de.delete_data(texture.id)
-                    else:
-                        try:
-                            container.de.delete_data(texture)
-                        except:
-                            print("Couldn't delete {texture} when updating textures")
+            #scene.su.generate_update()
+            for idx, filename in enumerate(filenames):
+                data_name = f"texture {idx}"
+                container.texture_paths.create_data(data_name, csc.model.DataMode.Static, filename, group_name='maya_textures')
 
-                #scene.su.generate_update()
-                for idx, filename in enumerate(filenames):
-                    data_name = f"texture {idx}"
-                    container.texture_paths.create_data(data_name, csc.model.DataMode.Static, filename, group_name='maya_textures')
 
+            obj.MeshObject.textures.set(obj.TextureContainer)
 
-                obj.MeshObject.textures.set(obj.TextureContainer)
-              
-    scene.edit("Load Textures", mod)
+        objs = scene.get_scene_objects(names=removed) if removed else []
+        for obj in objs:
+            if obj.has_behaviour('TextureContainer'):
+                _clear_textures(obj.TextureContainer)
 
+    return mod
 
+
+def _load_textures(scene, manifest=None):
+    mod = _texture_mod(manifest)
+    if mod is not None:
+        scene.edit("Load Textures", mod)
+
+
+def _create_sets(scene, new_sets, manifest=None, textures=False):
+    """Create the Maya Data of every new set, and load the textures, as one
+    undo step
+
+    Args:
+        new_sets (list) : (set_name, maya_id, new_roots) for each set.
+    """
+    texture_mod = _texture_mod(manifest) if textures else None
+    if not new_sets and texture_mod is None:
+        return
+
+    def mod(scene):
+        for set_name, maya_id, new_roots in new_sets:
+            common._create_data(scene, set_name, maya_id, new_roots)
+
+        if texture_mod is not None:
+            texture_mod(scene)
+
+    scene.edit('Import maya data', mod)
+
+
+@trace.traced('import_maya')
+@progress.tracked('Importing Maya Data')
+@set_index.indexed
 def _import_maya(new_scene, import_filter: fbx.FbxFilterType):
     if new_scene:
         scene = pycsc.new_scene().ds
@@ -163,88 +235,140 @@ def _import_maya(new_scene, import_filter: fbx.FbxFilterType):
         scene = pycsc.get_current_scene().ds
 
     scene.info("Importing Maya Data")
-    temp_dir = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc'))
-    if not temp_dir.exists():
+    manifest = transfer.take_manifest()
+    if manifest is None and not transfer.EXPORT_ROOT.exists():
         scene.error("Can't find Maya data")
         return
 
 
     #pre_import_roots will allow me to find everything that's new to the
     #scene once all files are imported.  scene_roots will be updated
-    #after each file import has been completed.
+    #after each file import has been completed.  When batching it's None
+    #once it's out of date, and only read again before a file that makes
+    #a new set.
     pre_import_roots = set(scene.get_scene_objects(only_roots=True))
     scene_roots = set(pre_import_roots)
+    new_sets = []
 
-    files = {}
-    for child in temp_dir.iterdir():
-        name, ext = child.name.rsplit('.', 1)
-        if name not in files:
-            files[name] = dict()
+    #The manifest lists exactly what Maya exported. Without one (an older
+    #Maya bridge, or a lost manifest) fall back to scanning the folder the
+    #last export went into.
+    if manifest is not None:
+        files = manifest.set_files()
+    else:
+        files = transfer.scan_folder(transfer.latest_folder())
 
-        files[name][ext.lower()] = str(child)
-        
     #up_axis = common.get_maya_coord_system()
     #if up_axis is None:
         #print("Couldn't get Maya's Up Axis. Is Maya Running? Export Failed")
         #return
 
     import_rig = ''
-    for key, item in files.items():
-        fbx_path = ''
-        qrig_path = ''
-        if 'fbx' in item:
-            fbx_path = item['fbx']
-        if 'qrigcasc' in item:
-            qrig_path = item['qrigcasc']
-
-        if not fbx_path and not qrig_path:
-            #we'll skip files that don't match the name.id format
-            #the texture file is an example of one of these files
-            continue
-
-        if qrig_path:
-            import_rig = qrig_path
-
-        set_name, maya_id = key.split('.') 
-        existing_data = _get_object_by_id(pre_import_roots, maya_id)
-        modified_filter = _get_modified_filter(existing_data, qrig_path, import_filter)
-
-        if modified_filter != fbx.FbxFilterType.SKIP:
-            #To-Do: Find a way to make this update the mesh for existing data
-            #
-            #if existing_data and modified_filter == fbx.FbxFilterType.MODEL:
-                ##selecting the existing data before importing a model should
-                ##just update the mesh...I think.
-                #root_beh = existing_data.get_behaviour_by_name(MAYA_ROOTS)
-                #roots = [beh.object for beh in root_beh.behaviours.get()]
-
-                #new_selection = []
-                #for root in roots:
-                    #new_selection.extend(common.hierarchy.get_object_branch_inclusive(root, root.scene.dom_scene))
-
-                #scene.edit('Change selection', lambda x: scene.select(new_selection))
-
-
-            settings = csc.fbx.FbxSettings()
-            #settings.up_axis = up_axis
-            fbx.import_fbx(fbx_path, modified_filter, False, settings)
-
-            current_roots = set(scene.get_scene_objects(only_roots=True))
-            new_roots = current_roots.difference(scene_roots)
-            scene_roots = current_roots               
-
-
-        #Let's find the stuff that was just imported and create a way
-        #to search for it later.
-        if existing_data is None and modified_filter != fbx.FbxFilterType.SKIP:
-            scene.edit('Import maya data', common._create_data, set_name, maya_id, new_roots)
+    resend_full_range = False
+    try:
+        for index, ((set_name, maya_id), item) in enumerate(files.items()):
+            progress.update(phase='import', item=set_name, done=index, total=len(files))
+            fbx_path = item.get(transfer.FBX, '')
+            qrig_path = item.get(transfer.QRIG, '')
+
+            if not fbx_path and not qrig_path:
+                continue
+
             if qrig_path:
-                _make_rig_info(scene, set_name, new_roots)
-        else:
-            scene.info("Updated existing data")
+                import_rig = qrig_path
+
+            existing_data = _get_object_by_id(pre_import_roots, maya_id)
+            modified_filter = _get_modified_filter(existing_data, qrig_path, import_filter)
+
+            #Maya reused its last export of this set, so there's nothing new in it.
+            if (SKIP_UNCHANGED and existing_data is not None and manifest is not None
+                    and manifest.is_unchanged(maya_id)):
+                print("Skipping unchanged {}".format(set_name))
+                modified_filter = fbx.FbxFilterType.SKIP
+
+            if modified_filter != fbx.FbxFilterType.SKIP:
+                #To-Do: Find a way to make this update the mesh for existing data
+                #
+                #if existing_data and modified_filter == fbx.FbxFilterType.MODEL:
+                    ##selecting the existing data before importing a model should
+                    ##just update the mesh...I think.
+                    #root_beh = existing_data.get_behaviour_by_name(MAYA_ROOTS)
+                    #roots = [beh.object for beh in root_beh.behaviours.get()]
+
+                    #new_selection = []
+                    #for root in roots:
+                        #new_selection.extend(common.hierarchy.get_object_branch_inclusive(root, root.scene.dom_scene))
+
+                    #scene.edit('Change selection', lambda x: scene.select(new_selection))
+
+
+                #Maya only baked the frames that changed, so only those should
+                #be replaced.
+                frame_range = None
+                if manifest is not None and modified_filter == fbx.FbxFilterType.ANIMATION:
+                    frame_range = manifest.frame_range(maya_id)
+                if frame_range:
+                    #FbxFilterType.FRAMES imports to the selected frames, and
+                    #Cascadeur's Python API has no call that selects them. The
+                    #FBX only holds those frames, so importing it as a whole
+                    #would wipe the keys around them.
+                    scene.error("Can't import frames {} to {} of {} on their own, skipping it".format(
+                        frame_range[0], frame_range[1], set_name))
+                    resend_full_range = True
+                    continue
 
+                creates_set = existing_data is None
+                if creates_set and scene_roots is None:
+                    scene_roots = set(scene.get_scene_objects(only_roots=True))
+
+                settings = csc.fbx.FbxSettings()
+                #settings.up_axis = up_axis
+                fbx.import_fbx(fbx_path, modified_filter, False, settings)
+
+                if creates_set or not BATCH_IMPORT:
+                    current_roots = set(scene.get_scene_objects(only_roots=True))
+                    new_roots = current_roots.difference(scene_roots)
+                    scene_roots = current_roots
+                else:
+                    scene_roots = None
+
+
+            #Let's find the stuff that was just imported and create a way
+            #to search for it later.
+            if existing_data is None and modified_filter != fbx.FbxFilterType.SKIP:
+                if not BATCH_IMPORT:
+                    scene.edit('Import maya data', common._create_data, set_name, maya_id, new_roots)
+                    if qrig_path:
+                        _make_rig_info(scene, set_name, new_roots)
+                else:
+                    new_sets.append((set_name, maya_id, new_roots))
+                    if qrig_path:
+                        #the rig info takes every joint in the scene, so it can't
+                        #wait for the files after this one
+                        pending, new_sets = new_sets, []
+                        _create_sets(scene, pending)
+                        _make_rig_info(scene, set_name, new_roots)
+            else:
+                scene.info("Updated existing data")
+    except BaseException:
+        #whatever was imported has to be findable, or the next update
+        #brings it in again as new sets
+        if BATCH_IMPORT:
+            _create_sets(scene, new_sets)
+        raise
+
+
+    progress.update(phase='textures', item='', done=len(files))
+    if BATCH_IMPORT:
+        _create_sets(scene, new_sets, manifest, textures=True)
+    else:
+        _load_textures(scene, manifest)
 
-    _load_textures(scene)
+    if resend_full_range:
+        #Maya stops sending partial ranges, changed sets come in whole from now on
+        scene.warning("Asking Maya for the whole animation instead")
+        server.send_to_maya(common.get_active_port(),
+                            "cg3dcasc.core.anim_range.PARTIAL = False; cg3dcasc.core.update_animations()")
 
 
     #rig generation has to come last, so all the other automation can complete properly
@@ -253,6 +377,7 @@ def _import_maya(new_scene, import_filter: fbx.FbxFilterType):
     #the textures have been assigned.  Once I can import rigs via script (without ui interaction)
     #this can stay inside the file loop and we can move the texture loading to the end.
     if import_rig:
+        progress.update(phase='rig')
         print("attempting rig import")
         _import_maya_qrig_file(import_rig)
 
@@ -279,4 +404,4 @@ def smart_import():
     
 def update_textures():
     scene = pycsc.get_current_scene().ds
-    _load_textures(scene)
\ No newline at end of file
+    _load_textures(scene, transfer.take_manifest())
@@ -0,0 +1,312 @@
+"""A kept-alive connection to Maya's command port
+
+wingcarrier's MayaPigeon connects to the command port for every
+can_dispatch() and send_python_command(), and send_to_maya() used to probe
+the port with a connection of its own first, so each command cost three
+TCP handshakes. Maya's commandPort keeps a connection open for as many
+commands as it's sent, so a Session connects once per port and everything
+goes over that one socket.
+
+Before a socket is reused it's checked: anything Maya wrote back (it
+answers every command unless the port was opened with noreturn) is read
+off, and a socket Maya closed, or that sat idle longer than IDLE_SECONDS,
+is replaced with a new connection.
+
+Commands sent back to back on one session can reach Maya as one chunk,
+e.g. 'a0=0' and 'a1=1' arrive as two lines of one read, and Maya runs a
+chunk as a single script. If one
+command in it raises, the ones sent after it in the same chunk don't run.
+Commands that must run even if an earlier one fails should be wrapped in
+their own try/except, or wait for the earlier command's reply first.
+
+CommandPortStandIn listens the way Maya's commandPort does, so sessions
+and pigeons can be used without Maya running:
+
+    stand_in = maya_port.CommandPortStandIn()
+    maya_port.send(stand_in.port, "print('hello')")
+    stand_in.close()
+"""
+
+import select
+import socket
+import threading
+import time
+
+import wingcarrier.pigeons
+
+from . import trace
+
+
+HOST = '127.0.0.1'
+TIMEOUT_SECONDS = 0.5
+
+IDLE_SECONDS = 30.0
+"""Sockets unused for longer than this are reconnected rather than trusted"""
+
+BUFFER_SIZE = 4096
+RESULT_TERMINATOR = b'\n\x00'
+"""What Maya's commandPort writes after each command's result"""
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _encode(command_string):
+    #commands that arrive together are run together, so keep them apart
+    if not command_string.endswith('\n'):
+        command_string += '\n'
+
+    return wingcarrier.pigeons.MayaPigeon.encode(command_string)
+
+
+class Session(object):
+    """One kept-alive connection to a command port"""
+
+    def __init__(self, port, host=HOST):
+        self.port = int(port)
+        self.host = host
+        self._sock = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+
+    def __repr__(self):
+        state = 'connected' if self._sock is not None else 'closed'
+        return f"Session({self.host}:{self.port}, {state})"
+
+
+    def _connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=TIMEOUT_SECONDS)
+        except OSError:
+            return None
+
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        trace.count('command_port_connects')
+        return sock
+
+
+    def _healthy(self):
+        """Read off Maya's replies and return False if the socket's unusable"""
+        if time.monotonic() - self._last_used > IDLE_SECONDS:
+            return False
+
+        try:
+            while select.select([self._sock], [], [], 0)[0]:
+                if not self._sock.recv(BUFFER_SIZE):
+                    return False
+        except (OSError, ValueError):
+            return False
+
+        return True
+
+
+    def _socket(self):
+        """The connected socket, reconnecting if it's gone. Hold the lock."""
+        if self._sock is not None and not self._healthy():
+            self._close()
+
+        if self._sock is None:
+            self._sock = self._connect()
+
+        self._last_used = time.monotonic()
+        return self._sock
+
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+
+            self._sock = None
+
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+    def is_open(self):
+        """True if Maya is listening on the port. The connection is kept."""
+        with self._lock:
+            return self._socket() is not None
+
+
+    def send(self, command_string):
+        """Send a python command, reconnecting once if the socket was dropped
+
+        True only means the bytes were sent. The command can still share a
+        chunk with the one before it, see the module docs.
+
+        Returns:
+            bool : True if the command was sent.
+        """
+        data = _encode(command_string)
+        with self._lock:
+            for attempt in range(2):
+                sock = self._socket()
+                if sock is None:
+                    return False
+
+                try:
+                    sock.sendall(data)
+                    return True
+                except OSError as e:
+                    if attempt:
+                        print(f"Maya socket errored: {e}")
+                    self._close()
+
+        return False
+
+
+
+def session(port, host=HOST):
+    """The shared session for a command port"""
+    key = (host, int(port))
+    with _sessions_lock:
+        port_session = _sessions.get(key)
+        if port_session is None:
+            port_session = _sessions[key] = Session(port, host)
+
+    return port_session
+
+
+def is_open(port, host=HOST):
+    return session(port, host).is_open()
+
+
+def send(port, command_string, host=HOST):
+    return session(port, host).send(command_string)
+
+
+def close_all():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+
+    for port_session in sessions:
+        port_session.close()
+
+
+
+class MayaPigeon(wingcarrier.pigeons.MayaPigeon):
+    """wingcarrier's MayaPigeon sending over the shared session
+
+    send(), Wing's entry point, still connects for itself since it closes
+    the socket it's given.
+    """
+
+    def can_dispatch(self):
+        return is_open(self.command_port, self.host)
+
+
+    def send_python_command(self, command_string):
+        if send(self.command_port, command_string, self.host):
+            return True
+
+        print("Can't connect to Maya!")
+        return False
+
+
+
+class CommandPortStandIn(object):
+    """Listens like Maya's commandPort(sourceType='python')
+
+    Every connection can send any number of commands. Each chunk that's
+    read is run with handler(command_string), which defaults to exec() in a
+    namespace of the stand in's own, and is answered with the result and
+    RESULT_TERMINATOR. Commands are also kept in .commands, in order.
+
+    Args:
+        noreturn (bool) : don't answer, like commandPort(noreturn=True).
+    """
+
+    def __init__(self, handler=None, host=HOST, port=0, noreturn=False):
+        self.handler = handler
+        self.noreturn = noreturn
+        self.commands = []
+        self.connections = 0
+        self.namespace = {}
+        self._closed = False
+        self._clients = []
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind((host, port))
+        self._sock.listen(5)
+        self.host, self.port = self._sock.getsockname()[:2]
+
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+
+    def _run(self, command_string):
+        if self.handler is not None:
+            return self.handler(command_string)
+
+        exec(command_string, self.namespace)
+        return None
+
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+
+            self.connections += 1
+            self._clients.append(conn)
+            threading.Thread(target=self._client_loop, args=(conn,), daemon=True).start()
+
+
+    def _client_loop(self, conn):
+        with conn:
+            while not self._closed:
+                try:
+                    data = conn.recv(BUFFER_SIZE)
+                except OSError:
+                    return
+
+                if not data:
+                    return
+
+                command_string = wingcarrier.pigeons.MayaPigeon.decode(data)
+                self.commands.append(command_string)
+                try:
+                    result = self._run(command_string)
+                except Exception as e:
+                    result = f"Error: {e}"
+
+                if not self.noreturn:
+                    try:
+                        conn.sendall(str('' if result is None else result).encode('utf-8') + RESULT_TERMINATOR)
+                    except OSError:
+                        return
+
+
+    def drop_connections(self):
+        """Close every client connection, as if Maya closed and reopened the port"""
+        for conn in self._clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+
+        self._clients = []
+
+
+    def close(self):
+        self._closed = True
+        self.drop_connections()
+        try:
+            #wakes the accept loop up, close() alone leaves it listening
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        try:
+            self._sock.close()
+        except OSError:
+            pass
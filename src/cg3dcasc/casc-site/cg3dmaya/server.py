@@ -1,10 +1,12 @@
 import socket
-import json
 import struct
 
 
 import pycsc
 
+from . import channel
+from . import codec
+
 HOST = '127.0.0.1'
 PORT = 0 #this makes the port dynamic
 TIMEOUT_SECONDS = 0.5
@@ -15,45 +17,21 @@ def is_port_open(host, port, timeout=0.5):
     """
     Checks if a given port on a host is open.
 
-    Args:
-        host (str): The IP address or hostname of the target.
-        port (int): The port number to check.
-        timeout (int): The timeout in seconds for the connection attempt.
+    The check goes through maya_port's kept-alive session, so the connection
+    it makes is reused by the next send_to_maya(). timeout is ignored, the
+    session uses maya_port.TIMEOUT_SECONDS.
 
     Returns:
         bool: True if the port is open, False otherwise.
     """
-    try:
-        # Create a new socket
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # Set a timeout for the connection attempt
-        s.settimeout(timeout)
-        # Attempt to connect to the host and port
-        result = s.connect_ex((host, port))
-        # If connect_ex returns 0, the connection was successful, meaning the port is open
-        if result == 0:
-            return True
-        else:
-            return False
-    except socket.error as e:
-        # Handle potential socket errors (e.g., host not found)
-        print(f"Socket error: {e}")
-        return False
-    finally:
-        # Close the socket in all cases
-        s.close()
+    from . import maya_port
+    return maya_port.is_open(port, host)
 
 
 
 def receive_all(sock, n):
     """Helper function to ensure all 'n' bytes are received."""
-    data = b''
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
-            return None
-        data += packet
-    return data
+    return codec.receive_into(sock, n)
 
 
 def handle_client(conn, addr):
@@ -75,14 +53,14 @@ def handle_client(conn, addr):
             print("Client disconnected while sending data.")
             return
 
-        # 3. Decode the JSON message.
-        #    Note: The decode('utf-8') is crucial for converting bytes to string.
-        data = json.loads(json_data.decode('utf-8'))
+        # 3. Decode the message. Plain JSON from older versions is still
+        #    understood, see codec.decode().
+        data = codec.decode(json_data)
         print("Received JSON data:")
         print(data)
         success = True
 
-    except (socket.error, json.JSONDecodeError) as e:
+    except (socket.error, ValueError) as e:
         print(f"Error handling client {addr}: {e}")
     finally:
         conn.close()
@@ -91,21 +69,23 @@ def handle_client(conn, addr):
         
 
 def send_to_maya(maya_command_port, cmd):
-    """Send a command to maya using wingcarrier
+    """Send a command to maya over a kept-alive command port connection
     
     import cg3dcasc.core is added to all commands
     """
     global HOST
-    import wingcarrier.pigeons
+    from . import maya_port
 
-    if not is_port_open(HOST, maya_command_port):
+    #the probe's connection is kept and the command goes over it
+    maya = maya_port.MayaPigeon()
+    maya.host = HOST
+    maya.command_port = maya_command_port
+    if not maya.can_dispatch():
         scene = pycsc.get_current_scene().ds
         scene.error("Couldn't find Maya.  Please Connect to Cascadeur from Maya.")
         return False
          
     cmd = f"import cg3dcasc.core; {cmd};"
-    maya = wingcarrier.pigeons.MayaPigeon()
-    maya.command_port = maya_command_port
     maya.send_python_command(cmd)
 
     return True
@@ -118,6 +98,12 @@ def send_and_listen(maya_command_port, cmd):
     if maya_command_port == -1:
         return (success, data)
 
+    #Maya runs the command on its end of the channel and the data comes
+    #back in the response, no listening socket or script delay needed.
+    result = channel.request(cmd, TIMEOUT_SECONDS)
+    if result is not None:
+        return result
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         s.bind((HOST, PORT))
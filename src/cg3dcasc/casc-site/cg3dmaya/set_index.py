@@ -0,0 +1,130 @@
+"""An export set index built once per operation
+
+Finding an export set by its maya_id, or the set a root belongs to, meant
+reading the behaviours of every set (or every scene root) each time, and an
+import does that once per file. Inside an operation these lookups are
+answered from an ExportSetIndex instead, which reads every 'Maya Data'
+behaviour once the first time it's needed:
+
+    @set_index.indexed
+    def _import_maya(...):
+        ...
+        export_set = set_index.get(scene).find(maya_id)
+
+The index is thrown away when the outermost operation ends. Code that
+creates export sets, changes their ids or roots inside an operation should
+call invalidate().
+"""
+
+import contextlib
+import functools
+
+import pycsc
+
+from . import common
+
+
+_index = None
+_depth = 0
+
+
+class ExportSetIndex(object):
+    """Every export set's maya_id and roots, and the reverse lookups"""
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.sets = set()
+        self.id_sets = {}
+        self.set_ids = {}
+        self.set_roots = {}
+        self.root_sets = {}
+
+        for behaviour in scene.get_behaviours(common.MAYA_BEHAVIOUR_NAME):
+            export_set = behaviour.object
+            self.sets.add(export_set)
+
+            maya_id = behaviour.datasWithSameNamesReadonly.get_by_name('maya_id')
+            if maya_id:
+                maya_id = maya_id[0].get()
+                self.id_sets[maya_id] = export_set
+                self.set_ids[export_set] = maya_id
+
+            roots_behaviour = export_set.get_behaviour_by_name(common.MAYA_ROOTS)
+            roots = {b.object for b in roots_behaviour.behaviours.get()} if roots_behaviour else set()
+            self.set_roots[export_set] = roots
+            for root in roots:
+                self.root_sets[root] = export_set
+
+
+    def find(self, maya_id):
+        """The export set with maya_id, or None"""
+        return self.id_sets.get(maya_id)
+
+
+    def ids(self, export_sets):
+        """Same shape as common.get_ids()"""
+        return {self.set_ids[s]: s for s in export_sets if s in self.set_ids}
+
+
+    def roots(self, export_set):
+        return set(self.set_roots.get(export_set, ()))
+
+
+    def assigned_roots(self):
+        """Every root that belongs to an export set"""
+        return set(self.root_sets)
+
+
+    def owner(self, root):
+        """The export set root belongs to, or None"""
+        return self.root_sets.get(root)
+
+
+
+def current(scene=None):
+    """Return the index to answer lookups with, or None outside an operation"""
+    global _index
+
+    if not _depth:
+        return None
+
+    if _index is None:
+        _index = ExportSetIndex(scene if scene is not None else pycsc.get_current_scene().ds)
+
+    return _index
+
+
+def get(scene):
+    """The operation's index, or a fresh one outside an operation"""
+    index = current(scene)
+    return index if index is not None else ExportSetIndex(scene)
+
+
+def invalidate(*args):
+    """Forget the index, the next lookup rebuilds it"""
+    global _index
+    _index = None
+
+
+@contextlib.contextmanager
+def operation():
+    """Share one index between every lookup made inside the block"""
+    global _depth
+
+    _depth += 1
+    try:
+        yield
+    finally:
+        _depth -= 1
+        if not _depth:
+            invalidate()
+
+
+def indexed(func):
+    """Decorator that runs func inside an operation()"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with operation():
+            return func(*args, **kwargs)
+
+    return wrapper
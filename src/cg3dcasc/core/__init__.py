@@ -9,4 +9,16 @@ from . import utils
 from . import hik
 from . import client
 from . import command_port
+from . import codec
+from . import transfer
+from . import export_cache
+from . import batch_export
+from . import scene_index
+from . import hierarchy
+from . import texture_sync
+from . import progress
+from . import trace
+from . import casc_process
+from . import anim_range
+from . import channel
 from . import server
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""Work out which frames of an export set's animation changed
+
+update_animations() normally bakes and sends the whole playback range. When
+an animator has only touched a few frames of a long shot, dirty_range()
+compares the keys on the set's anim curves with the keys that were last
+sent and returns just the frames that changed. Editing a key changes the
+curve between its neighbours, so the range is widened out to the
+neighbouring keys on both sides.
+"""
+
+import maya.cmds as cmds
+
+
+DIRTY = 'dirty'
+"""Pass as a frame_range to export only the frames that changed"""
+
+UNCHANGED = 'unchanged'
+"""dirty_range()'s answer when none of the set's keys changed"""
+
+PARTIAL = True
+"""Send only the frames that changed. Cascadeur turns this off when it
+can't import part of a range, then changed sets are sent whole and
+unchanged ones are still skipped."""
+
+_sent_keys = {}
+
+
+def _curves(node_names):
+    if not node_names:
+        return []
+
+    curves = cmds.listConnections(node_names, type='animCurve', source=True, destination=False) or []
+    return sorted(set(curves))
+
+
+def get_keys(node_names):
+    """Return {curve: [(time, value, in angle, out angle), ...]}"""
+    keys = {}
+    for curve in _curves(node_names):
+        times = cmds.keyframe(curve, query=True, timeChange=True) or []
+        values = cmds.keyframe(curve, query=True, valueChange=True) or []
+        in_angles = cmds.keyTangent(curve, query=True, inAngle=True) or [0.0] * len(times)
+        out_angles = cmds.keyTangent(curve, query=True, outAngle=True) or [0.0] * len(times)
+        keys[curve] = list(zip(times, values, in_angles, out_angles))
+
+    return keys
+
+
+def _changed_times(old_keys, new_keys):
+    old_lookup = {key[0]: key for key in old_keys}
+    new_lookup = {key[0]: key for key in new_keys}
+    changed = [time for time in set(old_lookup) | set(new_lookup)
+               if old_lookup.get(time) != new_lookup.get(time)]
+    if not changed:
+        return None
+
+    #widen to the neighbouring keys, the curve between them moved too.
+    all_times = sorted(set(old_lookup) | set(new_lookup))
+    first = all_times.index(min(changed))
+    last = all_times.index(max(changed))
+    return (all_times[max(0, first - 1)], all_times[min(len(all_times) - 1, last + 1)])
+
+
+def dirty_range(set_id, node_names):
+    """Return the (start, end) frames that changed since remember()
+
+    Returns:
+        UNCHANGED when no key changed, so the set doesn't need sending. None
+        when the whole range should be sent: nothing was remembered for the
+        set yet, or curves were added or removed.
+    """
+    old_keys = _sent_keys.get(set_id)
+    if old_keys is None:
+        return None
+
+    new_keys = get_keys(node_names)
+    if set(old_keys) != set(new_keys):
+        return None
+
+    start = end = None
+    for curve, keys in new_keys.items():
+        changed = _changed_times(old_keys[curve], keys)
+        if changed is None:
+            continue
+
+        start = changed[0] if start is None else min(start, changed[0])
+        end = changed[1] if end is None else max(end, changed[1])
+
+    if start is None:
+        return UNCHANGED
+
+    if not PARTIAL:
+        return None
+
+    #never bake outside the playback range, that's all Cascadeur has.
+    range_start = cmds.playbackOptions(query=True, animationStartTime=True)
+    range_end = cmds.playbackOptions(query=True, animationEndTime=True)
+    start = max(range_start, start)
+    end = min(range_end, end)
+    if start > end:
+        #only keys outside the playback range changed, Cascadeur never had them
+        return UNCHANGED
+
+    return (int(start), int(end + 0.999))
+
+
+def remember(set_id, node_names):
+    """Record the keys that were just sent for the set"""
+    _sent_keys[set_id] = get_keys(node_names)
+
+
+def reset():
+    _sent_keys.clear()
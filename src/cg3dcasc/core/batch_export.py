@@ -0,0 +1,182 @@
+"""Export many export sets at once with headless mayapy workers
+
+casc_export.export() normally selects and exports each export set one after
+another in the artist's session. With ENABLED (or export(batch=True)) the
+scene is saved to a snapshot instead and the sets are handed out to a pool
+of mayapy processes that each open the snapshot and export their share.
+The FBX files land in the same transfer folder and the serial path picks up
+any set a worker couldn't export. The workers run batch_worker.py, which
+doesn't import this package.
+
+Starting mayapy takes a few seconds, so this only pays off once there are
+several sets, see MIN_SETS.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import concurrent.futures
+
+from . import fbx
+
+
+ENABLED = False
+"""Off by default, the serial export stays the normal path"""
+
+MIN_SETS = 3
+"""Fewer sets than this are exported serially even when batching"""
+
+WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+WORKER_TIMEOUT = 600
+
+SNAPSHOT_NAME = 'snapshot.mb'
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'batch_worker.py')
+
+
+def get_mayapy():
+    """Return the path to mayapy, or '' if it can't be found"""
+    maya_location = os.getenv('MAYA_LOCATION', '')
+    if not maya_location:
+        return ''
+
+    name = 'mayapy.exe' if sys.platform.startswith('win') else 'mayapy'
+    mayapy = os.path.join(maya_location, 'bin', name)
+    return mayapy if os.path.exists(mayapy) else ''
+
+
+def make_job(set_id, name, nodes, fbx_path, bake, include_children, frame_range=None, profile=None):
+    """Describe one export set for a worker
+
+    Args:
+        set_id (str) : the export set's cscDataId.
+        name (str) : the export set's name.
+        nodes (list) : long names of everything that's selected for export.
+        fbx_path : where the FBX should be written.
+        bake (bool) : bake animations.
+        include_children (bool) : let the exporter pull in children.
+        frame_range : (start, end) to bake instead of the playback range.
+        profile (str) : the fbx.PROFILES name to export with.
+
+    The exporter options are worked out here, in the artist's session, and
+    sent to the worker as MEL commands.
+    """
+    export_profile = fbx._export_profile(fbx.EXPORT_ANIM_RIG, bake, False, include_children,
+                                         frame_range, profile)
+    return {
+        'set_id': set_id,
+        'name': name,
+        'nodes': list(nodes),
+        'fbx_path': str(fbx_path),
+        'bake': bake,
+        'include_children': include_children,
+        'frame_range': list(frame_range) if frame_range else None,
+        'profile': profile,
+        'mel': fbx.mel_commands(export_profile),
+    }
+
+
+def _save_snapshot(folder):
+    import maya.cmds as cmds
+
+    snapshot = os.path.join(folder, SNAPSHOT_NAME)
+    cmds.file(snapshot, exportAll=True, type='mayaBinary', force=True,
+              preserveReferences=False)
+    return snapshot
+
+
+def _worker_env():
+    env = dict(os.environ)
+    #the workers mustn't open command ports or bridge channels of their own.
+    env['MAYA_SKIP_USERSETUP_PY'] = '1'
+    return env
+
+
+def _run_worker(mayapy, work_path, result_path):
+    proc = subprocess.run([mayapy, WORKER_SCRIPT, work_path, result_path], env=_worker_env(),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          timeout=WORKER_TIMEOUT,
+                          creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+
+    if proc.returncode:
+        print(f"Export worker failed with code {proc.returncode}:\n{proc.stderr.decode(errors='replace')}")
+
+    if not os.path.exists(result_path):
+        return {}
+
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def export_sets(jobs, workers=None):
+    """Export every job with a pool of mayapy workers
+
+    Args:
+        jobs (list) : dicts from make_job().
+        workers (int) : how many mayapy processes to run. Defaults to WORKERS.
+
+    Returns:
+        dict : {set_id: {'ok': bool, 'seconds': float, 'error': str}} for
+        every job a worker got through. Missing ids should be exported
+        serially. None if the batch couldn't run at all.
+    """
+    mayapy = get_mayapy()
+    if not mayapy:
+        print("Can't find mayapy, exporting serially")
+        return None
+
+    import maya.cmds as cmds
+
+    workers = max(1, min(workers or WORKERS, len(jobs)))
+    folder = tempfile.mkdtemp(prefix='mayacasc_batch_')
+    start_time = time.perf_counter()
+    results = {}
+    try:
+        snapshot = _save_snapshot(folder)
+        frame_range = [cmds.playbackOptions(query=True, animationStartTime=True),
+                       cmds.playbackOptions(query=True, animationEndTime=True)]
+        up_axis = cmds.upAxis(query=True, axis=True)
+        snapshot_seconds = time.perf_counter() - start_time
+
+        processes = []
+        for index in range(workers):
+            work_path = os.path.join(folder, f"work_{index}.json")
+            result_path = os.path.join(folder, f"result_{index}.json")
+            with open(work_path, 'w') as f:
+                json.dump({'scene': snapshot, 'range': frame_range, 'up_axis': up_axis,
+                           'jobs': jobs[index::workers]}, f)
+
+            processes.append((work_path, result_path))
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            futures = [pool.submit(_run_worker, mayapy, *paths) for paths in processes]
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results.update(future.result())
+                except (OSError, ValueError, subprocess.SubprocessError) as e:
+                    print(f"Export worker failed: {e}")
+
+    except (OSError, RuntimeError) as e:
+        print(f"Batch export failed, exporting serially: {e}")
+        return None
+
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print(f"Batch exported {len(results)}/{len(jobs)} sets with {workers} workers "
+          f"in {time.perf_counter() - start_time:.2f}s (snapshot {snapshot_seconds:.2f}s)")
+    for job in jobs:
+        result = results.get(job['set_id'])
+        if result is None:
+            print(f"    {job['name']}: not exported")
+        elif result['ok']:
+            print(f"    {job['name']}: {result['seconds']:.2f}s")
+        else:
+            print(f"    {job['name']}: failed {result['error']}")
+
+    return results
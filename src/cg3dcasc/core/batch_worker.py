@@ -0,0 +1,152 @@
+"""The mayapy side of batch_export
+
+batch_export starts mayapy with this file as its script:
+
+    mayapy batch_worker.py work.json result.json
+
+It's run by path and never imports cg3dcasc. Importing the package pulls in
+pymel and utils.py, which asks for Maya's main progress bar, and neither
+belongs in a headless worker. Everything a job needs comes in the work
+file, including the exporter's options as MEL commands (see
+fbx.mel_commands()), so only maya.cmds and maya.mel are used.
+
+MayaStandIn takes Maya's place (and pymel's, which the worker doesn't use),
+so a worker's share can be run without Maya:
+
+    stand_in = batch_worker.MayaStandIn()
+    batch_worker.run_worker(work_path, result_path, stand_in)
+    stand_in.commands    #every MEL command the exporter was sent
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+
+class MayaScene(object):
+    """What a worker needs from Maya, through maya.cmds and maya.mel"""
+
+    def __init__(self):
+        import maya.standalone
+        maya.standalone.initialize()
+
+        import maya.cmds
+        import maya.mel
+        self.cmds = maya.cmds
+        self._mel = maya.mel
+
+
+    def open(self, scene_path, up_axis, frame_range):
+        self.cmds.file(scene_path, open=True, force=True)
+        if not self.cmds.pluginInfo('fbxmaya', query=True, loaded=True):
+            self.cmds.loadPlugin('fbxmaya')
+
+        self.cmds.upAxis(axis=up_axis, rotateView=False)
+        self.cmds.playbackOptions(animationStartTime=frame_range[0], animationEndTime=frame_range[1])
+
+
+    def select(self, nodes):
+        self.cmds.select(nodes, replace=True)
+
+
+    def mel(self, command):
+        self._mel.eval(command)
+
+
+
+class MayaStandIn(object):
+    """Answers like MayaScene without Maya
+
+    Every MEL command is kept in .commands. FBXExport writes a small text
+    file listing the selection, so results can be checked on disk.
+
+    Args:
+        nodes (set) : the nodes that exist, selecting anything else raises
+        ValueError like cmds.select(). Defaults to allowing every node.
+    """
+
+    _EXPORT = re.compile(r'FBXExport\s+-s\s+-f\s+"(.*)"')
+
+    def __init__(self, nodes=None):
+        self.nodes = nodes
+        self.scene = None
+        self.up_axis = None
+        self.frame_range = None
+        self.selection = []
+        self.commands = []
+
+
+    def open(self, scene_path, up_axis, frame_range):
+        self.scene = scene_path
+        self.up_axis = up_axis
+        self.frame_range = list(frame_range)
+
+
+    def select(self, nodes):
+        missing = [node for node in nodes if self.nodes is not None and node not in self.nodes]
+        if missing:
+            raise ValueError(f"No object matches name: {missing[0]}")
+
+        self.selection = list(nodes)
+
+
+    def mel(self, command):
+        self.commands.append(command)
+        match = self._EXPORT.match(command)
+        if match:
+            with open(match.group(1), 'w') as f:
+                f.write('\n'.join(self.selection))
+
+
+
+def _export_command(fbx_path):
+    return 'FBXExport -s -f "{}"'.format(str(fbx_path).replace('\\', '/'))
+
+
+def run_job(maya, job):
+    """Export one job's selection
+
+    Returns:
+        dict : 'ok', 'seconds' and 'error' for the job.
+    """
+    start_time = time.perf_counter()
+    error = ''
+    try:
+        maya.select(job['nodes'])
+        maya.mel('FBXResetExport')
+        for command in job['mel']:
+            maya.mel(command)
+
+        maya.mel(_export_command(job['fbx_path']))
+    except Exception as e:
+        error = str(e)
+
+    return {
+        'ok': not error and os.path.exists(job['fbx_path']),
+        'seconds': time.perf_counter() - start_time,
+        'error': error,
+    }
+
+
+def run_worker(work_path, result_path, maya=None):
+    """Export a share of the jobs and write {set_id: result} to result_path"""
+    with open(work_path) as f:
+        work = json.load(f)
+
+    if maya is None:
+        maya = MayaScene()
+
+    maya.open(work['scene'], work['up_axis'], work['range'])
+    results = {job['set_id']: run_job(maya, job) for job in work['jobs']}
+
+    with open(result_path, 'w') as f:
+        json.dump(results, f)
+
+    return results
+
+
+
+if __name__ == '__main__':
+    run_worker(sys.argv[1], sys.argv[2])
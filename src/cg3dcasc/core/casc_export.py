@@ -1,14 +1,11 @@
 
 import json
-import tempfile
-import os
 import pathlib
 import time
 
 import pymel.core as pm
 from . import hik
 
-import wingcarrier.pigeons
 import cg3dguru.udata
 #import cg3dguru.animation.fbx as fbx
 
@@ -22,23 +19,26 @@ from . import common
 from . import casc_qrt
 from . import fbx
 from . import materials
+from . import transfer
+from . import export_cache
+from . import batch_export
+from . import scene_index
+from . import hierarchy
+from . import texture_sync
+from . import anim_range
+from . import progress
+from . import trace
+from . import casc_process
 
 
 def get_root_parent(input_transform):
     """Returns the highest level transform node for the given input transform"""
-    parent = input_transform.getParent()
-    if parent:
-        return get_root_parent(parent)
-    else:
-        return input_transform
+    return pm.PyNode(hierarchy.root_path(input_transform.longName()))
     
     
 def add_transform_roots(transform_list, root_set):
     """Find the top level parent of each item in the list and add it to the set"""
-    for dag in transform_list:
-        root_parent = get_root_parent(dag)
-        if root_parent not in root_set:
-            root_set.add(root_parent)
+    root_set.update(hierarchy.roots(transform_list))
 
 
 def get_export_branches(root_transforms, *content_sets):
@@ -67,37 +67,30 @@ def get_export_branches(root_transforms, *content_sets):
     if not content:
         return set()
 
-    branch = set(content)
-
-    #ancestors: walk up from each item to its root. Branches that don't lead
-    #to content never get walked, which is what trims them.
-    for node in content:
-        current = node.getParent()
-        while current is not None and current not in branch:
-            branch.add(current)
+    #Mesh content is a shape node, which has no children of its own, so its
+    #descendants are walked from its transform instead.
+    shapes = [node for node in content if isinstance(node, pm.nodetypes.Shape)]
+    others = [node for node in content if not isinstance(node, pm.nodetypes.Shape)]
 
-            #Every root_transform is parentless by construction, so this is
-            #really just an early out. It's here so the roots read as an
-            #explicit boundary.
-            if current in root_transforms:
-                break
+    snapshot = hierarchy.Snapshot()
+    shape_paths = snapshot.add(shapes)
+    other_paths = snapshot.add(others)
+    content_paths = set(shape_paths) | set(other_paths)
 
-            current = current.getParent()
+    #ancestors: every path already names its ancestors up to the root.
+    #Branches that don't lead to content never show up, which is what trims
+    #them. The roots are the first part of each path, so they're the
+    #boundary without any extra checks.
+    branch = content_paths | snapshot.ancestor_closure(content_paths)
 
     #descendants: anything under our content comes along for the ride, so a
-    #skeleton stays whole below the joints that are actually skinned. Mesh
-    #content is a shape node, which has no children of its own, so seed the
-    #walk with its transform instead.
-    seeds = set()
-    for node in content:
-        if isinstance(node, pm.nodetypes.Shape):
-            seeds.add( node.getParent() )
-        else:
-            seeds.add(node)
+    #skeleton stays whole below the joints that are actually skinned.
+    seeds = {hierarchy.parent_path(path) or path for path in shape_paths}
+    seeds.update(other_paths)
+    snapshot.load_descendants(seeds)
+    branch.update(snapshot.descendant_closure(seeds))
 
-    branch.update( pm.listRelatives(list(seeds), allDescendents=True) or [] )
-
-    return branch
+    return hierarchy.to_nodes(branch)
 
 
 
@@ -149,9 +142,40 @@ def get_exportable_content(export_data):
 
     
 
-def _export_data(export_data, export_folder: pathlib.Path, export_rig: bool, export_fbx: bool):
+def _record_fbx(manifest, fbx_file_path, file_id, node_name, digest, cached=None, frame_range=None):
+    """Add a written FBX to the manifest and the export cache"""
+    if not fbx_file_path.exists():
+        return
+
+    #counted without reporting, a cancel here would skip the clean up after
+    #the export.
+    operation = progress.current()
+    if operation is not None:
+        operation.bytes += fbx_file_path.stat().st_size
+
+    sha1 = cached.get('sha1') if cached else transfer.file_hash(fbx_file_path)
+    if manifest is not None:
+        extra = {'frame_range': list(frame_range)} if frame_range else {}
+        manifest.add(fbx_file_path, transfer.FBX, file_id, node_name,
+                     sha1=sha1, unchanged=bool(cached), **extra)
+    if not cached:
+        export_cache.store(file_id, digest, fbx_file_path, sha1)
+
+
+@trace.traced('export_data')
+def _export_data(export_data, export_folder: pathlib.Path, export_rig: bool, export_fbx: bool, manifest=None, batch_jobs=None,
+                 frame_range=None, anim_nodes=None, profile=None):
     #When export_fbx and export_rig are both false then this function is
     #still useful as it will still returns a list of exportable_content
+    #
+    #When batch_jobs is a list, sets that need exporting are added to it
+    #for batch_export instead of being exported here.
+    #
+    #frame_range is (start, end), anim_range.DIRTY or None for the whole
+    #playback range. When anim_nodes is a dict the names of the exported
+    #nodes are added to it, so their keys can be remembered once sent.
+    #
+    #profile is the fbx.PROFILES name to export with, see fbx.get_profile().
     qrig_data = QRigData.get_data(export_data.node())
     character_node = common.get_character_node(export_data)
     joints, meshes, skin_clusters, transforms = get_exportable_content(export_data)
@@ -207,10 +231,53 @@ def _export_data(export_data, export_folder: pathlib.Path, export_rig: bool, exp
             
         #0.2.0 selects the whole trimmed branch, so the exporter doesn't need
         #to pull in children of its own.
-        fbx.export(fbx_file_path, bake_animations=bake,
-                   include_children = dynamic and legacy)
+        include_children = dynamic and legacy
+
+        #Skip the exporter when nothing in the set changed since last time.
+        selected_nodes = pm.ls(sl=True)
+        if include_children and selected_nodes:
+            selected_nodes += pm.listRelatives(selected_nodes, allDescendents=True) or []
+        selected_names = [str(node) for node in selected_nodes]
+        set_range = frame_range
+        if frame_range == anim_range.DIRTY:
+            set_range = None if export_rig else anim_range.dirty_range(file_id, selected_names)
+        unchanged = set_range == anim_range.UNCHANGED
+        if unchanged:
+            print('No keys changed on {} since the last send, skipping it'.format(node_name))
+        elif set_range:
+            print('Exporting frames {} to {} of {}'.format(set_range[0], set_range[1], node_name))
+        if anim_nodes is not None and not unchanged:
+            anim_nodes[file_id] = selected_names
+
+        batched = False
+        if not unchanged:
+            digest = export_cache.fingerprint(selected_nodes, meshes, skin_clusters,
+                                              bake=bake, export_rig=export_rig,
+                                              include_children=include_children,
+                                              frame_range=set_range,
+                                              profile=fbx.get_profile(profile).name)
+
+            cached = export_cache.restore(file_id, digest, fbx_file_path)
+            #HIK rigs have to be exported from the stance pose, which only this
+            #session can set up, so they never go to the batch.
+            batched = batch_jobs is not None and not cached and not (export_rig and character_node)
+            if cached:
+                print('Reusing unchanged export of {}'.format(node_name))
+            elif batched:
+                job = batch_export.make_job(file_id, node_name,
+                                            pm.cmds.ls(sl=True, long=True),
+                                            fbx_file_path, bake, include_children, set_range,
+                                            fbx.get_profile(profile).name)
+                job['digest'] = digest
+                batch_jobs.append(job)
+            else:
+                fbx.export(fbx_file_path, bake_animations=bake,
+                           include_children = include_children,
+                           frame_range=set_range, profile=profile)
 
         pm.select(user_selection, replace=True)
+        if not unchanged and not batched:
+            _record_fbx(manifest, fbx_file_path, file_id, node_name, digest, cached, set_range)
         
         if export_rig and character_node:
             hik.set_character_source(character_node, current_source)
@@ -220,6 +287,8 @@ def _export_data(export_data, export_folder: pathlib.Path, export_rig: bool, exp
         filename = '{}.{}.qrigcasc'.format(node_name, file_id)
         qrig_file_path = export_folder.joinpath(filename)
         casc_qrt.export_qrig_file(character_node, qrig_data, qrig_file_path)
+        if manifest is not None and qrig_file_path.exists():
+            manifest.add(qrig_file_path, transfer.QRIG, file_id, node_name)
 
     #For legacy and non-dynamic data, textures come off the whole root trees,
     #which is what actually gets exported. For 0.2.0 the trimmed branch is
@@ -266,27 +335,67 @@ def _build_default_set():
 
 
 def cascadeur_available():
-    #start_time = time.time()
-    result = wingcarrier.pigeons.CascadeurPigeon().can_dispatch()
-    #print(f"Time to check Dispatch: {time.time() - start_time}")
-    return result
+    with trace.span('cascadeur_available'):
+        return casc_process.CascadeurPigeon().can_dispatch()
+
+
+#a new Cascadeur has none of the textures or frames the last one was sent
+casc_process.on_restart(texture_sync.reset)
+casc_process.on_restart(anim_range.reset)
+
+
+def _export_batch(batch_jobs, manifest):
+    """Run the jobs _export_data() queued up, serially for any the workers missed"""
+    results = batch_export.export_sets(batch_jobs) or {}
+
+    user_selection = pm.ls(sl=True)
+    try:
+        for job in batch_jobs:
+            progress.update(item=job['name'], step=1)
+            fbx_file_path = pathlib.Path(job['fbx_path'])
+            result = results.get(job['set_id'])
+            if not result or not result['ok']:
+                print('Exporting {} serially'.format(job['name']))
+                pm.select(job['nodes'], replace=True)
+                fbx.export(fbx_file_path, bake_animations=job['bake'],
+                           include_children=job['include_children'],
+                           frame_range=job['frame_range'], profile=job['profile'])
+
+            _record_fbx(manifest, fbx_file_path, job['set_id'], job['name'], job['digest'],
+                        frame_range=job['frame_range'])
+    finally:
+        pm.select(user_selection, replace=True)
+
 
+@trace.traced('export')
+@scene_index.indexed
+@progress.tracked('Exporting to Cascadeur', cancelled_result=False)
+def export(export_set=None, export_rig=False, cmd='', textures=True, only_textures=False, batch=None,
+           texture_delta=False, frame_range=None, profile=None):
+    """Export the export sets and tell Cascadeur to run cmd
 
-def export(export_set=None, export_rig=False, cmd='', textures=True, only_textures=False):
+    Args:
+        batch (bool) : export the sets with mayapy workers, see batch_export.
+        Defaults to batch_export.ENABLED.
+        texture_delta (bool) : also send only the texture assignments that
+        changed since the last send, see texture_sync.
+        frame_range : (start, end) to bake instead of the playback range, or
+        anim_range.DIRTY for only the frames that changed since the last send.
+        profile (str) : the fbx.PROFILES name to export with. Defaults to
+        fbx.RIG.
+    """
     if cmd and not cascadeur_available():
         pm.displayError("Please make sure Cascadeur is running and try again.")
         #pm.confirmDialog(message="Please launch Cascadeur, then try again.",button=['Okay'])
         return False
     
-    #remove any previous exports
-    temp_dir = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc'))
-    print('Cascaduer Export Location {}'.format(temp_dir))
-    if not temp_dir.exists():
-        temp_dir.mkdir()
-
-    #delete previous entries
-    for child in temp_dir.iterdir():
-        child.unlink() #missing_ok=True) #missing_ok=True) #missing_ok doens't work for maya 2022
+    #Every export gets its own folder and manifest, see transfer.begin()
+    manifest = transfer.begin('maya')
+    #The exporter is set up once for all the sets, see fbx.apply_profile()
+    fbx.forget_applied()
+    #.png files can come and go between exports
+    materials.clear_cache()
+    temp_dir = manifest.folder
 
     if export_set:
         export_nodes = [export_set]
@@ -300,56 +409,114 @@ def export(export_set=None, export_rig=False, cmd='', textures=True, only_textur
                 pm.confirmDialog(message="Nothing was found to export. Select some items to export and try again.", button=['Okay'])
                 return False                
              
+    if batch is None:
+        batch = batch_export.ENABLED
+
+    batch_jobs = None
+    if batch and not only_textures and len(export_nodes) >= batch_export.MIN_SETS:
+        batch_jobs = []
+
     #export our data
-    texture_nodes = set()
+    set_texture_nodes = {}
+    anim_nodes = {}
     for node in export_nodes:
-        nodes = _export_data(node, temp_dir, export_rig, not only_textures)
-        texture_nodes.update(nodes)
+        progress.update(phase='export', item=node.node().name(), total=len(export_nodes))
+        nodes = _export_data(node, temp_dir, export_rig, not only_textures, manifest, batch_jobs,
+                             frame_range, anim_nodes, profile)
+        set_texture_nodes.setdefault(node.cscDataId.get(), set()).update(nodes)
+        progress.update(step=1)
+
+    if batch_jobs:
+        progress.update(phase='batch export', item='', done=0, total=len(batch_jobs))
+        _export_batch(batch_jobs, manifest)
 
     #Let's export our texture info
-    texture_mappings = {}
+    set_mappings = {}
     if textures or only_textures:
+        progress.update(phase='textures', item='', done=0, total=0)
         print("Exporting textures")
         #NOTE: get_textures() runs listRelatives()/ls(), both of which fall
         #back to the active selection when handed nothing. The user's
         #selection has been restored by this point, so never call in empty.
-        if texture_nodes:
-            texture_mappings = materials.get_textures(list(texture_nodes), export_nodes)
+        shading_index = materials.ShadingIndex(export_nodes)
+        for set_id, texture_nodes in set_texture_nodes.items():
+            set_mappings[set_id] = {}
+            if texture_nodes:
+                set_mappings[set_id] = materials.get_textures(list(texture_nodes), export_nodes, shading_index)
 
+        texture_mappings = texture_sync.merge(set_mappings)
         print(texture_mappings)
-        texture_file = open(temp_dir.joinpath('texture_info.json'), 'w')
+        texture_path = temp_dir.joinpath('texture_info.json')
+        texture_file = open(texture_path, 'w')
         formatted_str = json.dumps(texture_mappings, indent=4)
         texture_file.write(formatted_str)
+        trace.count('bytes_written', len(formatted_str))
         texture_file.close()
+        manifest.add(texture_path, transfer.TEXTURES)
+
+        if texture_delta:
+            delta = texture_sync.diff(set_mappings)
+            print(f"Texture changes: {len(delta['changed'])} changed, {len(delta['removed'])} removed")
+            delta_path = temp_dir.joinpath('texture_delta.json')
+            with open(delta_path, 'w') as delta_file:
+                json.dump(delta, delta_file, indent=4)
+            manifest.add(delta_path, transfer.TEXTURE_DELTA)
+
+    if frame_range == anim_range.DIRTY and not manifest.artifacts:
+        print("No keys changed since the last send, nothing to update")
+        return True
 
+    manifest.save()
     if cmd:
-        server.send_to_casc(cmd)
+        progress.update(phase='send', item='')
+        cmd = f"cg3dmaya.transfer.set_manifest({str(manifest.path)!r}); {cmd}"
+        if not server.send_to_casc(cmd):
+            #nothing was delivered, so the next update has to send it all again
+            return False
+
+        texture_sync.remember(set_mappings)
+        for set_id, node_names in anim_nodes.items():
+            anim_range.remember(set_id, node_names)
 
     return True
         
 
-def update_animations():
-    export(cmd=u"cg3dmaya.update_animations()", textures=False)
+@trace.traced('update_animations')
+def update_animations(frame_range=None):
+    """Send the animation, optionally just frame_range, see export()"""
+    export(cmd=u"cg3dmaya.update_animations()", textures=False, frame_range=frame_range,
+           profile=fbx.ANIMATION.name)
+
+
+@trace.traced('update_changed_frames')
+def update_changed_frames():
+    """Send only the frames whose keys changed since the last send"""
+    update_animations(anim_range.DIRTY)
     
     
+@trace.traced('update_models')
 def update_models():
     export(cmd=u"cg3dmaya.update_models()")
     
     
+@trace.traced('update_textures')
 def update_textures():
-    export(cmd=u"cg3dmaya.update_textures()", only_textures=True)
+    export(cmd=u"cg3dmaya.update_textures()", only_textures=True, texture_delta=True)
     
     
+@trace.traced('export_scene')
 def export_scene(new_scene):
     cmd = f"cg3dmaya.import_scene({new_scene})"
     export(cmd=cmd)
     
 
+@trace.traced('export_rig')
 def export_rig(new_scene, export_set):
     cmd = f"cg3dmaya.import_rig({new_scene})"
     export(export_set, True, cmd=cmd)
     
     
+@trace.traced('smart_export')
 def smart_export():
     cmd = f"cg3dmaya.smart_import()"
     export(cmd=cmd)
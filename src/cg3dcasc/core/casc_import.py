@@ -1,8 +1,5 @@
 
 #import json
-import tempfile
-import os
-import pathlib
    
 import pymel.core as pm
 from . import hik
@@ -20,6 +17,8 @@ from .udata import *
 from . import server
 from . import common
 from . import fbx
+from . import transfer
+from . import trace
 
 
 def import_from_casc():
@@ -28,24 +27,24 @@ def import_from_casc():
     
 
 def get_import_files():
-    files = {}
+    """Return {(set_name, set_id): {kind: file_path}} for Cascadeur's export
 
-    temp_dir = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc'))
-    if not temp_dir.exists():
+    The manifest Cascadeur sent with the import command is used when there
+    is one, otherwise the folder of the last export is scanned like it used
+    to be.
+    """
+    manifest = transfer.take_manifest()
+    if manifest is not None:
+        return manifest.set_files()
+
+    if not transfer.EXPORT_ROOT.exists():
         pm.error("Can't find Maya data")
-        return files
+        return {}
 
-    for child in temp_dir.iterdir():
-        name, ext = child.name.rsplit('.', 1)
-        if name not in files:
-            files[name] = dict()
-            
-        files[name][ext.lower()] = str(child)
-        
-        
-    return files
+    return transfer.scan_folder(transfer.latest_folder())
 
 
+@trace.traced('import_fbx')
 def import_fbx():
     pm.mel.eval('if (!`pluginInfo -q -l "fbxmaya"`){ loadPlugin "fbxmaya"; }')
     files = get_import_files()
@@ -55,11 +54,9 @@ def import_fbx():
     existing_exports = cg3dguru.udata.Utils.get_nodes_with_data(scene_sets, data_class=CascExportData)
     scene_roots = set(pm.ls(assemblies=True))
 
-    for key, item in files.items():
-        fbx_path = item.get('fbx', '')
-        qrig_path = item.get('qrigcasc', '')    
-
-        set_name, maya_id = key.split('.')
+    for (set_name, maya_id), item in files.items():
+        fbx_path = item.get(transfer.FBX, '')
+        qrig_path = item.get(transfer.QRIG, '')
         if fbx_path:
             matching_id_node = None
             for node in existing_exports:
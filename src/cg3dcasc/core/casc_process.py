@@ -0,0 +1,203 @@
+"""Find the running Cascadeur without scanning every process each time
+
+wingcarrier's CascadeurPigeon looks Cascadeur up from scratch whenever it's
+asked: can_dispatch() walks every process (or runs TASKLIST without
+psutil) and send_python_command() walks them all again for the exe path.
+An export asks both. CascadeurPigeon here remembers the PID and exe path
+the first scan found, checks that PID is still Cascadeur on every use,
+which costs one process lookup, and only scans again once it isn't.
+
+Once cg3dmaya's listener is up inside Cascadeur (see cg3dmaya.listener)
+commands skip cascadeur.exe altogether and go over the bridge channel.
+The process spawn is only used until then, or when the channel is down.
+"""
+
+import os
+import sys
+import time
+
+import wingcarrier.pigeons
+
+from . import channel
+
+psutil_exists = False
+try:
+    import psutil
+    psutil_exists = True
+except ImportError:
+    pass
+
+
+MISSING_SECONDS = 2.0
+"""How long 'Cascadeur isn't running' is believed before scanning again"""
+
+_pid = None
+_exe_path = ''
+_create_time = None
+_missing_since = None
+_last_pid = None
+_restart_callbacks = []
+
+
+def _scan(process_name):
+    """Return (pid, exe path, create time) of a running process_name"""
+    if psutil_exists:
+        for proc in psutil.process_iter(['name', 'exe', 'create_time']):
+            try:
+                if proc.info['name'] == process_name:
+                    exe_path = proc.info['exe'] or _windows_exe_path(proc.pid)
+                    return (proc.pid, exe_path or '', proc.info['create_time'])
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+
+        return (None, '', None)
+
+    pigeon = wingcarrier.pigeons.CascadeurPigeon
+    pid = pigeon.process_id(process_name)
+    if pid is None:
+        return (None, '', None)
+
+    pid = int(pid)
+    return (pid, _windows_exe_path(pid) or pigeon.get_exe_path_from_pid(pid) or '', None)
+
+
+def _windows_exe_path(pid):
+    """The exe of a process without starting a subprocess, or '' if it's gone"""
+    if not sys.platform.startswith('win'):
+        return ''
+
+    import ctypes
+    from ctypes import wintypes
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    kernel32 = ctypes.windll.kernel32
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return ''
+
+    try:
+        size = wintypes.DWORD(1024)
+        buffer = ctypes.create_unicode_buffer(size.value)
+        if not kernel32.QueryFullProcessImageNameW(handle, 0, buffer, ctypes.byref(size)):
+            return ''
+
+        return buffer.value
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def _still_running(pid, exe_path, create_time):
+    """True if pid is still the process that was found"""
+    if psutil_exists:
+        try:
+            proc = psutil.Process(pid)
+            #a recycled pid belongs to a process that started later
+            return proc.is_running() and (create_time is None or proc.create_time() == create_time)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+
+    if sys.platform.startswith('win'):
+        current_path = _windows_exe_path(pid)
+        return bool(current_path) and (not exe_path or os.path.normcase(current_path) == os.path.normcase(exe_path))
+
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+
+    return True
+
+
+def locate(process_name=wingcarrier.pigeons.CascadeurPigeon.process_name, refresh=False):
+    """Return (pid, exe path) of the running Cascadeur, or (None, '')"""
+    global _pid, _exe_path, _create_time, _missing_since
+
+    if not refresh:
+        if _pid is not None and _still_running(_pid, _exe_path, _create_time):
+            return (_pid, _exe_path)
+
+        if _pid is None and _missing_since is not None and time.monotonic() - _missing_since < MISSING_SECONDS:
+            return (None, '')
+
+    _pid, _exe_path, _create_time = _scan(process_name)
+    _missing_since = time.monotonic() if _pid is None else None
+    _check_restart()
+    return (_pid, _exe_path)
+
+
+def _check_restart():
+    global _last_pid
+
+    if _pid is None:
+        return
+
+    restarted = _last_pid is not None and _pid != _last_pid
+    _last_pid = _pid
+    if restarted:
+        print("Cascadeur was restarted")
+        for callback in list(_restart_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                print(f"Cascadeur restart callback failed: {e}")
+
+
+def on_restart(callback):
+    """Call callback() when locate() finds a different Cascadeur process,
+    e.g. to forget what the last one was sent"""
+    if callback not in _restart_callbacks:
+        _restart_callbacks.append(callback)
+
+
+def listener():
+    """The bridge channel if Cascadeur is running Maya's commands from it, or None"""
+    active_channel = channel.get()
+    if active_channel is not None and active_channel.connected and active_channel.accepts_commands:
+        return active_channel
+
+    return None
+
+
+def forget():
+    """Scan again on the next lookup, e.g. after Cascadeur was restarted"""
+    global _pid, _exe_path, _create_time, _missing_since
+    _pid = None
+    _exe_path = ''
+    _create_time = None
+    _missing_since = None
+
+
+
+class CascadeurPigeon(wingcarrier.pigeons.CascadeurPigeon):
+    """wingcarrier's CascadeurPigeon answering from locate(), or sending
+    over listener() when it's up"""
+
+    def get_own_process(self):
+        pid = locate(self.process_name)[0]
+        self.known_pid = pid
+        return pid
+
+
+    def get_running_path(self):
+        return locate(self.process_name)[1]
+
+
+    def can_dispatch(self):
+        if listener() is not None:
+            return True
+
+        return self.get_own_process() is not None
+
+
+    def send_python_command(self, command_string):
+        active_channel = listener()
+        if active_channel is not None and active_channel.post(command_string):
+            return True
+
+        if super(CascadeurPigeon, self).send_python_command(command_string):
+            return True
+
+        #the exe might have been replaced by a new install since it was found
+        forget()
+        return False
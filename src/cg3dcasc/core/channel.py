@@ -0,0 +1,464 @@
+"""A long lived connection between Maya and Cascadeur
+
+server.send_and_listen() used to bind a fresh listening socket for every
+round trip. The channel replaces that with one connection that stays open
+for the whole session. Maya listens, Cascadeur connects back when it learns
+the port (see server.send_to_casc()), and every message on the connection is
+framed the same way the old one-shot sockets were: a 4-byte '>I' length
+followed by the payload. Both ends say hello when the channel opens and
+switch from plain JSON to the best codec they share (see codec.py).
+
+Each message is a dict with a 'type' and an 'id'. Requests carry a 'cmd',
+responses carry 'success' and 'data', and the id is how a response finds
+the request that's waiting on it, so any number of requests can share the
+connection.
+
+'progress' messages carry progress events (see progress.py) and 'cancel'
+messages cancel whatever is running on the other side. Neither gets a
+response, and older peers ignore both. A 'listening' message says the
+sender runs the requests it's sent as commands, see cg3dmaya.listener.
+"""
+
+import concurrent.futures
+import socket
+import struct
+import threading
+import itertools
+import __main__
+
+from . import codec
+from . import progress
+
+
+HOST = '127.0.0.1'
+PORT = 0 #this makes the port dynamic
+TIMEOUT_SECONDS = 2.0
+
+REQUEST = 'request'
+RESPONSE = 'response'
+HELLO = 'hello'
+PROGRESS = 'progress'
+CANCEL = 'cancel'
+LISTENING = 'listening'
+
+_ids = itertools.count(1)
+
+_server = None
+port_number = None
+
+
+def receive_all(sock, n):
+    """Helper function to ensure all 'n' bytes are received."""
+    return codec.receive_into(sock, n)
+
+
+def read_message(sock):
+    """Read one framed message from the socket.
+
+    Returns:
+        dict : the message, or None if the peer hung up.
+    """
+    payload = codec.read_payload(sock)
+    if payload is None:
+        return None
+
+    return codec.decode(payload)
+
+
+def write_message(sock, message, message_codec=None):
+    """Frame and send one message over the socket"""
+    if message_codec is None:
+        message_codec = codec.Codec()
+
+    sock.sendall(codec.frame(message_codec.encode(message)))
+
+
+def _error_text(e):
+    """What a failed command answers with, so the caller can tell why"""
+    return f"{type(e).__name__}: {e}"
+
+
+class Channel(object):
+    """One framed, multiplexed connection to the other application
+
+    A background thread reads every incoming message. Responses wake up
+    whichever request() is waiting on their id. Requests are passed to the
+    handler, which gets the command string and returns (success, data).
+
+    Channels that are given the same pending dict can answer each other's
+    requests, which is how a reply finds its way back when the other side
+    has more than one channel open.
+    """
+
+    def __init__(self, sock, handler=None, pending=None):
+        self.sock = sock
+        self.handler = handler
+        self._pending = {} if pending is None else pending
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self.codec = codec.Codec()
+        self.accepts_commands = False
+
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+        try:
+            self.send_message(codec.hello())
+        except OSError as e:
+            print(f"Bridge channel failed to say hello: {e}")
+            self.close()
+
+
+    @property
+    def connected(self):
+        return not self._closed
+
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        #close() alone doesn't reach the peer while our reader is blocked
+        #in recv(), shutdown() does.
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+        #wake up anybody that's still waiting, they'll see no response.
+        for event, _, owner in list(self._pending.values()):
+            if owner is self:
+                event.set()
+
+
+    def send_message(self, message):
+        with self._send_lock:
+            write_message(self.sock, message, self.codec)
+
+
+    def respond(self, request_id, success, data):
+        """Send the response for a request id
+
+        Data the agreed codec can't encode is answered with success=False
+        and the error text, rather than closing the channel.
+        """
+        message = {'type': RESPONSE, 'id': request_id, 'success': success, 'data': data}
+        try:
+            try:
+                self.send_message(message)
+            except (TypeError, ValueError, OverflowError, struct.error) as e:
+                print(f"Bridge channel can't encode the response: {e}")
+                message.update(success=False, data=f"Can't encode the response: {e}")
+                self.send_message(message)
+        except OSError as e:
+            print(f"Bridge channel failed to respond: {e}")
+            self.close()
+            return False
+
+        return True
+
+
+    def _respond_future(self, request_id, future):
+        try:
+            success, data = future.result()
+        except Exception as e:
+            print(f"Bridge channel command failed: {e}")
+            success, data = False, _error_text(e)
+
+        self.respond(request_id, success, data)
+
+
+    def post(self, cmd):
+        """Send a command without waiting for its response
+
+        Returns:
+            bool : False if it couldn't be sent.
+        """
+        if self._closed:
+            return False
+
+        try:
+            self.send_message({'type': REQUEST, 'id': next(_ids), 'cmd': cmd})
+        except OSError as e:
+            print(f"Bridge channel failed to send: {e}")
+            self.close()
+            return False
+
+        return True
+
+
+    def request(self, cmd, timeout=TIMEOUT_SECONDS):
+        """Send a command over the channel and wait for its response
+
+        Returns:
+            tuple : (success, data) matching server.send_and_listen()
+        """
+        return self.await_reply(
+            lambda request_id: self.send_message({'type': REQUEST, 'id': request_id, 'cmd': cmd}),
+            timeout
+        )
+
+
+    def await_reply(self, send, timeout=TIMEOUT_SECONDS):
+        """Reserve a request id, call send(request_id) and wait for the response
+
+        This is for requests that don't travel over the channel themselves,
+        e.g. a command handed to Cascadeur on the command line that answers
+        back over the channel.
+        """
+        if self._closed:
+            return (False, None)
+
+        request_id = next(_ids)
+        slot = [threading.Event(), None, self]
+        self._pending[request_id] = slot
+        try:
+            if send(request_id) is False:
+                return (False, None)
+
+            slot[0].wait(timeout)
+        except OSError as e:
+            print(f"Bridge channel failed to send: {e}")
+            self.close()
+        finally:
+            self._pending.pop(request_id, None)
+
+        response = slot[1]
+        if response is None:
+            return (False, None)
+
+        return (response.get('success', False), response.get('data'))
+
+
+    def _read_loop(self):
+        try:
+            while not self._closed:
+                message = read_message(self.sock)
+                if message is None:
+                    break
+
+                self._dispatch(message)
+        except (OSError, ValueError, TypeError) as e:
+            if not self._closed:
+                print(f"Bridge channel closed: {e}")
+        finally:
+            self.close()
+
+
+    def _dispatch(self, message):
+        kind = message.get('type')
+        if kind == HELLO:
+            self.codec = codec.negotiate(message)
+            print(f"Bridge channel is using {self.codec}")
+
+        elif kind == RESPONSE:
+            slot = self._pending.get(message.get('id'))
+            if slot is not None:
+                slot[1] = message
+                slot[0].set()
+
+        elif kind == REQUEST:
+            request_id = message.get('id')
+            result = (False, None)
+            if self.handler is not None:
+                try:
+                    result = self.handler(message.get('cmd', ''))
+                except Exception as e:
+                    print(f"Bridge channel command failed: {e}")
+                    result = (False, _error_text(e))
+
+            #a handler that can't answer on the reader thread returns a
+            #Future, and the response goes out once it's done.
+            if isinstance(result, concurrent.futures.Future):
+                result.add_done_callback(lambda future: self._respond_future(request_id, future))
+            else:
+                self.respond(request_id, *result)
+
+        elif kind == PROGRESS:
+            progress.receive(message.get('event') or {})
+
+        elif kind == LISTENING:
+            self.accepts_commands = bool(message.get('value', True))
+
+        elif kind == CANCEL:
+            if progress.cancel():
+                print("Cancelled by the other application")
+
+
+
+class ChannelServer(object):
+    """Listens for Cascadeur and keeps every connection it makes
+
+    Cascadeur can have more than one channel open (see cg3dmaya.aio), so
+    they all share one set of pending requests. channel is the newest
+    connection that's listening for commands, or the newest connection if
+    none is. That's how a restarted Cascadeur takes over without any extra
+    handshaking, and an async client connecting later doesn't take Maya's
+    commands away from Cascadeur's listener.
+    """
+
+    def __init__(self, handler=None, host=HOST, port=PORT):
+        self.handler = handler
+        self.channels = []
+        self._pending = {}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+
+
+    @property
+    def channel(self):
+        connected = [c for c in reversed(self.channels) if c.connected]
+        for active_channel in connected:
+            if active_channel.accepts_commands:
+                return active_channel
+
+        return connected[0] if connected else None
+
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:
+                break
+
+            self.channels = [c for c in self.channels if c.connected]
+            print(f"Bridge channel connected to {addr}")
+            self.channels.append(Channel(conn, self.handler, self._pending))
+
+
+    def close(self):
+        for active_channel in self.channels:
+            active_channel.close()
+
+        self.sock.close()
+
+
+
+def loopback(handler_a=None, handler_b=None):
+    """Return two channels connected to each other in this process
+
+    This stands in for the Maya/Cascadeur pair, so the channel can be used
+    without either application running.
+    """
+    sock_a, sock_b = socket.socketpair()
+    return (Channel(sock_a, handler_a), Channel(sock_b, handler_b))
+
+
+def run_command(cmd):
+    """Execute a command sent by Cascadeur
+
+    Commands answer by calling client.data_to_casc(), so that's captured
+    instead of being sent over a new socket. Maya commands have to run on
+    the main thread, which can be busy waiting for a reply this channel's
+    reader has to read, so the command is deferred rather than waited on.
+
+    Returns:
+        concurrent.futures.Future : (success, data) once the command ran.
+    """
+    import maya.utils
+    from . import client
+
+    future = concurrent.futures.Future()
+
+    def _run():
+        if not future.set_running_or_notify_cancel():
+            return
+
+        try:
+            with client.capture() as replies:
+                exec(f"import cg3dcasc.core; {cmd}", __main__.__dict__, __main__.__dict__)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        future.set_result((True, replies[-1] if replies else None))
+
+    maya.utils.executeDeferred(_run)
+    return future
+
+
+def start():
+    """Start listening for Cascadeur if we aren't already
+
+    Returns:
+        bool : True if the channel server is running.
+    """
+    global _server, port_number
+
+    if _server is not None:
+        return True
+
+    try:
+        _server = ChannelServer(run_command)
+    except OSError as e:
+        print(f"Couldn't start the bridge channel: {e}")
+        return False
+
+    port_number = _server.port
+    print("Cascadeur Bridge opened channel port:{0}".format(port_number))
+    return True
+
+
+def get():
+    """Return the connected channel or None"""
+    if _server is None:
+        return None
+
+    return _server.channel
+
+
+def _connected():
+    """The connected channel, without trying to reconnect"""
+    if _server is None:
+        return None
+
+    return _server.channel
+
+
+def forward_progress(event):
+    """Progress sink that sends local events to the other application"""
+    if event.get('remote'):
+        return
+
+    active_channel = _connected()
+    if active_channel is None:
+        return
+
+    try:
+        active_channel.send_message({'type': PROGRESS, 'event': event})
+    except OSError:
+        pass
+
+
+def cancel_remote():
+    """Cancel whatever the other application is running
+
+    Returns:
+        bool : False if there's no channel to send it on.
+    """
+    active_channel = _connected()
+    if active_channel is None:
+        return False
+
+    try:
+        active_channel.send_message({'type': CANCEL})
+    except OSError:
+        return False
+
+    return True
+
+
+progress.add_sink(forward_progress)
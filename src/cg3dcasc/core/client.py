@@ -2,12 +2,14 @@
 
 import maya.cmds as cmds
 import socket
-import json
-import struct
+import contextlib
+
+from . import codec
 
 
 HOST = '127.0.0.1'
 _casc_port = 0 #dynamically changed by the cg3dmaya.server.send_to_maya
+_captures = []
 
 
 def set_port(number):
@@ -16,21 +18,38 @@ def set_port(number):
     _casc_port = number
 
 
+@contextlib.contextmanager
+def capture():
+    """Collect data_to_casc() calls instead of sending them
+
+    Used when a command arrives over the bridge channel, as the data goes
+    back in the channel response.
+    """
+    replies = []
+    _captures.append(replies)
+    try:
+        yield replies
+    finally:
+        _captures.remove(replies)
+
+
 def data_to_casc(data):
     """Encodes and sends JSON data to the external server."""
+    if _captures:
+        _captures[-1].append(data)
+        return
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
         try:
             print(f"cascadeur port:{_casc_port}")
             client.connect((HOST, _casc_port))
             
-            json_string = json.dumps(data)
-            json_bytes = json_string.encode('utf-8')
+            #One-shot sockets are what older versions of the bridge listen
+            #on, so they always get plain JSON.
+            json_bytes = codec.encode(data, codec.JSON)
 
-            # 3. Prepend a 4-byte length-prefix.
-            length_prefix = struct.pack('>I', len(json_bytes))
-            
-            # 4. Send the length-prefix followed by the JSON data.
-            client.sendall(length_prefix + json_bytes)
+            # 3. Prepend a 4-byte length-prefix and send it with the data.
+            client.sendall(codec.frame(json_bytes))
             
             print(f"Sent {len(json_bytes)} bytes of JSON data to the server. Data is:{data}")
         
@@ -0,0 +1,306 @@
+"""Message codecs for the Maya/Cascadeur bridge
+
+Every message is still sent behind a 4-byte '>I' length header. What changes
+is the payload: plain JSON is what older versions of the bridge send and
+understand, so it stays the default. A peer that says hello on the bridge
+channel (see channel.py) can agree to the binary format and compression.
+
+Tagged payloads start with a byte below 0x09, which can never start a JSON
+document, so decode() tells the formats apart without any extra header.
+
+The binary format is a small msgpack-style encoding. Float lists and
+array.array values are written as one raw block instead of a value at a
+time, which is where most of the size and speed win comes from on pose
+and weight data.
+
+The two formats don't give back exactly what was sent. Binary keeps int
+dict keys, bytes and array.array values as they are, while JSON turns
+them into str keys, latin-1 strings and lists. Both turn tuples and sets
+into lists. Code that reads bridge data shouldn't depend on which codec
+was negotiated, so normalise keys and arrays on the receiving side.
+"""
+
+import array
+import json
+import struct
+import sys
+import zlib
+
+lz4_exists = False
+try:
+    import lz4.frame
+    lz4_exists = True
+except ImportError:
+    pass
+
+
+PROTOCOL_VERSION = 2
+
+JSON = 'json'
+BINARY = 'binary'
+ZLIB = 'zlib'
+LZ4 = 'lz4'
+
+CODECS = [BINARY, JSON]
+"""Supported codecs in order of preference"""
+
+COMPRESSION = ([LZ4] if lz4_exists else []) + [ZLIB]
+"""Supported compression in order of preference"""
+
+COMPRESS_THRESHOLD = 64 * 1024
+"""Payloads smaller than this (in bytes) aren't worth compressing"""
+
+FLOAT_BLOCK_SIZE = 16
+"""Float lists at least this long are written as a raw block"""
+
+_TAG_BINARY = 0x01
+_TAG_ZLIB = 0x02
+_TAG_LZ4 = 0x04
+
+_HEADER = struct.Struct('>I')
+_COUNT = struct.Struct('<I')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+class CodecError(ValueError):
+    """Raised when a payload can't be decoded"""
+    pass
+
+
+class Codec(object):
+    """What's been agreed on with a peer
+
+    The default instance is what's used before (or without) any
+    negotiation: plain JSON that every version of the bridge understands.
+    """
+
+    def __init__(self, name=JSON, compression=None, threshold=COMPRESS_THRESHOLD):
+        self.name = name
+        self.compression = compression
+        self.threshold = threshold
+
+
+    def __repr__(self):
+        return f"Codec({self.name}, {self.compression})"
+
+
+    def encode(self, data):
+        return encode(data, self.name, self.compression, self.threshold)
+
+
+    def decode(self, payload):
+        return decode(payload)
+
+
+
+def hello():
+    """The capabilities message sent when a channel opens"""
+    return {'type': 'hello', 'version': PROTOCOL_VERSION,
+            'codecs': CODECS, 'compression': COMPRESSION}
+
+
+def negotiate(message):
+    """Pick the best codec both sides support from a peer's hello message
+
+    Returns:
+        Codec : plain JSON if the peer doesn't list anything we understand.
+    """
+    peer_codecs = message.get('codecs') or [JSON]
+    peer_compression = message.get('compression') or []
+
+    name = next((c for c in CODECS if c in peer_codecs), JSON)
+    compression = next((c for c in COMPRESSION if c in peer_compression), None)
+    return Codec(name, compression)
+
+
+def _to_json(value):
+    if isinstance(value, array.array):
+        return value.tolist()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('latin-1')
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+
+    raise TypeError(f"Can't encode {value.__class__.__name__} as JSON")
+
+
+def encode(data, name=JSON, compression=None, threshold=COMPRESS_THRESHOLD):
+    """Encode data into a payload (without the length header)"""
+    if name == BINARY:
+        parts = []
+        _pack(data, parts)
+        payload = b''.join(parts)
+        tag = _TAG_BINARY
+    else:
+        payload = json.dumps(data, default=_to_json).encode('utf-8')
+        tag = 0
+
+    if compression and len(payload) >= threshold:
+        if compression == LZ4 and lz4_exists:
+            payload = lz4.frame.compress(payload)
+            tag |= _TAG_LZ4
+        elif compression == ZLIB:
+            payload = zlib.compress(payload, 1)
+            tag |= _TAG_ZLIB
+
+    if not tag:
+        return payload
+
+    return bytes((tag,)) + payload
+
+
+def decode(payload):
+    """Decode a payload from encode(), or plain JSON from an older peer"""
+    if not payload:
+        raise CodecError("Empty payload")
+
+    tag = payload[0]
+    if tag >= 0x09:
+        return json.loads(bytes(payload).decode('utf-8'))
+
+    body = memoryview(payload)[1:]
+    if tag & _TAG_LZ4:
+        if not lz4_exists:
+            raise CodecError("Received lz4 data without the lz4 package")
+        body = memoryview(lz4.frame.decompress(body))
+    elif tag & _TAG_ZLIB:
+        body = memoryview(zlib.decompress(body))
+
+    if tag & _TAG_BINARY:
+        value, offset = _unpack(body, 0)
+        return value
+
+    return json.loads(bytes(body).decode('utf-8'))
+
+
+def frame(payload):
+    """Prefix a payload with its length header"""
+    return _HEADER.pack(len(payload)) + payload
+
+
+def receive_into(sock, n):
+    """Receive exactly n bytes into one preallocated buffer
+
+    Returns:
+        bytearray : the data, or None if the peer hung up early.
+    """
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    received = 0
+    while received < n:
+        count = sock.recv_into(view[received:], n - received)
+        if not count:
+            return None
+        received += count
+
+    return buffer
+
+
+def read_payload(sock):
+    """Read one length-prefixed payload, or None if the peer hung up"""
+    raw_msg_len = receive_into(sock, _HEADER.size)
+    if raw_msg_len is None:
+        return None
+
+    msg_len = _HEADER.unpack(raw_msg_len)[0]
+    return receive_into(sock, msg_len)
+
+
+#Binary format. Every value starts with a one character type code.
+def _pack(value, parts):
+    if value is None:
+        parts.append(b'N')
+    elif value is True:
+        parts.append(b'T')
+    elif value is False:
+        parts.append(b'F')
+    elif isinstance(value, int):
+        parts.append(b'i' + _INT.pack(value))
+    elif isinstance(value, float):
+        parts.append(b'd' + _FLOAT.pack(value))
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        parts.append(b's' + _COUNT.pack(len(data)))
+        parts.append(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        parts.append(b'b' + _COUNT.pack(len(data)))
+        parts.append(data)
+    elif isinstance(value, array.array):
+        _pack_block(b'a', value, parts)
+    elif isinstance(value, dict):
+        parts.append(b'm' + _COUNT.pack(len(value)))
+        for key, item in value.items():
+            _pack(key, parts)
+            _pack(item, parts)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        if len(value) >= FLOAT_BLOCK_SIZE and all(type(v) is float for v in value):
+            _pack_block(b'A', array.array('d', value), parts)
+            return
+
+        parts.append(b'l' + _COUNT.pack(len(value)))
+        for item in value:
+            _pack(item, parts)
+    else:
+        raise TypeError(f"Can't encode {value.__class__.__name__}")
+
+
+def _pack_block(code, values, parts):
+    if not _LITTLE_ENDIAN:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+
+    parts.append(code + values.typecode.encode('ascii') + _COUNT.pack(len(values)))
+    parts.append(values.tobytes())
+
+
+def _unpack(view, offset):
+    code = view[offset]
+    offset += 1
+
+    if code == 0x4E: #N
+        return (None, offset)
+    if code == 0x54: #T
+        return (True, offset)
+    if code == 0x46: #F
+        return (False, offset)
+    if code == 0x69: #i
+        return (_INT.unpack_from(view, offset)[0], offset + _INT.size)
+    if code == 0x64: #d
+        return (_FLOAT.unpack_from(view, offset)[0], offset + _FLOAT.size)
+    if code == 0x73 or code == 0x62: #s, b
+        size = _COUNT.unpack_from(view, offset)[0]
+        offset += _COUNT.size
+        data = bytes(view[offset:offset + size])
+        return (data.decode('utf-8') if code == 0x73 else data, offset + size)
+    if code == 0x6C: #l
+        count = _COUNT.unpack_from(view, offset)[0]
+        offset += _COUNT.size
+        items = []
+        for i in range(count):
+            item, offset = _unpack(view, offset)
+            items.append(item)
+        return (items, offset)
+    if code == 0x6D: #m
+        count = _COUNT.unpack_from(view, offset)[0]
+        offset += _COUNT.size
+        items = {}
+        for i in range(count):
+            key, offset = _unpack(view, offset)
+            items[key], offset = _unpack(view, offset)
+        return (items, offset)
+    if code == 0x61 or code == 0x41: #a, A
+        typecode = chr(view[offset])
+        count = _COUNT.unpack_from(view, offset + 1)[0]
+        offset += 1 + _COUNT.size
+        values = array.array(typecode)
+        size = count * values.itemsize
+        values.frombytes(view[offset:offset + size])
+        if not _LITTLE_ENDIAN:
+            values.byteswap()
+        return (values if code == 0x61 else values.tolist(), offset + size)
+
+    raise CodecError(f"Unknown type code {code} at {offset - 1}")
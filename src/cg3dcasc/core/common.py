@@ -16,6 +16,19 @@ from .udata import *
 from . import client
 from . import command_port
 from . import server
+from . import scene_index
+from . import export_cache
+
+
+SET_IDS = 'set_ids'
+SELECTED_SET_IDS = 'selected_set_ids'
+UP_AXIS = 'up_axis'
+FRAME_RANGE = 'frame_range'
+SCENE_PATH = 'scene_path'
+FINGERPRINTS = 'fingerprints'
+
+QUERIES = {}
+"""{name: func} answered by run_queries(), see query()"""
 
 
 def get_character_node(export_data):
@@ -36,6 +49,9 @@ def get_character_node(export_data):
 
 def get_joint_skin_clusters(joints):
     """Given a list of joints, return a set of associated skinClusters"""
+    index = scene_index.current()
+    if index is not None:
+        return index.joint_skin_clusters(joints)
 
     clusters = set()
     for joint in joints:
@@ -50,6 +66,10 @@ def get_joint_skin_clusters(joints):
                 
 def get_skin_cluster_joints(skin_clusters):
     """Given a list of skinClusters, return a set of associated joints"""
+    index = scene_index.current()
+    if index is not None:
+        return index.skin_cluster_joints(skin_clusters)
+
     joint_set = set()
     for skin_cluster in skin_clusters:
         temp_set = set(skin_cluster.matrix.inputs())
@@ -61,6 +81,10 @@ def get_skin_cluster_joints(skin_clusters):
 
 def get_skin_cluster_meshes(skin_clusters):
     """Given a list of skinClusters, return a set of associated meshes"""
+    index = scene_index.current()
+    if index is not None:
+        return index.skin_cluster_meshes(skin_clusters)
+
     meshes = set()
     for cluster in skin_clusters:
         meshes.update(
@@ -72,6 +96,10 @@ def get_skin_cluster_meshes(skin_clusters):
     
 def get_mesh_cluster_mappings() -> dict:
     """Return a global mapping of mesh:clusters and cluster:meshes"""
+    index = scene_index.current()
+    if index is not None:
+        return index.mesh_cluster_mappings()
+
     mapping = {}
     for cluster in pm.ls(type='skinCluster'):
         meshes = pm.animation.skinCluster(cluster, geometry=True, query=True)
@@ -85,6 +113,10 @@ def get_mesh_cluster_mappings() -> dict:
 
 def get_mesh_skin_clusters(meshes):
     """Given a list of meshes, return a set of all associated skinClusters"""
+    index = scene_index.current()
+    if index is not None:
+        return index.mesh_skin_clusters(meshes)
+
     mesh_clusters = get_mesh_cluster_mappings()
     clusters = set()
     for mesh in meshes:
@@ -128,6 +160,7 @@ def get_skinned_data_sets(input_list):
     return (joints, meshes, skin_clusters, transforms)
 
 
+@scene_index.indexed
 def update_skinned_data_sets(joints, meshes, skin_clusters, transforms):
     """Update each input set with any dependencies from the other sets"""
     
@@ -163,25 +196,83 @@ def get_export_nodes():
     return selected_sets if selected_sets else get_all_export_nodes()
 
 
-def get_all_set_ids():
-    data = []
-    export_sets = get_all_export_nodes()
-    data = [e.cscDataId.get() for e in export_sets]
+def query(name):
+    """Decorator that registers func as a named query for run_queries()"""
+    def decorator(func):
+        QUERIES[name] = func
+        return func
+
+    return decorator
+
+
+@query(SET_IDS)
+def _query_set_ids():
+    return [e.cscDataId.get() for e in get_all_export_nodes()]
+
+
+@query(SELECTED_SET_IDS)
+def _query_selected_set_ids():
+    return [e.cscDataId.get() for e in get_selected_export_nodes()]
+
+
+@query(UP_AXIS)
+def _query_up_axis():
+    return pm.cmds.upAxis(q=True, axis=True)
 
-    client.data_to_casc(data)
+
+@query(FRAME_RANGE)
+def _query_frame_range():
+    """The range exports bake, see fbx.py"""
+    return [pm.cmds.playbackOptions(q=True, animationStartTime=True),
+            pm.cmds.playbackOptions(q=True, animationEndTime=True)]
+
+
+@query(SCENE_PATH)
+def _query_scene_path():
+    return pm.cmds.file(q=True, sceneName=True)
+
+
+@query(FINGERPRINTS)
+def _query_fingerprints():
+    """{set id: fingerprint of its last export or None}"""
+    return {set_id: export_cache.last_digest(set_id) for set_id in _query_set_ids()}
+
+
+def run_queries(names):
+    """Answer several named queries in one response
+
+    Cascadeur sends every query it needs at once instead of a round trip per
+    question. A query that's unknown or fails doesn't stop the others.
+
+    Sends:
+        dict : {'results': {name: data}, 'errors': {name: message}}
+    """
+    results = {}
+    errors = {}
+    for name in names:
+        func = QUERIES.get(name)
+        if func is None:
+            errors[name] = "Unknown query"
+            continue
+
+        try:
+            results[name] = func()
+        except Exception as e:
+            errors[name] = str(e)
+
+    client.data_to_casc({'results': results, 'errors': errors})
+
+
+def get_all_set_ids():
+    client.data_to_casc(_query_set_ids())
     
     
 def get_selected_set_ids():
-    data = []
-    export_sets = get_selected_export_nodes()
-    data = [e.cscDataId.get() for e in export_sets]
-
-    client.data_to_casc(data)    
+    client.data_to_casc(_query_selected_set_ids())
     
 
 def get_coord_system():
-    data = pm.cmds.upAxis(q=True, axis=True)
-    client.data_to_casc(data)
+    client.data_to_casc(_query_up_axis())
             
 def run():
     pass
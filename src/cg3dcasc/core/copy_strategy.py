@@ -0,0 +1,168 @@
+"""Pick the fastest weight copy method for each skinCluster
+
+Which of utils._copy_swap(), _copy_flood(), _copy_per_vert() and
+_copy_bulk() is fastest depends on the mesh. Swap costs grow with the
+number of joints being replaced, flood with joints times vertices, per vert
+with the number of weight plugs and bulk with the size of the weight
+matrix. Each method gets a small linear model over that one statistic:
+
+    seconds = base + per_unit * units
+
+choose() asks every model and picks the cheapest. record() feeds the real
+time back in after each copy, so the estimates settle on what this machine
+actually does. The models are saved next to the preferences and carried
+over between sessions.
+
+None of this is used unless preferences.derig_copy_weights is set to AUTO.
+SWAP stays the default even once a model has been saved. The model only
+knows which method is fastest, not whether it copies the same weights, and
+BULK and FLOOD haven't been shown to match SWAP's output yet.
+"""
+
+import contextlib
+import json
+import pathlib
+
+from cg3dcasc import preferences
+from . import weights
+
+
+MODEL_NAME = 'copy_weights_model.json'
+
+LEARNING_RATE = 0.3
+"""How much one new timing moves the estimate, between 0 and 1"""
+
+DEFAULT_MODEL = {
+    #rough priors from the Mazu/Waitress timings that used to live in
+    #utils._clone_meshes()
+    preferences.CopyWeightType.SWAP.name: {'base': 0.05, 'per_unit': 0.06},
+    preferences.CopyWeightType.FLOOD.name: {'base': 0.1, 'per_unit': 1.2e-5},
+    preferences.CopyWeightType.PER_VERT.name: {'base': 0.1, 'per_unit': 9e-4},
+    preferences.CopyWeightType.BULK.name: {'base': 0.1, 'per_unit': 2e-7 if weights.numpy_exists else 2e-6},
+}
+
+_model = None
+_frozen = 0
+
+
+class ClusterStats(object):
+    """The cheap numbers the estimates are based on"""
+
+    def __init__(self, vertices, influences, replaced, max_influences):
+        self.vertices = vertices
+        self.influences = influences
+        self.replaced = replaced
+        self.max_influences = max_influences
+
+
+    def units(self, copy_method):
+        """How much work copy_method has to do, in that method's unit"""
+        if copy_method == preferences.CopyWeightType.SWAP:
+            return self.replaced
+        if copy_method == preferences.CopyWeightType.FLOOD:
+            return self.replaced * self.vertices
+        if copy_method == preferences.CopyWeightType.PER_VERT:
+            return self.vertices * min(self.max_influences or self.influences, self.influences)
+        if copy_method == preferences.CopyWeightType.BULK:
+            return self.vertices * self.influences
+
+        return 0
+
+
+def get_stats(skin_cluster_node, originals):
+    """Gather ClusterStats without reading any weights"""
+    geometry = skin_cluster_node.getGeometry()
+    vertices = geometry[0].numVertices() if geometry else 0
+    influences = len(skin_cluster_node.getInfluence())
+    max_influences = skin_cluster_node.maxInfluences.get()
+
+    return ClusterStats(vertices, influences, len(originals), max_influences)
+
+
+def _get_model_path():
+    return pathlib.Path(preferences.__path__[0]).joinpath(MODEL_NAME)
+
+
+def get_model():
+    """Return the cost models, loading the saved ones the first time"""
+    global _model
+
+    if _model is not None:
+        return _model
+
+    _model = {name: dict(values) for name, values in DEFAULT_MODEL.items()}
+    model_path = _get_model_path()
+    if model_path.exists():
+        try:
+            with open(model_path) as f:
+                saved = json.load(f)
+            for name, values in saved.items():
+                if name in _model:
+                    _model[name].update(values)
+        except (OSError, ValueError) as e:
+            print(f"Copy weight model reset: {e}")
+
+    return _model
+
+
+@contextlib.contextmanager
+def frozen():
+    """Leave the model alone inside the block, record() and save() do nothing
+
+    derig_benchmark uses this so synthetic characters don't overwrite what
+    was learned from real ones.
+    """
+    global _frozen
+
+    _frozen += 1
+    try:
+        yield
+    finally:
+        _frozen -= 1
+
+
+def save():
+    if _model is None or _frozen:
+        return
+
+    try:
+        with open(_get_model_path(), 'w') as f:
+            json.dump(_model, f, indent=4)
+    except OSError as e:
+        print(f"Couldn't save the copy weight model: {e}")
+
+
+def estimate(copy_method, stats):
+    """Estimated seconds for copy_method to copy a cluster with these stats"""
+    values = get_model()[copy_method.name]
+    return values['base'] + values['per_unit'] * stats.units(copy_method)
+
+
+def choose(stats, copy_method=None):
+    """Return the CopyWeightType to use for a cluster
+
+    Args:
+        stats (ClusterStats) : the cluster being copied.
+        copy_method (CopyWeightType) : a method to force. Defaults to the
+        preference, and AUTO means pick the cheapest estimate.
+    """
+    if copy_method is None:
+        copy_method = getattr(preferences.get(), 'derig_copy_weights', preferences.CopyWeightType.SWAP)
+
+    if copy_method != preferences.CopyWeightType.AUTO:
+        return copy_method
+
+    candidates = [preferences.CopyWeightType[name] for name in get_model()]
+    return min(candidates, key=lambda candidate: estimate(candidate, stats))
+
+
+def record(copy_method, stats, seconds):
+    """Move copy_method's estimate toward a measured time. Call save() after."""
+    units = stats.units(copy_method)
+    if units <= 0 or _frozen:
+        return
+
+    values = get_model()[copy_method.name]
+    observed = max(0.0, seconds - values['base']) / units
+    values['per_unit'] += LEARNING_RATE * (observed - values['per_unit'])
+    values['samples'] = values.get('samples', 0) + 1
@@ -0,0 +1,224 @@
+"""Time the derig pipeline with every weight copy method
+
+The only record of how the copy methods compare used to be comments next to
+them in utils._clone_meshes(). This builds synthetic skinned characters of
+known sizes in an empty scene, runs utils._derig_selection() on each with
+every concrete preferences.CopyWeightType, and writes the time spent in each phase
+to a JSON file. Comparing against a saved baseline flags anything that got
+slower.
+
+Run it from the script editor, or from mayapy. It replaces the open scene,
+so it refuses to start while the scene has unsaved changes:
+
+    import cg3dcasc.core.derig_benchmark as bench
+    results = bench.run()
+    bench.save_baseline(results)   #once, on a build you trust
+    ...
+    bench.run(compare=True)        #later, after changes
+"""
+
+import json
+import os
+import pathlib
+import tempfile
+import time
+
+import maya.cmds as cmds
+import pymel.core as pm
+
+from cg3dcasc import preferences
+from . import copy_strategy
+from . import utils
+
+
+RESULTS_ROOT = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc_benchmarks'))
+RESULTS_PATH = RESULTS_ROOT.joinpath('derig_results.json')
+BASELINE_PATH = RESULTS_ROOT.joinpath('derig_baseline.json')
+
+CASES = [
+    {'name': 'small', 'vertices': 1000, 'influences': 10},
+    {'name': 'medium', 'vertices': 10000, 'influences': 40},
+    {'name': 'large', 'vertices': 40000, 'influences': 120},
+]
+"""The characters to build. Waitress and Mazu sit between medium and large."""
+
+MAX_INFLUENCES = 4
+
+TOLERANCE = 0.2
+"""How much slower (as a fraction) than the baseline counts as a regression"""
+
+MINIMUM_SECONDS = 0.05
+"""Phases shorter than this are too noisy to compare"""
+
+
+def build_character(vertices, influences, name='bench'):
+    """Make a plane bound to a chain of joints running along it
+
+    Args:
+        vertices (int) : roughly how many vertices the mesh gets.
+        influences (int) : how many joints it's bound to.
+
+    Returns:
+        (mesh transform, [joints])
+    """
+    divisions = max(1, int(vertices ** 0.5) - 1)
+    mesh = cmds.polyPlane(name=f'{name}_mesh', width=influences, height=10,
+                          subdivisionsX=divisions, subdivisionsY=divisions,
+                          constructionHistory=False)[0]
+
+    cmds.select(clear=True)
+    joints = []
+    for index in range(influences):
+        x = index - influences * 0.5
+        joints.append(cmds.joint(name=f'{name}_joint{index}', position=(x, 0, 0)))
+
+    cmds.skinCluster(joints, mesh, toSelectedBones=True, maximumInfluences=MAX_INFLUENCES,
+                     name=f'{name}_skinCluster')
+
+    return (mesh, joints)
+
+
+def _check_scene(discard):
+    """Raise RuntimeError rather than throw away unsaved changes"""
+    if not discard and cmds.file(query=True, modified=True):
+        raise RuntimeError("The derig benchmark replaces the open scene. Save it first, "
+                           "or pass discard=True to throw the changes away.")
+
+
+def run_case(case, copy_method, discard=False):
+    """Derig one synthetic character with one copy method
+
+    The timings aren't fed to copy_strategy, so the saved model is left as
+    it was.
+
+    Args:
+        discard (bool) : replace the open scene even if it has unsaved
+        changes.
+
+    Returns:
+        dict : the case, the method, total seconds and seconds per phase.
+    """
+    _check_scene(discard)
+    cmds.file(new=True, force=True)
+    mesh, joints = build_character(case['vertices'], case['influences'], case['name'])
+    pm.select([mesh] + joints, replace=True)
+
+    start_time = time.perf_counter()
+    with copy_strategy.frozen(), utils.record_phases() as phases:
+        utils._derig_selection(copy_method)
+
+    return {
+        'case': case['name'],
+        'vertices': cmds.polyEvaluate(mesh, vertex=True),
+        'influences': case['influences'],
+        'method': copy_method.name,
+        'total': time.perf_counter() - start_time,
+        'phases': dict(phases),
+    }
+
+
+def run(cases=None, methods=None, results_path=RESULTS_PATH, compare=False,
+        baseline_path=BASELINE_PATH, discard=False):
+    """Run every case with every method and save the results
+
+    Args:
+        cases (list) : dicts like CASES. Defaults to CASES.
+        methods (list) : CopyWeightTypes to run. Defaults to all of them
+        except AUTO, which only ever picks one of the others.
+        results_path : where the JSON results are written.
+        compare (bool) : check the results against the baseline.
+        discard (bool) : replace the open scene even if it has unsaved
+        changes.
+
+    Returns:
+        dict : the results that were written.
+    """
+    cases = CASES if cases is None else cases
+    if methods is None:
+        methods = [m for m in preferences.CopyWeightType if m != preferences.CopyWeightType.AUTO]
+
+    _check_scene(discard)
+    runs = []
+    for case in cases:
+        for copy_method in methods:
+            print(f"Benchmarking {case['name']} with {copy_method.name}")
+            #every case after the first replaces the benchmark's own scene
+            runs.append(run_case(case, copy_method, discard=True))
+
+    results = {
+        'maya': cmds.about(version=True),
+        'created': time.time(),
+        'runs': runs,
+    }
+
+    results_path = pathlib.Path(results_path)
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    report(results)
+    if compare:
+        regressions(results, load(baseline_path))
+
+    return results
+
+
+def load(path=BASELINE_PATH):
+    """Read saved results, or None if there aren't any"""
+    path = pathlib.Path(path)
+    if not path.exists():
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """Keep these results to compare later runs against"""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+
+def report(results):
+    for entry in results['runs']:
+        phases = ', '.join(f"{name}: {seconds:.3f}" for name, seconds in sorted(entry['phases'].items()))
+        print(f"{entry['case']:>8} {entry['method']:>8} {entry['total']:8.3f}s  ({phases})")
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    """Compare results against a baseline
+
+    Returns:
+        list : (case, method, phase, baseline seconds, new seconds) for
+        every phase (or 'total') that got more than tolerance slower.
+    """
+    if not baseline:
+        print("No derig baseline to compare against")
+        return []
+
+    previous = {(entry['case'], entry['method']): entry for entry in baseline['runs']}
+    slower = []
+    for entry in results['runs']:
+        old_entry = previous.get((entry['case'], entry['method']))
+        if old_entry is None:
+            continue
+
+        timings = dict(entry['phases'], total=entry['total'])
+        old_timings = dict(old_entry['phases'], total=old_entry['total'])
+        for phase, seconds in timings.items():
+            old_seconds = old_timings.get(phase)
+            if old_seconds is None or old_seconds < MINIMUM_SECONDS:
+                continue
+
+            if seconds > old_seconds * (1.0 + tolerance):
+                slower.append((entry['case'], entry['method'], phase, old_seconds, seconds))
+
+    for case, method, phase, old_seconds, seconds in slower:
+        print(f"Regression: {case} {method} {phase} {old_seconds:.3f}s -> {seconds:.3f}s")
+
+    if not slower:
+        print("No derig regressions")
+
+    return slower
@@ -0,0 +1,211 @@
+"""Reuse the last FBX of export sets that haven't changed
+
+casc_export.export() writes every export set to FBX on every update, even
+when nothing in the set changed. Before exporting, _export_data() now takes
+a cheap fingerprint of what's about to be exported. If it matches the
+fingerprint stored with the last export of that set, the cached FBX is
+linked into the transfer folder instead of running the exporter, and the
+manifest entry is flagged 'unchanged' so Cascadeur can skip re-importing it.
+
+The fingerprint has to be much cheaper than the export it skips, so it
+only reads what Maya already has at hand:
+    - the nodes being exported and their local matrices
+    - mesh topology counts, shading groups and the object space bounding
+      box of the undeformed shape
+    - skinCluster influences and geometry
+    - the keys of every animCurve and the text of every expression upstream
+      of the nodes, so constraints and control rigs are followed
+    - the frame range, up axis and export options (bake, include children)
+
+Rig exports are never cached, fingerprint(export_rig=True) returns None.
+Edits that leave all of that alone aren't caught: painted weights, points
+moved inside the mesh's bounding box, or anything driven from outside the
+DG (e.g. a script job). clear() the cache (or turn ENABLED off) after those.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+
+import maya.cmds as cmds
+
+
+ENABLED = True
+
+CACHE_ROOT = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc_cache'))
+"""Kept outside transfer.EXPORT_ROOT, as transaction folders get pruned"""
+
+
+def _names(nodes):
+    return sorted(node.longName() if hasattr(node, 'longName') else str(node) for node in nodes)
+
+
+def _rest_shape(mesh):
+    """The deformed mesh's intermediate (original) shape, or the mesh itself
+
+    A skinned mesh's own bounding box moves with the current frame.
+    """
+    parents = cmds.listRelatives(mesh, parent=True, fullPath=True) or []
+    shapes = cmds.listRelatives(parents, shapes=True, fullPath=True, type='mesh') or [] if parents else []
+    for shape in shapes:
+        if cmds.getAttr(f"{shape}.intermediateObject"):
+            return shape
+
+    return mesh
+
+
+def _mesh_stamp(mesh):
+    """Topology counts, bounding box and shading groups, all cached by Maya"""
+    name = str(mesh)
+    counts = cmds.polyEvaluate(name, vertex=True, edge=True, face=True, uvcoord=True)
+    rest = _rest_shape(name)
+    bounds = [round(v, 5) for attr in ('boundingBoxMin', 'boundingBoxMax')
+              for v in cmds.getAttr(f"{rest}.{attr}")[0]]
+    engines = sorted(set(cmds.listConnections(name, type='shadingEngine') or []))
+    return [counts, bounds, engines]
+
+
+def _curve_stamp(curve):
+    keys = cmds.keyframe(curve, query=True, timeChange=True, valueChange=True) or []
+    angles = cmds.keyTangent(curve, query=True, inAngle=True, outAngle=True) or []
+    return keys + angles
+
+
+def fingerprint(nodes, meshes, skin_clusters, **options):
+    """Return a digest of everything that ends up in an export set's FBX
+
+    Args:
+        nodes : every DAG node that will be selected for the export.
+        meshes : the mesh shapes being exported.
+        skin_clusters : the skinClusters being exported.
+        **options : export options that change the FBX, e.g. bake.
+
+    Returns:
+        str : a hex digest, or None when the export can't be cached.
+    """
+    if options.get('export_rig'):
+        #the qrig and HIK stance pose aren't covered by anything here
+        return None
+
+    node_names = _names(nodes)
+    frame_range = [cmds.playbackOptions(query=True, animationStartTime=True),
+                   cmds.playbackOptions(query=True, animationEndTime=True)]
+    parts = {
+        'nodes': node_names,
+        'options': options,
+        'range': frame_range,
+        'up_axis': cmds.upAxis(query=True, axis=True),
+        'matrices': [cmds.getAttr(f"{name}.matrix") for name in node_names
+                     if cmds.attributeQuery('matrix', node=name, exists=True)],
+        'meshes': {name: _mesh_stamp(name) for name in _names(meshes)},
+        'clusters': {},
+        'curves': {},
+        'expressions': {},
+    }
+
+    for cluster in _names(skin_clusters):
+        parts['clusters'][cluster] = [
+            sorted(cmds.skinCluster(cluster, query=True, influence=True) or []),
+            sorted(cmds.skinCluster(cluster, query=True, geometry=True) or []),
+        ]
+
+    if node_names:
+        #constraints, control rigs and driven keys all show up upstream
+        history = cmds.listHistory(node_names) or []
+        for curve in sorted(set(cmds.ls(history, type='animCurve'))):
+            parts['curves'][curve] = _curve_stamp(curve)
+        for expression in sorted(set(cmds.ls(history, type='expression'))):
+            parts['expressions'][expression] = cmds.expression(expression, query=True, string=True)
+
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _entry_paths(set_id):
+    return (CACHE_ROOT.joinpath(f"{set_id}.fbx"), CACHE_ROOT.joinpath(f"{set_id}.json"))
+
+
+def _link_or_copy(source, target):
+    """Hard link when possible, it's instant. Copy when it isn't."""
+    target = pathlib.Path(target)
+    if target.exists():
+        target.unlink()
+
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def restore(set_id, digest, target_path):
+    """Put the cached FBX for set_id at target_path if the digest matches
+
+    Returns:
+        dict : the cache entry (with the file's 'sha1') when the cache was
+        used, otherwise None.
+    """
+    if not ENABLED or not set_id or not digest:
+        return None
+
+    fbx_path, info_path = _entry_paths(set_id)
+    if not fbx_path.exists() or not info_path.exists():
+        return None
+
+    try:
+        with open(info_path) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if info.get('digest') != digest:
+        return None
+
+    try:
+        _link_or_copy(fbx_path, target_path)
+    except OSError as e:
+        print(f"Couldn't reuse the cached export for {set_id}: {e}")
+        return None
+
+    return info
+
+
+def last_digest(set_id):
+    """The fingerprint of set_id's last export, or None"""
+    info_path = _entry_paths(set_id)[1]
+    try:
+        with open(info_path) as f:
+            return json.load(f).get('digest')
+    except (OSError, ValueError):
+        return None
+
+
+def store(set_id, digest, exported_path, sha1=None):
+    """Remember a fresh export of set_id"""
+    if not ENABLED or not set_id or not digest or not os.path.exists(exported_path):
+        return
+
+    CACHE_ROOT.mkdir(exist_ok=True)
+    fbx_path, info_path = _entry_paths(set_id)
+    try:
+        _link_or_copy(exported_path, fbx_path)
+        with open(info_path, 'w') as f:
+            json.dump({'digest': digest, 'sha1': sha1}, f)
+    except OSError as e:
+        print(f"Couldn't cache the export for {set_id}: {e}")
+
+
+def clear(set_id=None):
+    """Forget the cached export of one set, or of every set"""
+    if not CACHE_ROOT.exists():
+        return
+
+    if set_id is None:
+        shutil.rmtree(CACHE_ROOT, ignore_errors=True)
+        return
+
+    for path in _entry_paths(set_id):
+        if path.exists():
+            path.unlink()
@@ -2,6 +2,8 @@ import pymel.core as pm
 import os
 import cg3dguru.utils
 
+from . import trace
+
 #http://tech-artists.org/forum/showthread.php?4988-Problem-doing-an-FBX-export-with-PyMEL
 #http://download.autodesk.com/global/docs/maya2014/en_us/index.html?url=files/GUID-377B0ACE-CEC8-4D13-81E9-E8C9425A8B6E.htm,topicNumber=d30e145135
 
@@ -13,77 +15,194 @@ EXPORT_ANIM_RIG = EXPORT_ANIM | EXPORT_RIG
 
 
 
-def set_export_options(export_type, bake_animations=True, remove_namespaces=False):
-    ##https://help.autodesk.com/view/MAYAUL/2022/ENU/index.html?guid=GUID-699CDF74-3D64-44B0-967E-7427DF800290
-    start = int(pm.animation.playbackOptions(query=True, animationStartTime=True))
-    end = int(pm.animation.playbackOptions(query=True, animationEndTime=True))
-    _bake_anims = bool(export_type & EXPORT_ANIM)
-    export_rig = bool(export_type & EXPORT_RIG)
-    
-    print('export animations:{0} export rig:{1}'.format(_bake_anims, export_rig))
-    print('start:{0} end:{1}'.format(start, end))
-    
-    pm.mel.FBXResetExport()
-    pm.mel.FBXExportUpAxis(v=pm.cmds.upAxis(q=True, axis=True))
-    pm.mel.FBXExportBakeComplexStart(v=start)
-    pm.mel.FBXExportBakeComplexEnd(v=end)
-    pm.mel.FBXExportBakeComplexAnimation(v= _bake_anims and bake_animations)    
-    pm.mel.FBXExportBakeResampleAnimation (v= True )
-    pm.mel.FBXExportSkins(v=export_rig)
-    
-    pm.mel.FBXExportShapes(v=True)
-    
-    pm.mel.FBXExportConstraints(v=False)
-    pm.mel.FBXExportInputConnections(v=False)
-    #pm.mel.FBXExportUseSceneName(v=True)   //This uses the maya filename for the clip being exported
-    pm.mel.FBXExportCameras(v=False)
-    pm.mel.FBXExportLights(v=False)
-    
-    pm.mel.FBXExportInAscii(v=remove_namespaces)
-    #pm.mel.FBXExportFileVersion(v='FBX201300')
-    
-    pm.mel.FBXExportAnimationOnly(v=not export_rig)
-    
+class Profile(object):
+    """A full set of FBX exporter options
+
+    Options are keyed by the MEL command that sets them, e.g.
+    {'FBXExportSkins': True}. Every profile sets the same commands, so
+    diff() against the last applied profile is all that has to change.
+    """
+
+    def __init__(self, name='', **options):
+        self.name = name
+        self.options = dict(options)
+
+
+    def __repr__(self):
+        return 'Profile({0}, {1} options)'.format(self.name, len(self.options))
+
+
+    def __eq__(self, other):
+        return isinstance(other, Profile) and self.options == other.options
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def updated(self, name=None, **options):
+        """A copy with some options replaced"""
+        return Profile(name or self.name, **dict(self.options, **options))
+
+
+    def diff(self, other):
+        """The options that differ from other, all of them if other is None"""
+        if other is None:
+            return dict(self.options)
+
+        return {command: value for command, value in self.options.items()
+                if command not in other.options or other.options[command] != value}
+
+
+
+_BASE_PROFILE = Profile(
+    FBXExportSkeletonDefinitions=True,
+    FBXExportBakeComplexStart=0,
+    FBXExportBakeComplexEnd=0,
+    FBXExportBakeComplexAnimation=True,
+    FBXExportBakeResampleAnimation=True,
+    FBXExportUpAxis='y',
+    FBXExportShapes=True,
+    FBXExportConstraints=False,
+    FBXExportIncludeChildren=True,
+    FBXExportInputConnections=False,
+    #FBXExportUseSceneName=True   //This uses the maya filename for the clip being exported
+    FBXExportCameras=False,
+    FBXExportLights=False,
+    FBXExportInAscii=False,
+    #FBXExportFileVersion='FBX201300'
+)
+
+ANIMATION = _BASE_PROFILE.updated('animation', FBXExportSkins=False, FBXExportAnimationOnly=True)
+"""Baked animation only, no skins or geometry"""
+
+RIG = _BASE_PROFILE.updated('rig', FBXExportSkins=True, FBXExportAnimationOnly=False)
+"""Skinned meshes, joints and baked animation"""
+
+MODEL = RIG.updated('model', FBXExportBakeComplexAnimation=False)
+"""Skinned meshes and joints without any animation"""
+
+PROFILES = {profile.name: profile for profile in (ANIMATION, RIG, MODEL)}
+
+_POSITIONAL = {'FBXExportUpAxis'}
+"""Commands that take their value without -v"""
+
+_applied = None
+
 
+def get_profile(profile=None, export_type=EXPORT_ANIM_RIG):
+    """Return a Profile from a Profile, a PROFILES name or an export_type"""
+    if isinstance(profile, Profile):
+        return profile
+    if profile:
+        return PROFILES[profile]
 
-def export(filename, export_type=EXPORT_ANIM_RIG, bake_animations=True, remove_namespaces=False, include_children=True):
+    if export_type & EXPORT_RIG:
+        return RIG if export_type & EXPORT_ANIM else MODEL
+
+    return ANIMATION
+
+
+def apply_profile(profile, force=False):
+    """Set the exporter's options, skipping any that are already set
+
+    The exporter is only reset the first time, or after forget_applied().
+
+    Returns:
+        dict : the options that were set.
+    """
+    global _applied
+
+    if force or _applied is None:
+        pm.mel.FBXResetExport()
+        changes = profile.diff(None)
+    else:
+        changes = profile.diff(_applied)
+
+    for command, value in changes.items():
+        if command in _POSITIONAL:
+            getattr(pm.mel, command)(value)
+        else:
+            getattr(pm.mel, command)(v=value)
+
+    _applied = profile
+    return changes
+
+
+def mel_commands(profile):
+    """The MEL commands that set every one of profile's options
+
+    This is for exporters without pymel, see batch_worker.
+    """
+    commands = []
+    for command, value in profile.options.items():
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+
+        if command in _POSITIONAL:
+            commands.append('{0} {1}'.format(command, value))
+        else:
+            commands.append('{0} -v {1}'.format(command, value))
+
+    return commands
+
+
+def forget_applied():
+    """Make the next apply_profile() reset the exporter
+
+    Call this before a batch of exports, the FBX export dialog can change
+    any of the options in between.
+    """
+    global _applied
+    _applied = None
+
+
+def _export_profile(export_type, bake_animations, remove_namespaces, include_children, frame_range, profile):
     ##https://help.autodesk.com/view/MAYAUL/2022/ENU/index.html?guid=GUID-699CDF74-3D64-44B0-967E-7427DF800290
-    start = int(pm.animation.playbackOptions(query=True, animationStartTime=True))
-    end = int(pm.animation.playbackOptions(query=True, animationEndTime=True))
-    _bake_anims = bool(export_type & EXPORT_ANIM)
-    export_rig = bool(export_type & EXPORT_RIG)
-    
-    print('export animations:{0} export rig:{1}'.format(_bake_anims, export_rig))
+    #frame_range (start, end) bakes only part of the playback range
+    if frame_range:
+        start, end = (int(frame) for frame in frame_range)
+    else:
+        start = int(pm.animation.playbackOptions(query=True, animationStartTime=True))
+        end = int(pm.animation.playbackOptions(query=True, animationEndTime=True))
+
+    profile = get_profile(profile, export_type)
+    bake = profile.options['FBXExportBakeComplexAnimation'] and bake_animations
+
+    print('export profile:{0} bake animations:{1}'.format(profile.name, bake))
     print('start:{0} end:{1}'.format(start, end))
-    
-    pm.mel.FBXResetExport()
-    pm.mel.FBXExportSkeletonDefinitions(v=True)
-    pm.mel.FBXExportBakeComplexStart(v=start)
-    pm.mel.FBXExportBakeComplexEnd(v=end)
-    pm.mel.FBXExportBakeComplexAnimation(v= _bake_anims and bake_animations)    
-    pm.mel.FBXExportBakeResampleAnimation (v= True )
-    pm.mel.FBXExportSkins(v=export_rig )
-
-    pm.mel.FBXExportUpAxis(pm.cmds.upAxis(q=True, axis=True))
-    pm.mel.FBXExportShapes(v=True)
-    
-    pm.mel.FBXExportConstraints(v=False)
-    
-    pm.mel.FBXExportIncludeChildren(v=include_children)
-    pm.mel.FBXExportInputConnections(v=False)
-    #pm.mel.FBXExportUseSceneName(v=True)   //This uses the maya filename for the clip being exported
-    pm.mel.FBXExportCameras(v=False)
-    pm.mel.FBXExportLights(v=False)
-    
-    pm.mel.FBXExportInAscii(v=remove_namespaces)
-    #pm.mel.FBXExportFileVersion(v='FBX201300')
-    
-    pm.mel.FBXExportAnimationOnly(v=not export_rig)
-    
+
+    return profile.updated(
+        FBXExportBakeComplexStart=start,
+        FBXExportBakeComplexEnd=end,
+        FBXExportBakeComplexAnimation=bake,
+        FBXExportUpAxis=pm.cmds.upAxis(q=True, axis=True),
+        FBXExportIncludeChildren=include_children,
+        FBXExportInAscii=remove_namespaces,
+    )
+
+
+def set_export_options(export_type, bake_animations=True, remove_namespaces=False):
+    apply_profile(_export_profile(export_type, bake_animations, remove_namespaces, True, None, None))
+
+
+@trace.traced('fbx.export')
+def export(filename, export_type=EXPORT_ANIM_RIG, bake_animations=True, remove_namespaces=False, include_children=True,
+           frame_range=None, profile=None):
+    """Export the selection to filename
+
+    profile is a Profile or PROFILES name and takes the place of
+    export_type. Only the options that differ from the last export are set.
+    """
+    profile = _export_profile(export_type, bake_animations, remove_namespaces,
+                              include_children, frame_range, profile)
+    apply_profile(profile)
 
     pm.mel.FBXExport(s=True, f=filename)
-    if os.path.exists(filename) and remove_namespaces:
-        cg3dguru.utils.remove_namespaces(filename)  
+    if os.path.exists(filename):
+        trace.count('bytes_written', os.path.getsize(filename))
+        if remove_namespaces:
+            cg3dguru.utils.remove_namespaces(filename)  
     
 
 def export_anim(filename, *args, **kwargs):
@@ -0,0 +1,155 @@
+"""Answer DAG hierarchy questions from full paths instead of node by node
+
+Walking up with getParent() and down with listRelatives() costs a PyMEL call
+per node, which adds up to tens of thousands of calls on big rigs. A node's
+full DAG path already names every one of its ancestors ('|root|hips|spine'),
+so a Snapshot fetches the paths it needs in bulk ls(long=True) and
+listRelatives(fullPath=True) calls and does the rest as string work.
+
+Paths go back to PyNodes with one more bulk call, see to_nodes().
+"""
+
+import maya.cmds as cmds
+import pymel.core as pm
+
+
+SEPARATOR = '|'
+
+
+def parent_path(path):
+    """'|a|b|c' -> '|a|b', and None for a root"""
+    parent = path.rpartition(SEPARATOR)[0]
+    return parent or None
+
+
+def root_path(path):
+    """'|a|b|c' -> '|a'"""
+    return SEPARATOR + path.split(SEPARATOR, 2)[1]
+
+
+def long_names(nodes):
+    """Full paths for DAG nodes (PyNodes or names) in one query"""
+    names = [str(node) for node in nodes]
+    if not names:
+        #ls() lists the whole scene when handed nothing
+        return []
+
+    return cmds.ls(names, long=True) or []
+
+
+def to_nodes(paths):
+    """PyNodes for full paths in one query"""
+    paths = list(paths)
+    if not paths:
+        return set()
+
+    return set(pm.ls(paths))
+
+
+
+class Snapshot(object):
+    """An in-memory parent/child tree of the paths it's been given
+
+    Args:
+        nodes : DAG nodes to start with. More can be added with add().
+    """
+
+    def __init__(self, nodes=()):
+        self.paths = set()
+        self.children = {}
+        self._ancestors = {}
+        self._descendants = {}
+        self.add(nodes)
+
+
+    def _insert(self, path):
+        #registering a path registers its ancestors too, so children is a
+        #complete tree from the roots down.
+        while path and path not in self.paths:
+            self.paths.add(path)
+            parent = parent_path(path)
+            if parent is None:
+                break
+
+            self.children.setdefault(parent, set()).add(path)
+            path = parent
+
+
+    def add(self, nodes):
+        """Add nodes to the tree
+
+        Returns:
+            list : the full paths of nodes.
+        """
+        paths = long_names(nodes)
+        for path in paths:
+            self._insert(path)
+
+        self._descendants.clear()
+        return paths
+
+
+    def load_descendants(self, paths):
+        """Fetch everything under paths in one listRelatives() call"""
+        paths = list(paths)
+        if not paths:
+            return
+
+        for path in cmds.listRelatives(paths, allDescendents=True, fullPath=True) or []:
+            self._insert(path)
+
+        self._descendants.clear()
+
+
+    def ancestors(self, path):
+        """Every ancestor of path, from its root down"""
+        result = self._ancestors.get(path)
+        if result is None:
+            parts = path.split(SEPARATOR)
+            result = tuple(SEPARATOR.join(parts[:end]) for end in range(2, len(parts)))
+            self._ancestors[path] = result
+
+        return result
+
+
+    def descendants(self, path):
+        """Every path under path that's in the tree"""
+        result = self._descendants.get(path)
+        if result is None:
+            result = set()
+            stack = [path]
+            while stack:
+                children = self.children.get(stack.pop(), ())
+                result.update(children)
+                stack.extend(children)
+
+            self._descendants[path] = result
+
+        return result
+
+
+    def ancestor_closure(self, paths):
+        result = set()
+        for path in paths:
+            result.update(self.ancestors(path))
+
+        return result
+
+
+    def descendant_closure(self, paths):
+        result = set()
+        for path in paths:
+            result.update(self.descendants(path))
+
+        return result
+
+
+    @staticmethod
+    def roots(paths):
+        return {root_path(path) for path in paths}
+
+
+
+def roots(nodes):
+    """The top level transform above each node, as PyNodes"""
+    return to_nodes(Snapshot.roots(long_names(nodes)))
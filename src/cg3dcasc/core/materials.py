@@ -1,73 +1,153 @@
 #https://github.khronos.org/glTF-MaterialX-Converter/
 #https://www.google.com/search?q=maya+materialx+to+glTF&sca_esv=2da0fcebb3bfa148&rlz=1C1ONGR_enUS1121US1121&ei=T5IoaeivDaLIptQPmuXrqAk&ved=0ahUKEwiok4WU9ZKRAxUipIkEHZryGpUQ4dUDCBM&uact=5&oq=maya+materialx+to+glTF&gs_lp=Egxnd3Mtd2l6LXNlcnAiFm1heWEgbWF0ZXJpYWx4IHRvIGdsVEYyBxAhGKABGAoyBxAhGKABGAoyBxAhGKABGAoyBxAhGKABGAoyBxAhGKABGAoyBRAhGJ8FMgUQIRifBTIFECEYnwUyBRAhGJ8FMgUQIRifBUjMHFAAWMwZcAB4AZABAJgBcKABuQyqAQQxNi4zuAEDyAEA-AEB-AECmAIToAL9DMICCxAAGIAEGJECGIoFwgIREC4YgAQYsQMY0QMYgwEYxwHCAgUQLhiABMICCBAAGIAEGLEDwgIOEAAYgAQYsQMYgwEYigXCAgsQLhiABBixAxiDAcICChAAGIAEGEMYigXCAgoQLhiABBhDGIoFwgIOEC4YgAQYsQMY0QMYxwHCAhEQLhiABBixAxiDARjHARivAcICBRAAGIAEwgILEAAYgAQYsQMYgwHCAggQLhiABBixA8ICCxAAGIAEGIYDGIoFwgIIEAAYFhgKGB7CAgYQABgWGB7CAgcQABiABBgNwgIGEAAYDRgewgIIEAAYBRgNGB7CAggQABgIGA0YHsICCBAAGIAEGKIEwgIFEAAY7wWYAwCSBwQxNC41oAfm6AGyBwQxNC41uAf9DMIHBjAuMTUuNMgHMg&sclient=gws-wiz-serp
+import functools
 import pathlib
 
 
 import pymel.core as pm
 
+from . import trace
 
 
-def get_textures(objs, export_nodes=[]):
-    materials = {}
+TEXTURE_CACHE_SIZE = 1024
+"""How many resolved texture paths are remembered during an export,
+casc_export.export() clears them before it starts"""
+
+
+@functools.lru_cache(maxsize=TEXTURE_CACHE_SIZE)
+def resolve_texture_path(filepath):
+    """Prefer a .png next to the texture when there is one"""
+    file = pathlib.Path(filepath)
+    if file.suffix.lower() != '.png':
+        png = file.parent.joinpath(f"{file.stem}.png")
+        if png.exists():
+            return str(png).replace("\\", "/")
+
+    return filepath
+
+
+def clear_cache():
+    """Forget resolved texture paths, e.g. after new .png files are written"""
+    resolve_texture_path.cache_clear()
+
+
+
+class ShadingIndex(object):
+    """shape -> shadingEngine -> shader -> texture lookups, each queried once
+
+    Characters share shading engines and shaders between many shapes, so
+    every shading engine and shader is only ever resolved once. Export set
+    membership is gathered up front as a set of names.
+
+    With resolve off texture paths are the file nodes' own, without
+    preferring a converted .png next to them.
+    """
+
+    def __init__(self, export_nodes=(), resolve=True):
+        self.resolve = resolve
+        self.export_members = set()
+        for export_node in export_nodes:
+            self.export_members.update(str(member) for member in export_node.members(True))
+
+        self.shape_engines = {}
+        self._engine_shaders = {}
+        self._shader_textures = {}
+
+
+    def load_shapes(self, shapes):
+        """Find the shading engines of every shape in one query"""
+        missing = [shape for shape in shapes if shape not in self.shape_engines]
+        if not missing:
+            return
+
+        for shape in missing:
+            self.shape_engines[shape] = set()
+
+        for plug, sg in pm.listConnections(missing, type='shadingEngine', connections=True) or []:
+            self.shape_engines.setdefault(plug.node(), set()).add(sg)
+
+
+    def engine_shaders(self, sg):
+        shaders = self._engine_shaders.get(sg)
+        if shaders is None:
+            shaders = pm.listConnections("%s.surfaceShader" % sg, s=True)
+            self._engine_shaders[sg] = shaders
+
+        return shaders
 
-    def _get_best_file_node(color_input):
-        nonlocal export_nodes
-        matches = []
-        for texture in color_input:
-            for export_node in export_nodes:
-                if texture in export_node.members(True):
-                    matches.append(texture)
 
+    def _get_best_file_node(self, color_input):
+        matches = [texture for texture in color_input if str(texture) in self.export_members]
         if matches:
             return matches
 
         #No matches were found so just return the original input
         return color_input
+
+
+    def shader_texture(self, shader):
+        """Return the texture path driving the shader's color, or ''"""
+        if shader not in self._shader_textures:
+            self._shader_textures[shader] = self._find_texture(shader)
+
+        return self._shader_textures[shader]
+
+
+    def _find_texture(self, shader):
+        color_attr = None
+        if hasattr(shader, 'color'):
+            color_attr = getattr(shader, 'color')
+        elif hasattr(shader, 'diffuse'):
+            color_attr = getattr(shader, 'diffuse')
+        elif hasattr(shader, 'baseColor'):
+            color_attr = getattr(shader, 'baseColor')
+            
+        if not color_attr:
+            return ''
+        
+        color_input = pm.listConnections(color_attr, s=True, d=False)
+        if not color_input:
+            return ''
     
-    
-    shapes = pm.listRelatives(objs, s=True)
-    shapes += pm.ls(objs, shapes=True)
-    for shape in shapes:
-        sgs = pm.listConnections(shape, type='shadingEngine' )
-        for sg in sgs:
-            shaders = pm.listConnections("%s.surfaceShader" % sg, s=True)
-            for shader in shaders:
-                color_attr = None
-                if hasattr(shader, 'color'):
-                    color_attr = getattr(shader, 'color')
-                elif hasattr(shader, 'diffuse'):
-                    color_attr = getattr(shader, 'diffuse')
-                elif hasattr(shader, 'baseColor'):
-                    color_attr = getattr(shader, 'baseColor')
-                    
-                if not color_attr:
-                    continue
-                
-                color_input = pm.listConnections(color_attr, s=True, d=False)
-                if not color_input:
-                    continue
+        color_input = pm.findType(color_input, type='file', forward=False,deep =True)
+        if not color_input:
+            return ''
+        
+        if len(color_input) > 1:
+            color_input = self._get_best_file_node(color_input)
             
-                color_input = pm.findType(color_input, type='file', forward=False,deep =True)
-                if not color_input:
-                    continue
-                
-                if len(color_input) > 1:
-                    color_input = _get_best_file_node(color_input)
-                    
-                if len(color_input) != 1:
-                    pm.warning(f"Found multiple textures for '{color_attr}' skipping texture. Note: You can add the preferred file node to your export set to fix this.")
-                    continue
+        if len(color_input) != 1:
+            pm.warning(f"Found multiple textures for '{color_attr}' skipping texture. Note: You can add the preferred file node to your export set to fix this.")
+            return ''
+
+        color_input = pm.PyNode(color_input[0])
+        filepath = color_input.fileTextureName.get()
+        return resolve_texture_path(filepath) if self.resolve else filepath
+
 
-                color_input = pm.PyNode(color_input[0])
-                filepath = color_input.fileTextureName.get()
-                file = pathlib.Path(filepath)
-                if file.suffix.lower() != '.png':
-                    png = file.parent.joinpath(f"{file.stem}.png")
-                    if png.exists():
 
-                        filepath = str(png).replace("\\", "/")
+@trace.traced('materials.get_textures')
+def get_textures(objs, export_nodes=[], index=None, resolve=True):
+    """Return {transform name: [texture paths]} for the shapes under objs
 
-                        
+    Args:
+        objs : nodes to look for shapes on and under.
+        export_nodes : export sets that can pick between competing file nodes.
+        index (ShadingIndex) : an index to reuse. One is made for this call
+        if it's not given.
+        resolve (bool) : prefer converted .png files, see ShadingIndex.
+    """
+    if index is None:
+        index = ShadingIndex(export_nodes, resolve)
+
+    materials = {}
+    shapes = pm.listRelatives(objs, s=True)
+    shapes += pm.ls(objs, shapes=True)
+    index.load_shapes(shapes)
+    for shape in shapes:
+        for sg in index.shape_engines.get(shape, ()):
+            for shader in index.engine_shaders(sg):
+                filepath = index.shader_texture(shader)
                 if filepath:
                     materials.setdefault(shape.getParent().name(), set()).add(filepath)
                     
@@ -75,4 +155,4 @@ def get_textures(objs, export_nodes=[]):
     for key, value in materials.items():
         materials[key] = list(value)
 
-    return materials
\ No newline at end of file
+    return materials
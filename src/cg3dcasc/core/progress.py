@@ -0,0 +1,249 @@
+"""Progress reporting and cancellation for long bridge operations
+
+Exports, imports, derigs and texture conversions report what they're doing
+into an operation:
+
+    @progress.tracked('Exporting', cancelled_result=False)
+    def export(...):
+        for node in export_nodes:
+            progress.update(phase='fbx', item=name, step=1)
+
+Every report becomes an event dict (see Operation.event()) that's handed to
+each sink registered with add_sink(). Maya shows them on its progress bar,
+Cascadeur as status messages, and the bridge channel forwards them to the
+other application, where they arrive through receive() marked 'remote'.
+
+update() and check() raise Cancelled once cancel() has been called, which
+is how the Maya progress bar's Esc key or a cancel message from the other
+application stops an operation at its next report.
+
+This module is shared by Maya and Cascadeur and has to stay identical on
+both sides.
+"""
+
+import contextlib
+import functools
+import threading
+import time
+
+
+START = 'start'
+UPDATE = 'update'
+END = 'end'
+
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+MIN_INTERVAL = 0.1
+"""Seconds between update events, phase changes are always sent"""
+
+SOURCE = ''
+"""Which application events come from, set by the application on startup"""
+
+_sinks = []
+_operations = []
+_lock = threading.Lock()
+
+
+class Cancelled(Exception):
+    """Raised inside an operation once it has been cancelled"""
+    pass
+
+
+class Operation(object):
+    """The state of one long running task
+
+    depth is how many operations it's nested inside, so sinks can stick to
+    the outermost one.
+    """
+
+    def __init__(self, name, total=0, depth=0):
+        self.name = name
+        self.depth = depth
+        self.phase = ''
+        self.item = ''
+        self.done = 0
+        self.total = total
+        self.bytes = 0
+        self.bytes_total = 0
+        self.status = RUNNING
+        self.start_time = time.perf_counter()
+        self.cancelled = False
+        self._last_emit = 0.0
+
+
+    def eta(self):
+        """Seconds left, going by the items done so far, or None"""
+        if not self.total or not self.done:
+            return None
+
+        elapsed = time.perf_counter() - self.start_time
+        return elapsed / self.done * max(0, self.total - self.done)
+
+
+    def event(self, kind):
+        return {
+            'type': kind,
+            'source': SOURCE,
+            'operation': self.name,
+            'depth': self.depth,
+            'phase': self.phase,
+            'item': self.item,
+            'done': self.done,
+            'total': self.total,
+            'bytes': self.bytes,
+            'bytes_total': self.bytes_total,
+            'elapsed': time.perf_counter() - self.start_time,
+            'eta': self.eta(),
+            'status': self.status,
+        }
+
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled(self.name)
+
+
+    def update(self, phase=None, item=None, done=None, total=None, step=0,
+               bytes_done=None, bytes_step=0, bytes_total=None):
+        phase_changed = phase is not None and phase != self.phase
+        if phase is not None:
+            self.phase = phase
+        if item is not None:
+            self.item = item
+        if total is not None:
+            self.total = total
+        if done is not None:
+            self.done = done
+        self.done += step
+        if bytes_total is not None:
+            self.bytes_total = bytes_total
+        if bytes_done is not None:
+            self.bytes = bytes_done
+        self.bytes += bytes_step
+
+        now = time.perf_counter()
+        finished = self.total and self.done >= self.total
+        if phase_changed or finished or now - self._last_emit >= MIN_INTERVAL:
+            self._last_emit = now
+            _emit(self.event(UPDATE))
+
+        self.check()
+
+
+
+def _emit(event):
+    for sink in list(_sinks):
+        try:
+            sink(event)
+        except Exception as e:
+            print(f"Progress sink failed: {e}")
+
+
+def add_sink(sink):
+    """Call sink(event) for every progress event"""
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def current():
+    """The innermost running operation, or None"""
+    return _operations[-1] if _operations else None
+
+
+@contextlib.contextmanager
+def operation(name, total=0):
+    """Run the block as an operation
+
+    Cancelled is left for the caller to handle, see tracked().
+    """
+    with _lock:
+        op = Operation(name, total, len(_operations))
+        _operations.append(op)
+
+    _emit(op.event(START))
+    try:
+        yield op
+        op.status = DONE
+    except Cancelled:
+        op.status = CANCELLED
+        raise
+    except Exception:
+        op.status = FAILED
+        raise
+    finally:
+        with _lock:
+            _operations.remove(op)
+        _emit(op.event(END))
+
+
+def tracked(name, cancelled_result=None):
+    """Decorator that runs func as an operation and returns cancelled_result
+    if it's cancelled"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                with operation(name):
+                    return func(*args, **kwargs)
+            except Cancelled:
+                print(f"{name} was cancelled")
+                return cancelled_result
+
+        return wrapper
+
+    return decorator
+
+
+def update(**kwargs):
+    """Report on the current operation, see Operation.update()"""
+    op = current()
+    if op is not None:
+        op.update(**kwargs)
+
+
+def check():
+    """Raise Cancelled if the current operation has been cancelled"""
+    op = current()
+    if op is not None:
+        op.check()
+
+
+def cancel():
+    """Cancel every running operation at its next report"""
+    with _lock:
+        operations = list(_operations)
+
+    for op in operations:
+        op.cancelled = True
+
+    return bool(operations)
+
+
+def receive(event):
+    """Hand an event from the other application to the sinks"""
+    _emit(dict(event, remote=True))
+
+
+def describe(event):
+    """A one line status message for an event"""
+    text = event['operation']
+    if event['phase']:
+        text += f" - {event['phase']}"
+    if event['item']:
+        text += f": {event['item']}"
+    if event['total']:
+        text += f" ({event['done']}/{event['total']})"
+    if event['eta'] is not None and event['type'] == UPDATE:
+        text += f" {event['eta']:.0f}s left"
+    if event['type'] == END:
+        text += f" {event['status']} in {event['elapsed']:.1f}s"
+
+    return text
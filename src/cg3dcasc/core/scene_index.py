@@ -0,0 +1,158 @@
+"""A joint/skinCluster/mesh index built once per operation
+
+The lookups in common (get_mesh_cluster_mappings(), get_joint_skin_clusters(),
+get_skin_cluster_joints()...) query the scene every time they're called, and
+one export or derig calls them over and over. Inside an operation they're
+answered from a SkinIndex instead, which queries every skinCluster once the
+first time it's needed:
+
+    @scene_index.indexed
+    def export(...):
+        ...
+
+The index is thrown away when the outermost operation ends, so nothing
+outside an operation changes. Code that adds or removes skinning inside an
+operation should call invalidate().
+
+enable_callbacks() keeps the index between operations instead, and Maya
+callbacks throw it away whenever a skinCluster is created, deleted or
+rewired.
+"""
+
+import contextlib
+import functools
+
+import pymel.core as pm
+import maya.api.OpenMaya as om2
+
+
+_index = None
+_depth = 0
+_callbacks = []
+
+
+class SkinIndex(object):
+    """Every skinCluster's meshes and joints, and the reverse lookups"""
+
+    def __init__(self):
+        self.cluster_meshes = {}
+        self.mesh_clusters = {}
+        self.cluster_joints = {}
+        self.joint_clusters = {}
+
+        for cluster in pm.ls(type='skinCluster'):
+            meshes = set(pm.animation.skinCluster(cluster, geometry=True, query=True) or [])
+            joints = set(cluster.matrix.inputs())
+            self.cluster_meshes[cluster] = meshes
+            self.cluster_joints[cluster] = joints
+
+            for mesh in meshes:
+                self.mesh_clusters.setdefault(mesh, set()).add(cluster)
+            for joint in joints:
+                self.joint_clusters.setdefault(joint, set()).add(cluster)
+
+
+    @staticmethod
+    def _gather(mapping, keys):
+        result = set()
+        for key in keys:
+            result.update(mapping.get(key, ()))
+
+        return result
+
+
+    def joint_skin_clusters(self, joints):
+        return self._gather(self.joint_clusters, joints)
+
+
+    def skin_cluster_joints(self, skin_clusters):
+        return self._gather(self.cluster_joints, skin_clusters)
+
+
+    def skin_cluster_meshes(self, skin_clusters):
+        return self._gather(self.cluster_meshes, skin_clusters)
+
+
+    def mesh_skin_clusters(self, meshes):
+        return self._gather(self.mesh_clusters, meshes)
+
+
+    def mesh_cluster_mappings(self):
+        """Same shape as common.get_mesh_cluster_mappings()"""
+        mapping = {cluster: set(meshes) for cluster, meshes in self.cluster_meshes.items()}
+        for mesh, clusters in self.mesh_clusters.items():
+            mapping.setdefault(mesh, set()).update(clusters)
+
+        return mapping
+
+
+
+def current():
+    """Return the index to answer lookups with, or None outside an operation"""
+    global _index
+
+    if not _depth and not _callbacks:
+        return None
+
+    if _index is None:
+        _index = SkinIndex()
+
+    return _index
+
+
+def invalidate(*args):
+    """Forget the index, the next lookup rebuilds it"""
+    global _index
+    _index = None
+
+
+@contextlib.contextmanager
+def operation():
+    """Share one index between every lookup made inside the block"""
+    global _depth
+
+    _depth += 1
+    try:
+        yield
+    finally:
+        _depth -= 1
+        if not _depth and not _callbacks:
+            invalidate()
+
+
+def indexed(func):
+    """Decorator that runs func inside an operation()"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with operation():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _on_connection(source_plug, destination_plug, made, *args):
+    if destination_plug.node().hasFn(om2.MFn.kSkinClusterFilter):
+        invalidate()
+
+
+def enable_callbacks():
+    """Keep the index between operations, rebuilding it when skinning changes"""
+    if _callbacks:
+        return
+
+    _callbacks.append(om2.MDGMessage.addNodeAddedCallback(invalidate, 'skinCluster'))
+    _callbacks.append(om2.MDGMessage.addNodeRemovedCallback(invalidate, 'skinCluster'))
+    _callbacks.append(om2.MDGMessage.addConnectionCallback(_on_connection))
+    _callbacks.append(om2.MSceneMessage.addCallback(om2.MSceneMessage.kAfterOpen, invalidate))
+    _callbacks.append(om2.MSceneMessage.addCallback(om2.MSceneMessage.kAfterNew, invalidate))
+
+
+def disable_callbacks():
+    global _callbacks
+
+    if _callbacks:
+        om2.MMessage.removeCallbacks(_callbacks)
+
+    _callbacks = []
+    if not _depth:
+        invalidate()
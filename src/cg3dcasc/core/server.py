@@ -1,9 +1,11 @@
 
 import socket
-import json
 import struct
 import pymel.core as pm
 from . import command_port
+from . import channel
+from . import codec
+from . import trace
 
 from cg3dcasc import preferences
 
@@ -13,13 +15,7 @@ TIMEOUT_SECONDS = 2.0
 
 def receive_all(sock, n):
     """Helper function to ensure all 'n' bytes are received."""
-    data = b''
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
-            return None
-        data += packet
-    return data
+    return codec.receive_into(sock, n)
 
 
 def handle_client(conn, addr):
@@ -41,14 +37,14 @@ def handle_client(conn, addr):
             print("Client disconnected while sending data.")
             return
 
-        # 3. Decode the JSON message.
-        #    Note: The decode('utf-8') is crucial for converting bytes to string.
-        data = json.loads(json_data.decode('utf-8'))
+        # 3. Decode the message. Plain JSON from older versions is still
+        #    understood, see codec.decode().
+        data = codec.decode(json_data)
         print("Received JSON data:")
         print(data)
         success = True
 
-    except (socket.error, json.JSONDecodeError) as e:
+    except (socket.error, ValueError) as e:
         print(f"Error handling client {addr}: {e}")
     finally:
         conn.close()
@@ -56,13 +52,15 @@ def handle_client(conn, addr):
     return (success, data)
 
 
+@trace.traced('server.send_to_casc')
 def send_to_casc(cmd):
-    import wingcarrier.pigeons
+    from . import casc_process
 
     success = False
     if command_port.open():
-        cmd = f"import cg3dmaya; cg3dmaya.set_active_port({command_port.port_number}); {cmd}"
-        casc = wingcarrier.pigeons.CascadeurPigeon()
+        channel_port = channel.port_number if channel.start() else None
+        cmd = f"import cg3dmaya; cg3dmaya.set_active_port({command_port.port_number}, {channel_port}); {cmd}"
+        casc = casc_process.CascadeurPigeon()
 
         if not casc.send_python_command(cmd):
             #pm.confirmDialog(message="Please make sure Cascadeur is running and try again.", button=['Okay'])
@@ -76,6 +74,15 @@ def send_to_casc(cmd):
 def send_and_listen(cmd):
     """Sends a command to Casc and listens for any return data"""
 
+    #Once Cascadeur has connected back the reply comes over the channel,
+    #so there's no need for a listening socket per call.
+    active_channel = channel.get()
+    if active_channel is not None:
+        return active_channel.await_reply(
+            lambda request_id: send_to_casc(f"cg3dmaya.client.reply_to({request_id}, {cmd!r})"),
+            TIMEOUT_SECONDS
+        )
+
     data = None
     success = False
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -0,0 +1,210 @@
+"""Convert textures Cascadeur can't read into .png files
+
+utils.convert_textures() used to convert every texture one after another
+through Maya's MQtUtil.createPixmap(), including ones it had already
+converted. convert() skips any texture whose .png is up to date. An entry
+in the cache file (source path, mtime and size) says when it was last
+converted. The rest go through a thread pool when Pillow is installed.
+
+MQtUtil needs Maya's UI thread, so the Qt backend always runs serially. It
+reads more formats than Pillow, so anything Pillow can't open is retried
+with Qt when it's available.
+"""
+
+import concurrent.futures
+import importlib.util
+import json
+import os
+import pathlib
+import tempfile
+import time
+
+pillow_exists = False
+try:
+    from PIL import Image
+    pillow_exists = True
+except ImportError:
+    pass
+
+
+PILLOW = 'pillow'
+QT = 'qt'
+
+VALID_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+"""Texture formats Cascadeur reads as is"""
+
+WORKERS = max(1, min(8, os.cpu_count() or 1))
+
+CACHE_PATH = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc_texture_cache.json'))
+
+
+def needs_conversion(path):
+    return pathlib.Path(path).suffix.lower() not in VALID_EXTENSIONS
+
+
+def target_path(path):
+    return pathlib.Path(path).with_suffix('.png')
+
+
+def _cache_key(path):
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def load_cache(cache_path=CACHE_PATH):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache, cache_path=CACHE_PATH):
+    try:
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f, indent=4)
+    except OSError as e:
+        print(f"Couldn't save the texture cache: {e}")
+
+
+def is_up_to_date(source, cache):
+    """True if source was converted since it last changed"""
+    entry = cache.get(_cache_key(source))
+    if entry is None or not os.path.exists(entry.get('output', '')):
+        return False
+
+    try:
+        stamp = _stamp(source)
+    except OSError:
+        return False
+
+    return entry['mtime'] == stamp['mtime'] and entry['size'] == stamp['size']
+
+
+def _convert_pillow(source, target):
+    with Image.open(source) as image:
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        image.save(target, 'PNG')
+
+
+def _convert_qt(source, target):
+    from maya import OpenMayaUI as omui
+    try:
+        from PySide2.QtGui import QPixmap
+        from shiboken2 import wrapInstance
+    except ImportError:
+        from PySide6.QtGui import QPixmap
+        from shiboken6 import wrapInstance
+
+    pp = omui.MQtUtil.createPixmap(str(source))
+    pmap = wrapInstance(int(pp), QPixmap)
+    if not pmap.toImage().save(str(target)):
+        raise OSError(f"Qt couldn't write {target}")
+
+
+def _qt_available():
+    try:
+        if importlib.util.find_spec('maya.OpenMayaUI') is None:
+            return False
+    except ImportError:
+        return False
+
+    import maya.cmds as cmds
+    return not cmds.about(batch=True)
+
+
+def convert(sources, backend=None, workers=None, progress=None, force=False, cache_path=CACHE_PATH):
+    """Write a .png next to every source texture that needs one
+
+    Args:
+        sources : texture paths. Ones Cascadeur can already read are ignored.
+        backend (str) : PILLOW or QT. Defaults to PILLOW when it's installed.
+        workers (int) : Pillow threads. Defaults to WORKERS.
+        progress : optional callable(done, total, source) called as each
+        texture finishes. Anything it raises stops the conversion.
+        force (bool) : convert even when the .png is up to date.
+
+    Returns:
+        dict : {source: png path, or None if it failed} for every texture
+        that needed a .png, including up to date ones.
+    """
+    if backend is None:
+        backend = PILLOW if pillow_exists else QT
+
+    start_time = time.perf_counter()
+    cache = load_cache(cache_path)
+    pending = []
+    results = {}
+    for source in dict.fromkeys(str(s) for s in sources):
+        if not needs_conversion(source):
+            continue
+
+        if not force and is_up_to_date(source, cache):
+            results[source] = str(target_path(source))
+        else:
+            pending.append(source)
+
+    skipped = len(results)
+    total = len(pending)
+    done = 0
+
+    def _finish(source, error):
+        nonlocal done
+        done += 1
+        if error is None:
+            output = str(target_path(source))
+            results[source] = output
+            try:
+                cache[_cache_key(source)] = dict(_stamp(source), output=output)
+            except OSError:
+                pass
+        else:
+            results[source] = None
+            print(f"Couldn't convert {source}: {error}")
+
+        if progress is not None:
+            progress(done, total, source)
+
+    #progress can raise to stop the conversion, what's finished by then is
+    #still cached.
+    retry = []
+    try:
+        if backend == PILLOW and pillow_exists:
+            with concurrent.futures.ThreadPoolExecutor(workers or WORKERS) as pool:
+                futures = {pool.submit(_convert_pillow, source, target_path(source)): source
+                           for source in pending}
+                try:
+                    #progress callbacks usually touch the UI, so they're called
+                    #from this thread rather than the workers.
+                    for future in concurrent.futures.as_completed(futures):
+                        source = futures[future]
+                        error = future.exception()
+                        if error is not None and _qt_available():
+                            retry.append(source)
+                            continue
+
+                        _finish(source, error)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        else:
+            retry = pending
+
+        for source in retry:
+            error = None
+            try:
+                _convert_qt(source, target_path(source))
+            except Exception as e:
+                error = e
+
+            _finish(source, error)
+    finally:
+        save_cache(cache, cache_path)
+    print(f"Converted {total} textures ({skipped} up to date) in {time.perf_counter() - start_time:.2f}s")
+    return results
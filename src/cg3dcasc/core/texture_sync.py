@@ -0,0 +1,62 @@
+"""Work out which texture assignments changed since they were last sent
+
+texture_info.json always holds every texture assignment, and Cascadeur used
+to rebuild every TextureContainer from it. For update_textures() the export
+also writes a delta (see transfer.TEXTURE_DELTA) with only the assignments
+that were added or changed since the last send, plus the objects that lost
+their textures. Cascadeur applies that instead and leaves everything else
+alone.
+
+What was last sent is remembered per export set. Full sends (any export
+that imports FBX data) replace what's remembered, so the next delta is
+taken against what Cascadeur actually has. reset() forces the next
+update_textures() to send everything again, e.g. after Cascadeur is
+restarted.
+"""
+
+import copy
+
+
+_sent = {}
+
+
+def merge(set_mappings):
+    """Flatten {set_id: {name: [paths]}} into the texture_info.json mapping"""
+    merged = {}
+    for mapping in set_mappings.values():
+        for name, paths in mapping.items():
+            merged.setdefault(name, [])
+            merged[name].extend(path for path in paths if path not in merged[name])
+
+    return merged
+
+
+def diff(set_mappings):
+    """Return what changed since remember() was last called
+
+    Returns:
+        dict : {'changed': {name: [paths]}, 'removed': [names]}
+    """
+    changed = {}
+    removed = set()
+    for set_id, mapping in set_mappings.items():
+        previous = _sent.get(set_id, {})
+        for name, paths in mapping.items():
+            if sorted(previous.get(name, [])) != sorted(paths):
+                changed[name] = paths
+
+        removed.update(name for name in previous if name not in mapping)
+
+    #something can move from one export set to another without losing its
+    #textures.
+    removed.difference_update(merge(set_mappings))
+    return {'changed': changed, 'removed': sorted(removed)}
+
+
+def remember(set_mappings):
+    """Record what was just sent to Cascadeur"""
+    _sent.update(copy.deepcopy(set_mappings))
+
+
+def reset():
+    _sent.clear()
@@ -0,0 +1,252 @@
+"""Timing spans for bridge operations
+
+Wrap anything worth timing in a span, spans opened inside another one are
+its children:
+
+    @trace.traced('export')
+    def export(...):
+        with trace.span('export_data', set=name):
+            ...
+            trace.count('bytes_written', size)
+
+Each span records its wall and CPU time and any counters added while it's
+the innermost one. When the outermost span ends the whole tree is written
+as one JSON line to a rotating log (see log_path()) and a per operation
+summary is printed. summarize() rolls a log up by operation.
+
+With COUNT_MODULES set, calls into those modules (e.g. ('pymel',)) are
+counted as 'calls' on each span. That runs a profile hook for the whole
+operation, so it's off by default.
+
+This module is shared by Maya and Cascadeur and has to stay identical on
+both sides.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from . import progress
+
+
+ENABLED = True
+
+COUNT_MODULES = ()
+"""Module name prefixes whose calls are counted"""
+
+LOG_PATH = None
+"""Defaults to mayacasc_trace_<application>.jsonl in the temp folder"""
+
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+SUMMARY_LIMIT = 8
+"""How many of the slowest spans the printed summary lists"""
+
+_local = threading.local()
+_logger = None
+
+
+class Span(object):
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.counts = {}
+        self.children = []
+        self.wall = 0.0
+        self.cpu = 0.0
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.thread_time()
+
+
+    def finish(self):
+        self.wall = time.perf_counter() - self._start_wall
+        self.cpu = time.thread_time() - self._start_cpu
+
+
+    def to_dict(self):
+        data = {'name': self.name, 'wall': round(self.wall, 6), 'cpu': round(self.cpu, 6)}
+        if self.attributes:
+            data['attributes'] = self.attributes
+        if self.counts:
+            data['counts'] = self.counts
+        if self.children:
+            data['children'] = [child.to_dict() for child in self.children]
+
+        return data
+
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    return stack
+
+
+def current():
+    """The innermost open span on this thread, or None"""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def count(name, amount=1):
+    """Add to a counter on the innermost span"""
+    active_span = current()
+    if active_span is not None:
+        active_span.counts[name] = active_span.counts.get(name, 0) + amount
+
+
+def _profile(frame, event, arg):
+    if event != 'call':
+        return
+
+    module = frame.f_globals.get('__name__', '')
+    if not module.startswith(COUNT_MODULES):
+        return
+
+    #only count calls made from outside the modules, not their internals
+    caller = frame.f_back
+    if caller is not None and caller.f_globals.get('__name__', '').startswith(COUNT_MODULES):
+        return
+
+    count('calls')
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time the block as a child of the current span"""
+    if not ENABLED:
+        yield None
+        return
+
+    stack = _stack()
+    new_span = Span(name, attributes)
+    if stack:
+        stack[-1].children.append(new_span)
+
+    profiler = None
+    if not stack and COUNT_MODULES:
+        profiler = sys.getprofile()
+        sys.setprofile(_profile)
+
+    stack.append(new_span)
+    try:
+        yield new_span
+    finally:
+        new_span.finish()
+        stack.pop()
+        if not stack:
+            if COUNT_MODULES:
+                sys.setprofile(profiler)
+            _finish_operation(new_span)
+
+
+def traced(name):
+    """Decorator that runs func in a span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def log_path():
+    if LOG_PATH:
+        return LOG_PATH
+
+    return os.path.join(tempfile.gettempdir(), f"mayacasc_trace_{progress.SOURCE or 'bridge'}.jsonl")
+
+
+def _get_logger():
+    global _logger
+
+    if _logger is None:
+        _logger = logging.getLogger('cg3dcasc.trace')
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        handler = logging.handlers.RotatingFileHandler(log_path(), maxBytes=LOG_MAX_BYTES,
+                                                       backupCount=LOG_BACKUPS, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(handler)
+
+    return _logger
+
+
+def _totals(root):
+    """{span name: [calls, wall, cpu, {counter: total}]} for the whole tree"""
+    totals = {}
+    spans = [root]
+    while spans:
+        item = spans.pop()
+        spans.extend(item.children)
+        total = totals.setdefault(item.name, [0, 0.0, 0.0, {}])
+        total[0] += 1
+        total[1] += item.wall
+        total[2] += item.cpu
+        for counter, amount in item.counts.items():
+            total[3][counter] = total[3].get(counter, 0) + amount
+
+    return totals
+
+
+def _finish_operation(root):
+    record = root.to_dict()
+    record['time'] = time.time()
+    record['source'] = progress.SOURCE
+    try:
+        _get_logger().info(json.dumps(record))
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Couldn't write the trace log: {e}")
+
+    print(f"{root.name} took {root.wall:.3f}s ({root.cpu:.3f}s CPU)")
+    totals = sorted(_totals(root).items(), key=lambda item: item[1][1], reverse=True)
+    for name, (calls, wall, cpu, counts) in totals[1:SUMMARY_LIMIT + 1]:
+        extra = ''.join(f" {counter}:{amount}" for counter, amount in sorted(counts.items()))
+        print(f"    {name} x{calls}: {wall:.3f}s ({cpu:.3f}s CPU){extra}")
+
+
+def summarize(path=None):
+    """Roll a trace log up by operation
+
+    Returns:
+        dict : {operation: {'runs': int, 'wall': total seconds, 'max': slowest
+        run, 'spans': {span name: seconds}}}
+    """
+    summary = {}
+    try:
+        with open(path or log_path(), encoding='utf-8') as log:
+            lines = log.readlines()
+    except OSError:
+        return summary
+
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+
+        entry = summary.setdefault(record['name'], {'runs': 0, 'wall': 0.0, 'max': 0.0, 'spans': {}})
+        entry['runs'] += 1
+        entry['wall'] += record['wall']
+        entry['max'] = max(entry['max'], record['wall'])
+
+        children = list(record.get('children', []))
+        while children:
+            child = children.pop()
+            children.extend(child.get('children', []))
+            entry['spans'][child['name']] = entry['spans'].get(child['name'], 0.0) + child['wall']
+
+    return summary
@@ -0,0 +1,308 @@
+"""Describes the files handed between Maya and Cascadeur
+
+Exports used to be dropped into one shared tempdir/mayacasc folder, and the
+importer found them again by listing the folder and splitting file names.
+Now every export writes a manifest.json next to its files that lists each
+artifact with its kind, size, hash and export set id, and the command that
+kicks off the import tells the other side where that manifest is (see
+set_manifest()).
+
+Each export can also get its own transaction folder, so two exports that
+overlap never delete or overwrite each other's files.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+import uuid
+
+
+EXPORT_ROOT = pathlib.Path(os.path.join(tempfile.gettempdir(), 'mayacasc'))
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+PER_TRANSACTION = True
+"""When False everything goes straight into EXPORT_ROOT, the old behavior"""
+
+KEEP_TRANSACTIONS = 4
+"""How many old transaction folders are left behind for slow readers"""
+
+FBX = 'fbx'
+QRIG = 'qrigcasc'
+TEXTURES = 'textures'
+TEXTURE_DELTA = 'texture_delta'
+
+_HASH_CHUNK = 1024 * 1024
+
+_pending_manifest = None
+
+
+def file_hash(file_path):
+    """Return the sha1 of a file, read in chunks so big FBX files are fine"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+
+class Manifest(object):
+    """Every artifact produced by one export"""
+
+    def __init__(self, folder, transaction_id=None, source=''):
+        self.folder = pathlib.Path(folder)
+        self.transaction_id = transaction_id or uuid.uuid4().hex
+        self.source = source
+        self.created = time.time()
+        self.artifacts = []
+
+
+    @property
+    def path(self):
+        return self.folder.joinpath(MANIFEST_NAME)
+
+
+    def add(self, file_path, kind, set_id='', name='', sha1=None, **extra):
+        """Record a file that's been written into the manifest folder
+
+        Args:
+            file_path : the file to add.
+            kind (str) : FBX, QRIG, TEXTURES or TEXTURE_DELTA
+            set_id (str) : the export set (maya_id/cscDataId) it belongs to.
+            name (str) : the export set's name.
+            sha1 (str) : the file's hash, if it's already known.
+            **extra : anything else the reader should know about the file.
+
+        Returns:
+            dict : the artifact entry.
+        """
+        file_path = pathlib.Path(file_path)
+        artifact = {
+            'file': file_path.name,
+            'kind': kind,
+            'set_id': set_id,
+            'name': name,
+            'size': file_path.stat().st_size,
+            'hash': sha1 or file_hash(file_path),
+        }
+        artifact.update(extra)
+        self.artifacts.append(artifact)
+
+        return artifact
+
+
+    def file_path(self, artifact):
+        return str(self.folder.joinpath(artifact['file']))
+
+
+    def artifacts_of_kind(self, kind):
+        return [a for a in self.artifacts if a['kind'] == kind]
+
+
+    def is_unchanged(self, set_id, kind=FBX):
+        """True if the exporter reused its last export of this set as is"""
+        return any(a.get('unchanged', False) for a in self.artifacts
+                   if a['set_id'] == set_id and a['kind'] == kind)
+
+
+    def frame_range(self, set_id, kind=FBX):
+        """The (start, end) frames a partial animation export covers, or None"""
+        for artifact in self.artifacts:
+            if artifact['set_id'] == set_id and artifact['kind'] == kind and artifact.get('frame_range'):
+                return tuple(artifact['frame_range'])
+
+        return None
+
+
+    def set_files(self):
+        """Return {(set_name, set_id): {kind: file_path}} for every export set
+
+        This is the same shape as scan_folder() returns, so importers can
+        handle either.
+        """
+        files = {}
+        for artifact in self.artifacts:
+            if not artifact['set_id']:
+                continue
+
+            key = (artifact['name'], artifact['set_id'])
+            files.setdefault(key, {})[artifact['kind']] = self.file_path(artifact)
+
+        return files
+
+
+    def to_dict(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'transaction_id': self.transaction_id,
+            'source': self.source,
+            'created': self.created,
+            'artifacts': self.artifacts,
+        }
+
+
+    def save(self):
+        """Write the manifest. It's written last and swapped in whole, so a
+        reader never sees a manifest for files that aren't finished.
+        """
+        temp_path = self.path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+        os.replace(temp_path, self.path)
+        return self.path
+
+
+    @classmethod
+    def load(cls, manifest_path):
+        manifest_path = pathlib.Path(manifest_path)
+        with open(manifest_path) as f:
+            data = json.load(f)
+
+        manifest = cls(manifest_path.parent, data.get('transaction_id'), data.get('source', ''))
+        manifest.created = data.get('created', manifest.created)
+        manifest.artifacts = data.get('artifacts', [])
+        return manifest
+
+
+
+def _clean_folder(folder):
+    for child in folder.iterdir():
+        if child.is_file():
+            try:
+                child.unlink()
+            except OSError as e:
+                print(f"Couldn't remove {child}: {e}")
+
+
+def _prune_transactions(keep=KEEP_TRANSACTIONS):
+    folders = [child for child in EXPORT_ROOT.iterdir() if child.is_dir()]
+    folders.sort(key=lambda f: f.stat().st_mtime, reverse=True)
+    for folder in folders[keep:]:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def begin(source='', per_transaction=None):
+    """Return a new, empty Manifest to export into
+
+    Args:
+        source (str) : which application is exporting.
+        per_transaction (bool) : give this export its own folder. Defaults
+        to PER_TRANSACTION.
+    """
+    if per_transaction is None:
+        per_transaction = PER_TRANSACTION
+
+    print('Cascaduer Export Location {}'.format(EXPORT_ROOT))
+    EXPORT_ROOT.mkdir(exist_ok=True)
+
+    if not per_transaction:
+        _clean_folder(EXPORT_ROOT)
+        return Manifest(EXPORT_ROOT, source=source)
+
+    _prune_transactions(KEEP_TRANSACTIONS - 1)
+    manifest = Manifest(EXPORT_ROOT, source=source)
+    manifest.folder = EXPORT_ROOT.joinpath(manifest.transaction_id)
+    manifest.folder.mkdir()
+
+    return manifest
+
+
+def set_manifest(manifest_path):
+    """Tell the next import where its manifest is
+
+    This is prepended to the import command by the exporting side.
+    """
+    global _pending_manifest
+    _pending_manifest = manifest_path
+
+
+def take_manifest():
+    """Return the Manifest set by set_manifest() and forget it
+
+    Returns:
+        Manifest : or None when the exporter didn't send one, in which case
+        the caller should fall back to scan_folder(latest_folder()).
+    """
+    global _pending_manifest
+
+    manifest_path = _pending_manifest
+    _pending_manifest = None
+    if not manifest_path:
+        return None
+
+    try:
+        return Manifest.load(manifest_path)
+    except (OSError, ValueError) as e:
+        print(f"Couldn't read the transfer manifest {manifest_path}: {e}")
+        return None
+
+
+def latest_folder(root=EXPORT_ROOT):
+    """The folder the last export went into, for importers without a manifest
+
+    Exporters without a manifest write straight into root, later ones into a
+    transaction folder inside it, so whichever was written last is used.
+    """
+    root = pathlib.Path(root)
+    if not root.exists():
+        return root
+
+    latest, latest_time = root, None
+    root_files = [child.stat().st_mtime for child in root.iterdir() if child.is_file()]
+    if root_files:
+        latest_time = max(root_files)
+
+    for child in root.iterdir():
+        if child.is_dir() and (latest_time is None or child.stat().st_mtime > latest_time):
+            latest, latest_time = child, child.stat().st_mtime
+
+    return latest
+
+
+def scan_folder(folder=EXPORT_ROOT):
+    """The old way of finding exported files, for exporters without a manifest
+
+    Returns:
+        dict : {(set_name, set_id): {extension: file_path}}
+    """
+    files = {}
+    folder = pathlib.Path(folder)
+    if not folder.exists():
+        return files
+
+    for child in folder.iterdir():
+        if not child.is_file():
+            continue
+
+        parts = child.name.rsplit('.', 2)
+        if len(parts) != 3:
+            #skip files that don't match the name.id.ext format, like the
+            #texture file
+            continue
+
+        set_name, set_id, ext = parts
+        files.setdefault((set_name, set_id), {})[ext.lower()] = str(child)
+
+    return files
+
+
+def texture_file(manifest=None, folder=EXPORT_ROOT, kind=TEXTURES):
+    """Return the texture mapping (or TEXTURE_DELTA) file from the manifest
+    or the folder
+    """
+    if manifest is not None:
+        textures = manifest.artifacts_of_kind(kind)
+        return pathlib.Path(manifest.file_path(textures[0])) if textures else None
+
+    if kind != TEXTURES:
+        #only exporters that write a manifest send deltas
+        return None
+
+    return pathlib.Path(folder).joinpath('texture_info.json')
@@ -1,27 +1,33 @@
 from pathlib import Path
 import time
 import enum
+import contextlib
 
-from maya import OpenMayaUI as omui 
 import pymel.core as pm
 import maya.cmds as cmds
 import maya.mel
+import maya.utils
+import maya.api.OpenMaya as om2
+import maya.api.OpenMayaAnim as oma2
 
 try:
     from PySide2.QtWidgets import *
     from PySide2.QtGui import *
-    from shiboken2 import wrapInstance
 except:
     from PySide6.QtWidgets import *
     from PySide6.QtGui import *
-    from shiboken6 import wrapInstance   
 
 
 import cg3dguru.ui
 from . import common
 from . import server
 from . import materials
+from . import texture_convert
 from . import hik
+from . import weights
+from . import copy_strategy
+from . import scene_index
+from . import progress
 from .udata import *
 
 CLONE_PREFIX = 'CASC'
@@ -32,9 +38,48 @@ from cg3dcasc import preferences
 gMainProgressBar = maya.mel.eval('$tmp = $gMainProgressBar')
 progress_bar = False
 
+_phase_times = None
+
+
+@contextlib.contextmanager
+def record_phases():
+    """Collect how long each derig phase takes, see derig_benchmark
+
+    Yields:
+        dict : {phase name: seconds}, filled in as the phases run. Phases can
+        nest, e.g. 'bind_pose' is part of 'weight_copy'.
+    """
+    global _phase_times
+    previous = _phase_times
+    _phase_times = {}
+    try:
+        yield _phase_times
+    finally:
+        _phase_times = previous
+
+
+def _phase_done(name, start_time):
+    """Add the time since start_time to the phase, when phases are recorded"""
+    if _phase_times is not None:
+        _phase_times[name] = _phase_times.get(name, 0.0) + time.perf_counter() - start_time
+
+
+@contextlib.contextmanager
+def _timed_phase(name):
+    progress.update(phase=name)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phase_done(name, start_time)
+
 
 def start_progress_bar(*args, **kwargs):
     global progress_bar, gMainProgressBar
+    if not gMainProgressBar:
+        #batch mode has no progress bar
+        return
+
     progress_bar = True
 
     kwargs['edit'] = True
@@ -44,13 +89,53 @@ def start_progress_bar(*args, **kwargs):
 
     
 def edit_progress_bar(*args, **kwargs):
+    if not progress_bar:
+        return
+
     kwargs['edit'] = True
     cmds.progressBar(gMainProgressBar, *args, **kwargs)
 
 
+def end_progress_bar():
+    global progress_bar
+    if progress_bar:
+        progress_bar = False
+        cmds.progressBar(gMainProgressBar, edit=True, endProgress=True)
+
+
+def progress_bar_sink(event):
+    """Show progress events on Maya's progress bar, Esc cancels the operation"""
+    status = progress.describe(event)
+    if event.get('remote'):
+        #these arrive on the bridge channel's thread
+        maya.utils.executeDeferred(om2.MGlobal.displayInfo, f"Cascadeur: {status}")
+        return
+
+    if event['type'] == progress.START:
+        if not event['depth']:
+            start_progress_bar(status=status, progress=0, maxValue=max(1, event['total']) if event['total'] else 100,
+                               isInterruptable=True)
+    elif event['type'] == progress.END:
+        if not event['depth']:
+            end_progress_bar()
+    elif event['total']:
+        edit_progress_bar(status=status, progress=event['done'], maxValue=max(1, event['total']))
+    else:
+        edit_progress_bar(status=status)
+
+    if progress_bar and cmds.progressBar(gMainProgressBar, query=True, isCancelled=True):
+        progress.cancel()
+
+
+progress.SOURCE = 'maya'
+progress.add_sink(progress_bar_sink)
+
+
 def wait_cursor(func):
     def wrapper(*args, **kwargs):
-        pm.waitCursor(state=True)
+        batch = cmds.about(batch=True)
+        if not batch:
+            pm.waitCursor(state=True)
         result = None
         try:
             result = func(*args, **kwargs)
@@ -59,12 +144,10 @@ def wait_cursor(func):
         else:
             return result
         finally:
-            pm.waitCursor(state=False)
+            if not batch:
+                pm.waitCursor(state=False)
             
-            global progress_bar, gMainProgressBar
-            if progress_bar:
-                progress_bar = False
-                cmds.progressBar(gMainProgressBar, edit=True, endProgress=True)
+            end_progress_bar()
 
     return wrapper
 
@@ -268,9 +351,10 @@ def _copy_swap(skin_proxy, skin_cluster_node, clone_pairing, originals, replacem
             pm.disconnectAttr(source_plug, destination_plug)
 
     try:
-        bind_pose = pm.dagPose(skin_cluster_node.getInfluence(), save=True,
-                               bindPose=True, name=f'{skin_cluster_node.name()}_BindPose')
-        bind_pose.message >> skin_cluster_node.bindPose
+        with _timed_phase('bind_pose'):
+            bind_pose = pm.dagPose(skin_cluster_node.getInfluence(), save=True,
+                                   bindPose=True, name=f'{skin_cluster_node.name()}_BindPose')
+            bind_pose.message >> skin_cluster_node.bindPose
     except Exception as e:
         print(e)
 
@@ -307,14 +391,26 @@ def _copy_flood(skin_proxy, skin_cluster_node, clone_pairing, originals, replace
         cmds.scriptEditorInfo(suppressWarnings=original_warnings_state)
         
 
-def _copy_per_vert(skin_proxy, skin_cluster_node, clone_pairing, originals, replacements):
-    skin_cluster_node.normalizeWeights.set(2)
-    pm.skinCluster(skin_cluster_node, edit=True, addInfluence=replacements, weight=0.0)
-    
+def _add_replacements(skin_cluster_node, originals, replacements):
+    """Add the replacement joints at zero weight and unlock the originals
+
+    Influences that are already on the cluster are left alone, so a copy
+    that failed part way can fall back to another one.
+    """
+    existing = set(skin_cluster_node.getInfluence())
+    missing = [joint for joint in replacements if joint not in existing]
+    if missing:
+        pm.skinCluster(skin_cluster_node, edit=True, addInfluence=missing, weight=0.0)
+
     #make sure the original joints are unlocked
     for og in originals:
         pm.skinCluster(skin_cluster_node, edit=True, lockWeights=False, influence=og)
 
+
+def _copy_per_vert(skin_proxy, skin_cluster_node, clone_pairing, originals, replacements):
+    skin_cluster_node.normalizeWeights.set(2)
+    _add_replacements(skin_cluster_node, originals, replacements)
+
     joint_to_idx = {element.inputs()[0]: element.index() for element in skin_cluster_node.matrix}
     oldIdx_to_newIdx = {joint_to_idx[og]: joint_to_idx[clone_pairing[og]] for og in originals}
 
@@ -350,16 +446,49 @@ def _copy_per_vert(skin_proxy, skin_cluster_node, clone_pairing, originals, repl
             weight_entry.set(value)
 
 
-def _clone_meshes(meshes, mesh_parent, skinned_parent, clone_pairing):
+def _copy_bulk(skin_proxy, skin_cluster_node, clone_pairing, originals, replacements):
+    skin_cluster_node.normalizeWeights.set(0)
+    _add_replacements(skin_cluster_node, originals, replacements)
+
+    name = skin_proxy.name().split(":")[-1]
+    message = f"Cloning {name} weights"
+    edit_progress_bar(status=message, progress=0, maxValue=3)
+
+    selection = om2.MSelectionList()
+    selection.add(skin_cluster_node.name())
+    skin_fn = oma2.MFnSkinCluster(selection.getDependNode(0))
+    mesh_path = skin_fn.getPathAtIndex(0)
+
+    component_fn = om2.MFnSingleIndexedComponent()
+    components = component_fn.create(om2.MFn.kMeshVertComponent)
+    component_fn.setCompleteData(om2.MFnMesh(mesh_path).numVertices)
+
+    #getWeights() columns follow the physical order of influenceObjects()
+    columns = {pm.PyNode(path.fullPathName()): col for col, path in enumerate(skin_fn.influenceObjects())}
+    column_mapping = {columns[og]: columns[clone_pairing[og]] for og in originals}
+
+    flat_weights, influence_count = skin_fn.getWeights(mesh_path, components)
+    edit_progress_bar(step=1)
+
+    new_weights = weights.transfer(weights.as_matrix(flat_weights, influence_count),
+                                   column_mapping, influence_count)
+    edit_progress_bar(step=1)
+
+    skin_fn.setWeights(mesh_path, components, om2.MIntArray(range(influence_count)),
+                       om2.MDoubleArray(weights.flatten(new_weights)), False)
+    edit_progress_bar(step=1)
+
+
+def _clone_meshes(meshes, mesh_parent, skinned_parent, clone_pairing, copy_method=None):
     mesh_cluster_mapping = common.get_mesh_cluster_mappings()
 
-    copy_method = preferences.CopyWeightType.SWAP
-    print(f"Cloning weights via {copy_method} method.")
 
     for mesh_count, source_shape in enumerate(meshes):
         message = f"Making proxy of {source_shape.name()}"
         edit_progress_bar(status=message, progress=mesh_count, maxValue=len(meshes))
         pm.displayInfo(message)
+        progress.check()
+        phase_start = time.perf_counter()
 
         base_name = get_base_name(source_shape.getParent())
         name = f"{CLONE_PREFIX}:{base_name}"
@@ -374,6 +503,7 @@ def _clone_meshes(meshes, mesh_parent, skinned_parent, clone_pairing):
 
         if source_shape not in mesh_cluster_mapping:
             mesh_proxy.setParent(mesh_parent)
+            _phase_done('mesh_duplication', phase_start)
             continue
         else:
             mesh_proxy.setParent(skinned_parent)
@@ -389,6 +519,8 @@ def _clone_meshes(meshes, mesh_parent, skinned_parent, clone_pairing):
                     
                 pm.copySkinWeights(ss=cluster, ds=cloned_cluster, noMirror=True,
                                    surfaceAssociation='closestPoint', influenceAssociation='closestJoint')
+                _phase_done('mesh_duplication', phase_start)
+                phase_start = time.perf_counter()
                 
                 pm.select(mesh_proxy, replace=True)
                 pm.animation.skinCluster(mesh_proxy, edit=True, rui=True) #remove unused influences
@@ -400,19 +532,40 @@ def _clone_meshes(meshes, mesh_parent, skinned_parent, clone_pairing):
                 vertices = skinned_geometry.vtx[:]
                 prune = False
                 remove_originals = True
+                measured = True
+
+                #AUTO (opt in) picks whichever method should be fastest for
+                #this cluster, see copy_strategy.
+                stats = copy_strategy.get_stats(cloned_cluster, originals)
+                cluster_method = copy_strategy.choose(stats, copy_method)
+                print(f"Cloning weights via {cluster_method} method.")
+                _phase_done('weight_setup', phase_start)
+                phase_start = time.perf_counter()
                 
                 #don't use match case here due to not working with Maya 2023
-                if copy_method == preferences.CopyWeightType.SWAP: #Mazu: 19.8838, Waitress: 4.5856,
+                if cluster_method == preferences.CopyWeightType.SWAP: #Mazu: 19.8838, Waitress: 4.5856,
                     remove_originals = False
                     _copy_swap(mesh_proxy, cloned_cluster, clone_pairing, originals, replacements)
 
-                elif copy_method == preferences.CopyWeightType.FLOOD: #Mazu: 158.3618, Waitress: 18.1239,
+                elif cluster_method == preferences.CopyWeightType.FLOOD: #Mazu: 158.3618, Waitress: 18.1239,
                     prune = True
                     _copy_flood(mesh_proxy, cloned_cluster, clone_pairing, originals, replacements, vertices)
         
-                elif copy_method == preferences.CopyWeightType.PER_VERT: #Mazu: 138.2624, Waitress: 70.3756,
+                elif cluster_method == preferences.CopyWeightType.PER_VERT: #Mazu: 138.2624, Waitress: 70.3756,
                     _copy_per_vert(mesh_proxy, cloned_cluster, clone_pairing, originals, replacements)                
 
+                elif cluster_method == preferences.CopyWeightType.BULK:
+                    try:
+                        _copy_bulk(mesh_proxy, cloned_cluster, clone_pairing, originals, replacements)
+                    except RuntimeError as e:
+                        pm.warning(f"Bulk weight copy failed, copying per vert: {e}")
+                        _copy_per_vert(mesh_proxy, cloned_cluster, clone_pairing, originals, replacements)
+                        measured = False
+
+                if measured:
+                    copy_strategy.record(cluster_method, stats, time.perf_counter() - phase_start)
+                _phase_done('weight_copy', phase_start)
+                phase_start = time.perf_counter()
 
                 cloned_cluster.normalizeWeights.set(2)
                 if remove_originals:
@@ -428,7 +581,13 @@ def _clone_meshes(meshes, mesh_parent, skinned_parent, clone_pairing):
                 else:
                     pm.animation.skinCluster(cloned_cluster, forceNormalizeWeights=True, edit=True)
 
-      
+                _phase_done('weight_cleanup', phase_start)
+                phase_start = time.perf_counter()
+
+    copy_strategy.save()
+    #the proxies have skinClusters of their own now
+    scene_index.invalidate()
+
       
 
 def create_export_set(name='', auto_add_selected=False) -> pm.nodetypes.ObjectSet:
@@ -460,38 +619,36 @@ def create_export_set(name='', auto_add_selected=False) -> pm.nodetypes.ObjectSe
 
 
 @wait_cursor
+@progress.tracked('Converting Textures')
 def convert_textures():
     #https://help.autodesk.com/view/MAYAUL/2024/ENU/?guid=MAYA_API_REF_cpp_ref_class_m_qt_util_html
     #https://stackoverflow.com/questions/72801366/maya-python-get-the-widget-containing-the-renderd-image-from-mayas-render-view
 
     roots = {item.getParent(-1) for item in pm.ls(sl=True)}
     branches = pm.listRelatives(list(roots), allDescendents=True)
-    textures = materials.get_textures(branches)
-    
-    valid_extensions = {'.jpg', '.jpeg', '.png'}
-    for key, textures in textures.items():
-        for texture in textures:
-            tpath = Path(texture)
-            if tpath.suffix.lower() not in valid_extensions:
-                try:         
-                    pp = omui.MQtUtil.createPixmap(tpath)
-                    pmap = wrapInstance( int(pp), QPixmap)
-                    image = pmap.toImage()
-                    save_name = tpath.with_suffix('.png')
-                    image.save(str(save_name))
-                except Exception as e:
-                    print(e)
+    #the original images, so ones changed since their last conversion are
+    #converted again
+    texture_mapping = materials.get_textures(branches, resolve=False)
+
+    sources = {texture for textures in texture_mapping.values() for texture in textures}
+    def _progress(done, total, source):
+        progress.update(phase='convert', item=Path(source).name, done=done, total=total)
+
+    texture_convert.convert(sources, progress=_progress)
+
+    #the new .png files should be picked up by the next export
+    materials.clear_cache()
     
 
 
 @wait_cursor
-def _derig_selection():
+@scene_index.indexed
+@progress.tracked('Creating Proxy', cancelled_result=False)
+def _derig_selection(copy_method=None):
     selection = pm.ls(sl=True)
     if not selection:
         return False
 
-    start_progress_bar(status='Creating Proxy', maxValue=100)
-
     results = common.get_skinned_data_sets(selection)
     common.update_skinned_data_sets(*results)
     joints, meshes, skin_clusters, transforms = results
@@ -507,36 +664,42 @@ def _derig_selection():
     data = ProxyRoot.add_data(root)
     data.rootType.set(0)
 
-    skeleton_root = pm.general.createNode('transform', name=f"{CLONE_PREFIX}:skel_root", parent=root)
-    ProxyRoot.add_data(skeleton_root).rootType.set(1)
+    try:
+        skeleton_root = pm.general.createNode('transform', name=f"{CLONE_PREFIX}:skel_root", parent=root)
+        ProxyRoot.add_data(skeleton_root).rootType.set(1)
 
-    _clone_joints(joint_hierarchy[None], skeleton_root, joint_hierarchy, clone_pairing)
+        with _timed_phase('joint_cloning'):
+            _clone_joints(joint_hierarchy[None], skeleton_root, joint_hierarchy, clone_pairing)
     
-    cloned_root_joints = [clone_pairing[joint] for joint in joint_hierarchy[None]]
-    pm.general.select(cloned_root_joints, replace=True)
-    pm.general.makeIdentity(apply=True, t=0, r=1, s=0, n=0)
+            cloned_root_joints = [clone_pairing[joint] for joint in joint_hierarchy[None]]
+            pm.general.select(cloned_root_joints, replace=True)
+            pm.general.makeIdentity(apply=True, t=0, r=1, s=0, n=0)
     
-    meshes_root = pm.general.createNode('transform', name = f"{CLONE_PREFIX}:meshes", parent=root)
-    ProxyRoot.add_data(meshes_root).rootType.set(2)
+        meshes_root = pm.general.createNode('transform', name = f"{CLONE_PREFIX}:meshes", parent=root)
+        ProxyRoot.add_data(meshes_root).rootType.set(2)
     
-    skinned_meshes_root = pm.general.createNode('transform', name = f"{CLONE_PREFIX}:skinned_meshes", parent=root)
-    ProxyRoot.add_data(skinned_meshes_root).rootType.set(3)
-    skinned_meshes_root.inheritsTransform.set(0)
+        skinned_meshes_root = pm.general.createNode('transform', name = f"{CLONE_PREFIX}:skinned_meshes", parent=root)
+        ProxyRoot.add_data(skinned_meshes_root).rootType.set(3)
+        skinned_meshes_root.inheritsTransform.set(0)
 
-    start_time = time.perf_counter()
-    _clone_meshes(meshes, meshes_root, skinned_meshes_root, clone_pairing)
-    end_time = time.perf_counter()
-    elapsed_time = end_time - start_time
-    print(f"The function took {elapsed_time:.4f} seconds to run.")
-    #waitress 76.3239 second with manual weight copy
-    
-    null_children = [child for child in root.getChildren() if not child.getChildren()]
-    if null_children:
-        pm.general.delete(null_children)
+        start_time = time.perf_counter()
+        _clone_meshes(meshes, meshes_root, skinned_meshes_root, clone_pairing, copy_method)
+        end_time = time.perf_counter()
+        elapsed_time = end_time - start_time
+        print(f"The function took {elapsed_time:.4f} seconds to run.")
+        #waitress 76.3239 second with manual weight copy
+    
+        null_children = [child for child in root.getChildren() if not child.getChildren()]
+        if null_children:
+            pm.general.delete(null_children)
   
-    constraints = [child for child in pm.listRelatives(root, allDescendents=True, type="transform") if isinstance(child, pm.nodetypes.Constraint)]
-    if constraints:
-        pm.general.delete(constraints) 
+        constraints = [child for child in pm.listRelatives(root, allDescendents=True, type="transform") if isinstance(child, pm.nodetypes.Constraint)]
+        if constraints:
+            pm.general.delete(constraints) 
+    except progress.Cancelled:
+        #don't leave half a proxy behind
+        pm.general.delete(root)
+        raise
     
     pm.select(root, replace=True)
     return True
@@ -0,0 +1,124 @@
+"""Bulk skin weight math for the derig proxies
+
+utils._copy_per_vert() moved weights from the original joints to their
+clones one plug at a time. The functions here work on the whole weight
+matrix at once instead: one row per vertex, one column per influence, in
+the order MFnSkinCluster.getWeights() returns them. utils._copy_bulk() reads
+that matrix in one call, runs transfer() and writes the result back in one
+call.
+
+Nothing in here touches Maya, so it can be timed and checked on its own.
+NumPy is used when it's available. Without it the same math runs on plain
+lists of rows, which is slower but gives the same answer.
+"""
+
+numpy_exists = False
+try:
+    import numpy as np
+    numpy_exists = True
+except ImportError:
+    pass
+
+
+def as_matrix(flat_weights, influence_count):
+    """Turn the flat list MFnSkinCluster.getWeights() gives back into rows"""
+    if numpy_exists:
+        return np.asarray(flat_weights, dtype=np.float64).reshape(-1, influence_count)
+
+    flat_weights = list(flat_weights)
+    return [flat_weights[i:i + influence_count]
+            for i in range(0, len(flat_weights), influence_count)]
+
+
+def flatten(weights):
+    """The opposite of as_matrix(), ready for MFnSkinCluster.setWeights()"""
+    if numpy_exists and isinstance(weights, np.ndarray):
+        return weights.ravel().tolist()
+
+    return [value for row in weights for value in row]
+
+
+def remap(weights, column_mapping, column_count=None):
+    """Move each mapped column's weights to its new column
+
+    Columns that aren't a source in the mapping lose their weights, which
+    matches what _copy_per_vert() did: the original joints are cleared and
+    only their replacements keep any influence. Sources that share a
+    target are added together.
+
+    Args:
+        weights : rows of weights, see as_matrix().
+        column_mapping (dict) : {source column: target column}
+        column_count (int) : width of the result. Defaults to the width of
+        weights.
+
+    Returns:
+        the remapped weights, the same type that was passed in.
+    """
+    if numpy_exists and isinstance(weights, np.ndarray):
+        if column_count is None:
+            column_count = weights.shape[1]
+
+        result = np.zeros((weights.shape[0], column_count), dtype=weights.dtype)
+        if column_mapping:
+            sources = np.fromiter(column_mapping.keys(), dtype=np.intp, count=len(column_mapping))
+            targets = np.fromiter(column_mapping.values(), dtype=np.intp, count=len(column_mapping))
+            np.add.at(result, (slice(None), targets), weights[:, sources])
+
+        return result
+
+    if column_count is None:
+        column_count = len(weights[0]) if weights else 0
+
+    pairs = list(column_mapping.items())
+    result = []
+    for row in weights:
+        new_row = [0.0] * column_count
+        for source, target in pairs:
+            new_row[target] += row[source]
+        result.append(new_row)
+
+    return result
+
+
+def normalize(weights):
+    """Scale every row to add up to 1. Rows with no weight stay empty."""
+    if numpy_exists and isinstance(weights, np.ndarray):
+        totals = weights.sum(axis=1, keepdims=True)
+        np.divide(weights, totals, out=weights, where=totals > 0.0)
+        return weights
+
+    for row in weights:
+        total = sum(row)
+        if total > 0.0:
+            row[:] = [value / total for value in row]
+
+    return weights
+
+
+def prune(weights, threshold):
+    """Zero every weight below the threshold, then normalize()"""
+    if numpy_exists and isinstance(weights, np.ndarray):
+        weights[weights < threshold] = 0.0
+        return normalize(weights)
+
+    for row in weights:
+        row[:] = [value if value >= threshold else 0.0 for value in row]
+
+    return normalize(weights)
+
+
+def transfer(weights, column_mapping, column_count=None, prune_threshold=0.0, normalized=True):
+    """remap(), then optionally prune() and normalize() in one go
+
+    Returns:
+        the new weights, see remap().
+    """
+    result = remap(weights, column_mapping, column_count)
+    if prune_threshold > 0.0:
+        return prune(result, prune_threshold)
+
+    if normalized:
+        return normalize(result)
+
+    return result
@@ -0,0 +1,9 @@
+
+PARAMS = {
+    'label': 'Update Changed Frames'
+}
+
+
+def command(*args, **kwargs):
+    import cg3dcasc
+    cg3dcasc.update_changed_frames()
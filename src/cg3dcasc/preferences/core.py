@@ -28,6 +28,10 @@ class CopyWeightType(enum.Enum):
     SWAP = 'Swap'
     FLOOD = 'Flood'
     PER_VERT = 'Per Vert'
+    BULK = 'Bulk'
+    AUTO = 'Auto'
+    """Pick the fastest method for each mesh. Opt in only, BULK and FLOOD
+    haven't been shown to match SWAP's output yet."""
 
 
 class _PreferenceData(object):
@@ -38,6 +42,7 @@ class _PreferenceData(object):
         self.texture_conversion = TextureConversionType.NEVER
         self.derig_reset_joint_scale = True
         self.derig_maintain_offset = True
+        self.derig_copy_weights = CopyWeightType.SWAP
         
         if old_prefs is not None:
             try:
@@ -51,6 +56,7 @@ class _PreferenceData(object):
         new.texture_conversion = getattr(old, 'texture_conversion') if hasattr(old, 'texture_conversion') else new.texture_conversion
         new.derig_reset_joint_scale = getattr(old, 'derig_reset_joint_scale') if hasattr(old, 'derig_reset_joint_scale') else new.derig_reset_joint_scale
         new.derig_maintain_offset = getattr(old, 'derig_maintain_offset') if hasattr(old, 'derig_maintain_offset') else new.derig_maintain_offset
+        new.derig_copy_weights = getattr(old, 'derig_copy_weights') if hasattr(old, 'derig_copy_weights') else new.derig_copy_weights
        
         
 def _get_save_path():
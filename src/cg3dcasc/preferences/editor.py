@@ -29,11 +29,15 @@ class Cg3dCascPrefs(cg3dguru.ui.Window):
         self.ui.joint_scale.setChecked(self.prefs.derig_reset_joint_scale)
         self.ui.maintain_parent_offset.setChecked(self.prefs.derig_maintain_offset)
 
+        idx = self.ui.copy_weights_choice.findText(prefs.derig_copy_weights.value)
+        self.ui.copy_weights_choice.setCurrentIndex(idx)
+
     def save_prefs(self, *args, **kwargs):
         self.prefs.bake_animations = cg3dcasc.preferences.OptionEnum(self.ui.bake_choice.currentText())
         self.prefs.texture_conversion = cg3dcasc.preferences.TextureConversionType(self.ui.texture_choice.currentText())
         self.prefs.derig_reset_joint_scale = self.ui.joint_scale.isChecked()
         self.prefs.derig_maintain_offset = self.ui.maintain_parent_offset.isChecked()
+        self.prefs.derig_copy_weights = cg3dcasc.preferences.CopyWeightType(self.ui.copy_weights_choice.currentText())
 
         cg3dcasc.preferences.set(self.prefs)
         self.ui.close()
@@ -7,6 +7,7 @@ def casc_setup():
         import cg3dcasc.core
         try:
             cg3dcasc.command_port.open()
+            cg3dcasc.core.channel.start()
         except:
             pass
            
@@ -0,0 +1,29 @@
+"""Import the bridge's Maya-free modules without Maya or Cascadeur
+
+cg3dcasc/__init__.py and cg3dmaya/__init__.py pull in pymel and csc, so
+their folders are registered as bare packages instead and only the modules
+that need neither are imported from them:
+
+    from bridge_core import codec       #cg3dcasc/core/codec.py
+    from bridge_casc import maya_port   #cg3dmaya/maya_port.py
+"""
+
+import pathlib
+import sys
+import types
+
+
+SRC = pathlib.Path(__file__).parents[1].joinpath('src', 'cg3dcasc')
+CORE = SRC.joinpath('core')
+CASC_SITE = SRC.joinpath('casc-site', 'cg3dmaya')
+
+
+def _bare_package(name, folder):
+    package = types.ModuleType(name)
+    package.__path__ = [str(folder)]
+    sys.modules[name] = package
+    return package
+
+
+_bare_package('bridge_core', CORE)
+_bare_package('bridge_casc', CASC_SITE)
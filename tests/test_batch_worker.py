@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from bridge_core import batch_worker
+
+
+def _work(tmp_path, jobs):
+    work_path = tmp_path.joinpath('work.json')
+    with open(work_path, 'w') as f:
+        json.dump({'scene': 'scene.mb', 'up_axis': 'y', 'range': [1, 24], 'jobs': jobs}, f)
+
+    return work_path
+
+
+def _job(tmp_path, set_id, nodes, mel=None):
+    return {'set_id': set_id, 'nodes': nodes, 'fbx_path': str(tmp_path.joinpath(f'{set_id}.fbx')),
+            'mel': mel or []}
+
+
+def test_run_worker(tmp_path):
+    stand_in = batch_worker.MayaStandIn({'root', 'mesh'})
+    jobs = [_job(tmp_path, 'a', ['root', 'mesh'], ['FBXExportBakeComplexAnimation -v true']),
+            _job(tmp_path, 'b', ['missing'])]
+    result_path = tmp_path.joinpath('result.json')
+
+    results = batch_worker.run_worker(_work(tmp_path, jobs), result_path, stand_in)
+
+    with open(result_path) as f:
+        assert json.load(f) == results
+
+    assert stand_in.scene == 'scene.mb'
+    assert stand_in.up_axis == 'y'
+    assert stand_in.frame_range == [1, 24]
+
+    assert results['a']['ok']
+    assert results['a']['error'] == ''
+    assert tmp_path.joinpath('a.fbx').read_text() == 'root\nmesh'
+
+    assert not results['b']['ok']
+    assert 'missing' in results['b']['error']
+    assert not tmp_path.joinpath('b.fbx').exists()
+
+
+def test_run_job_sends_the_profile_between_reset_and_export(tmp_path):
+    stand_in = batch_worker.MayaStandIn()
+    job = _job(tmp_path, 'a', ['root'], ['FBXExportSkins -v true', 'FBXExportSplitAnimationIntoTakes -c'])
+
+    assert batch_worker.run_job(stand_in, job)['ok']
+    assert stand_in.commands[0] == 'FBXResetExport'
+    assert stand_in.commands[1:3] == job['mel']
+    assert stand_in.commands[3] == 'FBXExport -s -f "{}"'.format(job['fbx_path'].replace('\\', '/'))
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('C:\\temp\\a.fbx', 'FBXExport -s -f "C:/temp/a.fbx"'),
+    ('/tmp/a.fbx', 'FBXExport -s -f "/tmp/a.fbx"'),
+])
+def test_export_command(path, expected):
+    assert batch_worker._export_command(path) == expected
@@ -0,0 +1,110 @@
+import concurrent.futures
+import socket
+import threading
+import time
+
+import pytest
+
+from bridge_core import channel
+from bridge_casc import channel as casc_channel
+
+
+def _echo(cmd):
+    return (True, cmd.upper())
+
+
+@pytest.fixture
+def pair():
+    channels = []
+
+    def make(handler_a=None, handler_b=None):
+        channels.extend(channel.loopback(handler_a, handler_b))
+        return channels[-2:]
+
+    yield make
+    for active_channel in channels:
+        active_channel.close()
+
+
+def _wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+
+    return condition()
+
+
+def test_request_and_response(pair):
+    a, b = pair(None, _echo)
+    assert a.request('hi', 2) == (True, 'HI')
+    assert b.request('hi', 2) == (False, None)
+
+
+def test_requests_in_flight_together(pair):
+    release = threading.Event()
+
+    def slow(cmd):
+        future = concurrent.futures.Future()
+        threading.Thread(target=lambda: (release.wait(2), future.set_result((True, cmd)))).start()
+        return future
+
+    a, b = pair(None, slow)
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        replies = [pool.submit(a.request, str(i), 2) for i in range(4)]
+        release.set()
+        assert [reply.result() for reply in replies] == [(True, str(i)) for i in range(4)]
+
+
+def test_failed_commands_answer_with_the_error(pair):
+    def failing_future(cmd):
+        future = concurrent.futures.Future()
+        future.set_exception(AttributeError("no attribute 'run_queries'"))
+        return future
+
+    def failing(cmd):
+        raise ValueError('bad')
+
+    a, b = pair(None, failing_future)
+    assert a.request('x', 2) == (False, "AttributeError: no attribute 'run_queries'")
+
+    a, b = pair(None, failing)
+    assert a.request('x', 2) == (False, 'ValueError: bad')
+
+
+def test_unencodable_response_keeps_the_channel(pair):
+    a, b = pair(None, lambda cmd: (True, object()) if cmd == 'bad' else _echo(cmd))
+    success, data = a.request('bad', 2)
+    assert not success
+    assert data.startswith("Can't encode the response")
+    assert a.request('ok', 2) == (True, 'OK')
+
+
+def test_request_times_out(pair):
+    a, b = pair(None, lambda cmd: concurrent.futures.Future())
+    assert a.request('never', 0.2) == (False, None)
+    assert a.connected
+
+
+def test_closed_peer(pair):
+    a, b = pair(None, _echo)
+    b.close()
+    assert _wait_for(lambda: not a.connected)
+    assert a.request('hi', 0.5) == (False, None)
+    assert not a.post('hi')
+
+
+def test_server_prefers_the_listening_channel():
+    server = channel.ChannelServer(_echo)
+    first = casc_channel.Channel(socket.create_connection((channel.HOST, server.port)), _echo)
+    second = casc_channel.Channel(socket.create_connection((channel.HOST, server.port)), None)
+    try:
+        assert _wait_for(lambda: len(server.channels) == 2)
+        assert server.channel is server.channels[1]
+
+        first.send_message({'type': channel.LISTENING, 'value': True})
+        assert _wait_for(lambda: server.channels[0].accepts_commands)
+        assert server.channel is server.channels[0]
+    finally:
+        first.close()
+        second.close()
+        server.close()
@@ -0,0 +1,69 @@
+import array
+
+import pytest
+
+from bridge_core import codec
+
+
+def test_json_is_the_default():
+    payload = codec.encode({'a': [1, 2.5, 'three', None]})
+    assert payload.startswith(b'{')
+    assert codec.decode(payload) == {'a': [1, 2.5, 'three', None]}
+
+
+def test_json_flattens_what_it_cant_keep():
+    data = {1: (1, 2), 'b': b'\x00\xff', 'c': array.array('d', [1.0, 2.0])}
+    assert codec.decode(codec.encode(data)) == {'1': [1, 2], 'b': '\x00\xff', 'c': [1.0, 2.0]}
+
+
+def test_binary_keeps_keys_bytes_and_arrays():
+    data = {1: True, 'b': b'\x00\xff', 'c': array.array('f', [1.0, 2.0]), 'd': [None, False, -7]}
+    result = codec.decode(codec.encode(data, codec.BINARY))
+    assert result == data
+    assert isinstance(result['c'], array.array)
+
+
+def test_binary_float_block():
+    short = [0.5] * (codec.FLOAT_BLOCK_SIZE - 1)
+    block = [i * 0.25 for i in range(codec.FLOAT_BLOCK_SIZE)]
+    assert codec.decode(codec.encode(short, codec.BINARY)) == short
+    assert codec.decode(codec.encode(block, codec.BINARY)) == block
+    #one raw block is a header plus 8 bytes a float
+    assert len(codec.encode(block, codec.BINARY)) < len(codec.encode(short, codec.BINARY)) + 8 * 4
+
+
+@pytest.mark.parametrize('name', [codec.JSON, codec.BINARY])
+def test_zlib_above_the_threshold(name):
+    data = {'weights': [0.125] * 1000}
+    small = codec.encode(data, name, codec.ZLIB, threshold=len(codec.encode(data, name)) + 1)
+    packed = codec.encode(data, name, codec.ZLIB, threshold=0)
+
+    assert packed[0] & codec._TAG_ZLIB
+    assert small == codec.encode(data, name)
+    assert len(packed) < len(small)
+    assert codec.decode(packed) == codec.decode(small) == data
+
+
+def test_decode_errors():
+    with pytest.raises(codec.CodecError):
+        codec.decode(b'')
+    with pytest.raises(codec.CodecError):
+        codec.decode(bytes((codec._TAG_BINARY,)) + b'?')
+    with pytest.raises(TypeError):
+        codec.encode(object(), codec.BINARY)
+
+
+def test_negotiate():
+    assert codec.negotiate({}).name == codec.JSON
+    assert codec.negotiate({}).compression is None
+
+    agreed = codec.negotiate(codec.hello())
+    assert agreed.name == codec.BINARY
+    assert agreed.compression == codec.COMPRESSION[0]
+
+
+def test_frame():
+    payload = codec.encode([1, 2, 3])
+    framed = codec.frame(payload)
+    assert framed[4:] == payload
+    assert int.from_bytes(framed[:4], 'big') == len(payload)
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+pytest.importorskip('wingcarrier.pigeons')
+
+from bridge_casc import maya_port
+
+
+@pytest.fixture
+def stand_in():
+    port = maya_port.CommandPortStandIn()
+    yield port
+    maya_port.close_all()
+    port.close()
+
+
+def _wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+
+    return condition()
+
+
+def test_commands_share_one_connection(stand_in):
+    for i in range(5):
+        assert maya_port.send(stand_in.port, f"value = {i}")
+
+    assert _wait_for(lambda: stand_in.namespace.get('value') == 4)
+    assert stand_in.connections == 1
+    assert maya_port.is_open(stand_in.port)
+    assert stand_in.connections == 1
+
+
+def test_reconnects_after_maya_drops_the_port(stand_in):
+    assert maya_port.send(stand_in.port, "first = True")
+    assert _wait_for(lambda: 'first' in stand_in.namespace)
+
+    stand_in.drop_connections()
+    assert _wait_for(lambda: maya_port.send(stand_in.port, "second = True")
+                     and 'second' in stand_in.namespace)
+    assert stand_in.connections == 2
+
+
+def test_idle_sockets_are_replaced(stand_in, monkeypatch):
+    assert maya_port.send(stand_in.port, "first = True")
+    monkeypatch.setattr(maya_port, 'IDLE_SECONDS', 0.0)
+    assert maya_port.send(stand_in.port, "second = True")
+    assert _wait_for(lambda: 'second' in stand_in.namespace)
+    assert stand_in.connections == 2
+
+
+def test_closed_port():
+    stand_in = maya_port.CommandPortStandIn()
+    port = stand_in.port
+    stand_in.close()
+    try:
+        assert not maya_port.is_open(port)
+        assert not maya_port.send(port, "print('nobody')")
+    finally:
+        maya_port.close_all()
+
+
+def test_pigeon_uses_the_session(stand_in):
+    pigeon = maya_port.MayaPigeon()
+    pigeon.command_port = stand_in.port
+    assert pigeon.can_dispatch()
+    assert pigeon.send_python_command("sent = 'pigeon'")
+    assert _wait_for(lambda: stand_in.namespace.get('sent') == 'pigeon')
+    assert stand_in.connections == 1
+
+
+def test_handler_and_commands(stand_in):
+    stand_in.handler = lambda command: command.strip().upper()
+    assert maya_port.send(stand_in.port, "hello")
+    assert _wait_for(lambda: stand_in.commands)
+    assert stand_in.commands[0].strip() == 'hello'
@@ -0,0 +1,15 @@
+"""Maya and Cascadeur each load their own copy of these modules, and both
+copies have to stay the same file"""
+
+import pytest
+
+from conftest import CORE, CASC_SITE
+
+
+SHARED = ['codec.py', 'transfer.py', 'progress.py', 'trace.py']
+
+
+@pytest.mark.parametrize('name', SHARED)
+def test_copies_match(name):
+    assert CORE.joinpath(name).read_bytes() == CASC_SITE.joinpath(name).read_bytes(), \
+        f"core/{name} and casc-site/cg3dmaya/{name} have drifted apart"
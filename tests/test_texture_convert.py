@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip('PIL')
+
+from PIL import Image
+
+from bridge_core import texture_convert
+
+
+@pytest.fixture
+def textures(tmp_path):
+    paths = []
+    for i, (mode, ext) in enumerate([('RGB', '.tga'), ('CMYK', '.tif'), ('RGB', '.bmp')]):
+        path = tmp_path.joinpath(f'texture{i}{ext}')
+        Image.new(mode, (8, 8)).save(path)
+        paths.append(str(path))
+
+    return paths
+
+
+def _convert(tmp_path, sources, **kwargs):
+    calls = []
+    kwargs.setdefault('progress', lambda done, total, source: calls.append((done, total)))
+    kwargs.setdefault('workers', 2)
+    results = texture_convert.convert(sources, texture_convert.PILLOW,
+                                      cache_path=tmp_path.joinpath('cache.json'), **kwargs)
+    return results, calls
+
+
+def test_converts_next_to_the_source(tmp_path, textures):
+    results, calls = _convert(tmp_path, textures + [str(tmp_path.joinpath('ready.png'))])
+
+    assert sorted(results) == sorted(textures)
+    for source, output in results.items():
+        assert output == str(texture_convert.target_path(source))
+        with Image.open(output) as image:
+            assert image.format == 'PNG'
+            assert image.mode in ('RGB', 'RGBA')
+
+    assert sorted(calls) == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_up_to_date_textures_are_skipped(tmp_path, textures):
+    _convert(tmp_path, textures)
+    results, calls = _convert(tmp_path, textures)
+    assert len(results) == 3
+    assert calls == []
+
+    Image.new('RGB', (4, 4)).save(textures[0])
+    results, calls = _convert(tmp_path, textures)
+    assert calls == [(1, 1)]
+
+    results, calls = _convert(tmp_path, textures, force=True)
+    assert len(calls) == 3
+
+
+def test_unreadable_texture(tmp_path, textures):
+    broken = tmp_path.joinpath('broken.tga')
+    broken.write_bytes(b'not an image')
+
+    results, calls = _convert(tmp_path, textures + [str(broken)])
+    assert results[str(broken)] is None
+    assert all(results[source] for source in textures)
+    assert str(texture_convert._cache_key(broken)) not in texture_convert.load_cache(tmp_path.joinpath('cache.json'))
+
+
+def test_progress_can_stop_the_conversion(tmp_path, textures):
+    def stop(done, total, source):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        _convert(tmp_path, textures, workers=1, progress=stop)
+
+    #the texture that finished first is still cached
+    assert len(texture_convert.load_cache(tmp_path.joinpath('cache.json'))) == 1
@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+from bridge_core import transfer
+
+
+@pytest.fixture
+def export_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, 'EXPORT_ROOT', tmp_path.joinpath('mayacasc'))
+    return transfer.EXPORT_ROOT
+
+
+def test_manifest_round_trip(export_root):
+    manifest = transfer.begin('maya')
+    fbx_path = manifest.folder.joinpath('Hero.abc.fbx')
+    fbx_path.write_bytes(b'fbx data')
+    manifest.add(fbx_path, transfer.FBX, 'abc', 'Hero', frame_range=[5, 10])
+    manifest.save()
+
+    transfer.set_manifest(str(manifest.path))
+    loaded = transfer.take_manifest()
+    assert transfer.take_manifest() is None
+
+    assert loaded.folder == manifest.folder
+    assert loaded.transaction_id == manifest.transaction_id
+    assert loaded.set_files() == {('Hero', 'abc'): {transfer.FBX: str(fbx_path)}}
+    assert loaded.artifacts[0]['hash'] == transfer.file_hash(fbx_path)
+    assert loaded.frame_range('abc') == (5, 10)
+    assert not loaded.is_unchanged('abc')
+
+
+def test_transactions_are_pruned(export_root):
+    folders = []
+    for i in range(transfer.KEEP_TRANSACTIONS + 2):
+        folders.append(transfer.begin().folder)
+        #mtime decides which folders are the oldest
+        os.utime(folders[-1], (time.time() + i, time.time() + i))
+
+    kept = sorted(child for child in export_root.iterdir() if child.is_dir())
+    assert kept == sorted(folders[-transfer.KEEP_TRANSACTIONS:])
+
+
+def test_shared_folder_is_cleaned(export_root):
+    export_root.mkdir()
+    export_root.joinpath('old.abc.fbx').write_text('old')
+    manifest = transfer.begin(per_transaction=False)
+    assert manifest.folder == export_root
+    assert list(export_root.iterdir()) == []
+
+
+def test_scan_the_latest_folder(export_root):
+    export_root.mkdir()
+    export_root.joinpath('Old.1.fbx').write_text('')
+    transaction = export_root.joinpath('t1')
+    transaction.mkdir()
+    for name in ['Hero.abc.fbx', 'Hero.abc.qrigcasc', 'texture_info.json']:
+        transaction.joinpath(name).write_text('')
+
+    later = time.time() + 10
+    os.utime(transaction, (later, later))
+
+    assert transfer.latest_folder(export_root) == transaction
+    assert transfer.scan_folder(transaction) == {
+        ('Hero', 'abc'): {'fbx': str(transaction.joinpath('Hero.abc.fbx')),
+                          'qrigcasc': str(transaction.joinpath('Hero.abc.qrigcasc'))},
+    }
+    assert transfer.scan_folder(export_root.joinpath('missing')) == {}